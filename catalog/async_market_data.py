@@ -0,0 +1,69 @@
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from .option_price_computation import (
+    _get_encoded_option_chain,
+    _get_option_days,
+    get_earnings,
+    prefetch_recent_closes,
+)
+
+# The pages that need market data fetch all of it at once before their view runs: closes and
+# earnings together, then every expiry's chain together once the expiry list is in. yfinance
+# only has a blocking client, so every fetch gets its own thread, and they fill the same caches
+# the views read. The view then renders without waiting on yahoo, after about two round trips
+# instead of one per call. Under ASGI the worker serves other requests in the meantime.
+
+
+async def run_in_thread(function, *args):
+    # runs outside of the request's thread, so clean up the thread's database connection ourselves
+    def run():
+        close_old_connections()
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+    return await sync_to_async(run, thread_sensitive=False)()
+
+
+async def _gather_option_chains(stockticker_name, maximum_option_days):
+    option_days = await run_in_thread(_get_option_days, stockticker_name, maximum_option_days)
+    await asyncio.gather(
+        *(run_in_thread(_get_encoded_option_chain, stockticker_name, option_day) for option_day in option_days or ()),
+        return_exceptions=True,
+    )
+
+
+async def gather_market_data(stockticker_names, earnings=False, maximum_option_days=0):
+    """Fetches the closes, and optionally earnings and option chains, for every ticker concurrently"""
+    stockticker_names = list(stockticker_names)
+    if not stockticker_names:
+        return
+    fetches = [run_in_thread(prefetch_recent_closes, stockticker_names)]
+    if earnings:
+        fetches += [run_in_thread(get_earnings, name) for name in stockticker_names]
+    if maximum_option_days:
+        fetches += [_gather_option_chains(name, maximum_option_days) for name in stockticker_names]
+    # a failed fetch is left for the view, which handles it like it always has
+    await asyncio.gather(*fetches, return_exceptions=True)
+
+
+def prefetch_market_data(get_stockticker_names, earnings=False, maximum_option_days=0):
+    """
+    Turns a sync view into an async one that gathers its market data first. get_stockticker_names
+    gets the request and the view's url kwargs, and returns the tickers the page needs.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def async_view(request, *args, **kwargs):
+            # forms posting back don't show any market data
+            if request.method == 'GET':
+                def get_names():
+                    return list(get_stockticker_names(request, **kwargs))
+                await gather_market_data(await sync_to_async(get_names)(), earnings, maximum_option_days)
+            return await sync_to_async(view)(request, *args, **kwargs)
+        return async_view
+    return decorator
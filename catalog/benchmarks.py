@@ -0,0 +1,260 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import timeit
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from uuid import uuid4
+
+import mibian
+import numpy
+import pandas
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .business_day_count import busday_count_inclusive
+from .implied_volatility import compute_implied_volatility_and_delta
+from .market_data_providers import (
+    ReplayProvider,
+    get_market_data_provider,
+    record_market_data,
+    set_market_data_provider,
+)
+from .models import DailyClose, OptionChainSnapshot, OptionWheel, StockTicker
+from .option_price_computation import (
+    INTEREST_RATE,
+    _compute_odds_for_chain,
+    _get_effective_prices,
+    compute_call_stat,
+    compute_put_stat,
+    get_market_data_cache_keys,
+    get_put_stats_for_ticker,
+)
+from .tiered_cache import cache
+from .views import _setup_context_for_total_profit
+
+# Benchmarks for the option pricing and stats hot paths, run with `manage.py run_benchmarks`.
+# Every result is the time of one call in seconds, the median and min over `repeat` runs.
+
+BENCHMARK_WHEEL_COUNTS = (10, 1000, 100000)
+BENCHMARK_REPEAT = 5
+# Results more than this much slower than the compared run are reported as regressions
+BENCHMARK_REGRESSION_RATIO = 1.2
+
+SYNTHETIC_TICKERS = ('SYNA', 'SYNB', 'SYNC')
+SYNTHETIC_OPTION_DAYS = 10
+# Stays under sqlite's limit on query parameters
+BENCHMARK_DELETE_BATCH_SIZE = 900
+
+
+def _time(function, repeat, number=None, setup='pass'):
+    timer = timeit.Timer(function, setup=setup)
+    if number is None:
+        # like the timeit command line, quick functions are timed over enough calls to take 0.2s
+        number, _ = timer.autorange()
+    runs = [seconds / number for seconds in timer.repeat(repeat=repeat, number=number)]
+    return {'median': statistics.median(runs), 'min': min(runs), 'number': number, 'repeat': repeat}
+
+
+# Stands in for yahoo when there's no recording to replay: black-scholes prices around a
+# fixed price, with enough volume to make it through the candidate filters
+class _SyntheticProvider:
+    def __init__(self, seed=0):
+        self.random = numpy.random.default_rng(seed)
+
+    def get_option_days(self, stockticker_name):
+        option_day = date.today() + timedelta(days=(4 - date.today().weekday()) % 7 or 7)
+        return tuple((option_day + timedelta(weeks=week)).isoformat() for week in range(SYNTHETIC_OPTION_DAYS))
+
+    def _get_chain(self, current_price, days_to_expiry, is_call):
+        rows = []
+        for strike in numpy.arange(round(current_price * 0.6), round(current_price * 1.4)):
+            volatility = 40 + 20 * abs(strike / current_price - 1)
+            prices = mibian.BS([current_price, strike, INTEREST_RATE, days_to_expiry], volatility=volatility)
+            price = round(max(prices.callPrice if is_call else prices.putPrice, 0.01), 2)
+            rows.append({
+                'strike': float(strike),
+                'lastPrice': price,
+                'bid': round(price * 0.97, 2),
+                'ask': round(price * 1.03 + 0.01, 2),
+                'volume': float(self.random.integers(20, 2000)),
+                'impliedVolatility': volatility / 100,
+            })
+        return pandas.DataFrame(rows)
+
+    def get_option_chain(self, stockticker_name, option_day):
+        days_to_expiry = busday_count_inclusive(date.today(), date.fromisoformat(option_day))
+        return self._get_chain(100.0, days_to_expiry, True), self._get_chain(100.0, days_to_expiry, False)
+
+    def get_closes(self, stockticker_name, period=None, start=None):
+        closes_dates = pandas.bdate_range(end=date.today(), periods=10)
+        return pandas.Series(numpy.linspace(95.0, 100.0, 10), index=closes_dates, name='Close')
+
+    def get_earnings_date(self, stockticker_name):
+        return None
+
+
+# The cache and database may be shared with a live site, so the benchmarks only clean up what they
+# created: the benchmark tickers' cache entries and the rows stored since the benchmark started
+def _clear_market_data(option_days_by_name, started):
+    for stockticker_name, option_days in option_days_by_name.items():
+        for cache_key in get_market_data_cache_keys(stockticker_name, option_days):
+            cache.delete(cache_key)
+    DailyClose.objects.filter(stock_ticker__name__in=option_days_by_name, fetched__gte=started).delete()
+    OptionChainSnapshot.objects.filter(stock_ticker__name__in=option_days_by_name, fetched__gte=started).delete()
+
+
+def _delete_in_batches(model, pks):
+    for start in range(0, len(pks), BENCHMARK_DELETE_BATCH_SIZE):
+        model.objects.filter(pk__in=pks[start:start + BENCHMARK_DELETE_BATCH_SIZE]).delete()
+
+
+def _benchmark_pricing(repeat):
+    results = {}
+    option_day = _SyntheticProvider().get_option_days('SYNA')[1]
+    days_to_expiry = busday_count_inclusive(date.today(), date.fromisoformat(option_day))
+    calls, puts = _SyntheticProvider().get_option_chain('SYNA', option_day)
+    put = puts[puts['strike'] == 95.0].iloc[0]
+    call = calls[calls['strike'] == 105.0].iloc[0]
+    # a whole expiry, the way the stats tables price it
+    strikes = puts['strike'].to_numpy(dtype=float)
+    put_prices = _get_effective_prices(puts)
+    results['compute_implied_volatility_and_delta'] = _time(
+        lambda: compute_implied_volatility_and_delta(100.0, strikes, INTEREST_RATE, days_to_expiry, put_prices, False),
+        repeat,
+    )
+    results['_compute_odds_for_chain'] = _time(
+        lambda: _compute_odds_for_chain(100.0, puts, days_to_expiry, is_call=False), repeat
+    )
+    results['compute_put_stat'] = _time(lambda: compute_put_stat(100.0, put, 10, '2021-01-15'), repeat)
+    results['compute_call_stat'] = _time(
+        lambda: compute_call_stat(100.0, call, 10, '2021-01-15', 5, Decimal('1.5'), Decimal('95')),
+        repeat,
+    )
+    results['busday_count_inclusive'] = _time(lambda: busday_count_inclusive(date(2021, 1, 4), date(2021, 3, 19)), repeat)
+    return results
+
+
+def _benchmark_put_stats(repeat, recordings_directory, latency_seconds):
+    results = {}
+    previous_provider = get_market_data_provider()
+    started = timezone.now()
+    with tempfile.TemporaryDirectory() as synthetic_directory:
+        if not recordings_directory or not os.path.isdir(recordings_directory) or not os.listdir(recordings_directory):
+            recordings_directory = synthetic_directory
+            record_market_data(_SyntheticProvider(), SYNTHETIC_TICKERS, synthetic_directory, SYNTHETIC_OPTION_DAYS)
+        stockticker_names = sorted(os.listdir(recordings_directory))
+        option_days_by_name = {
+            name: ReplayProvider(recordings_directory).get_option_days(name) for name in stockticker_names
+        }
+        tickers = []
+        created_ticker_pks = []
+        set_market_data_provider(ReplayProvider(recordings_directory, latency_seconds=latency_seconds))
+        try:
+            for name in stockticker_names:
+                ticker, created = StockTicker.objects.get_or_create(name=name)
+                tickers.append(ticker)
+                if created:
+                    created_ticker_pks.append(ticker.pk)
+            def get_all_put_stats():
+                for ticker in tickers:
+                    get_put_stats_for_ticker(ticker)
+            # cold goes through the replay provider and the database store, warm is served from cache
+            results['get_put_stats_for_ticker_cold'] = _time(
+                get_all_put_stats, repeat, number=1, setup=lambda: _clear_market_data(option_days_by_name, started)
+            )
+            results['get_put_stats_for_ticker_warm'] = _time(get_all_put_stats, repeat, number=1)
+        finally:
+            set_market_data_provider(previous_provider)
+            _clear_market_data(option_days_by_name, started)
+            _delete_in_batches(StockTicker, created_ticker_pks)
+    for result in results.values():
+        result['tickers'] = len(stockticker_names)
+    return results
+
+
+def _benchmark_total_profit(repeat, wheel_counts):
+    results = {}
+    # a user of its own, so only the wheels created here are deleted afterwards
+    user = User.objects.create_user(username=f'benchmark-{uuid4().hex}')
+    stock_ticker, created_ticker = StockTicker.objects.get_or_create(name='SYNA')
+    random = numpy.random.default_rng(0)
+    try:
+        for wheel_count in wheel_counts:
+            open_dates = pandas.Timestamp(2020, 1, 1) + pandas.to_timedelta(random.integers(0, 365, wheel_count), unit='D')
+            wheels = [
+                OptionWheel(
+                    user=user,
+                    stock_ticker=stock_ticker,
+                    is_active=False,
+                    quantity=int(random.integers(1, 4)),
+                    total_profit=Decimal(int(random.integers(-500, 1000))) / 100,
+                    collatoral=Decimal(int(random.integers(1000, 50000))) / 100,
+                    total_days_active=int(days_active),
+                    open_date=open_date.date(),
+                    expiration_date=(open_date + timedelta(days=int(days_active))).date(),
+                )
+                for open_date, days_active in zip(open_dates, random.integers(1, 60, wheel_count))
+            ]
+            OptionWheel.objects.bulk_create(wheels, batch_size=5000)
+            wheels_queryset = OptionWheel.objects.filter(user=user, is_active=False)
+            wheel_pks = list(wheels_queryset.values_list('pk', flat=True))
+            try:
+                results[f'_setup_context_for_total_profit_{wheel_count}'] = _time(
+                    lambda: _setup_context_for_total_profit(wheels_queryset, {}), repeat, number=1
+                )
+            finally:
+                _delete_in_batches(OptionWheel, wheel_pks)
+    finally:
+        user.delete()
+        if created_ticker:
+            stock_ticker.delete()
+    return results
+
+
+def run_benchmarks(repeat=BENCHMARK_REPEAT, wheel_counts=BENCHMARK_WHEEL_COUNTS, recordings_directory=None, latency_seconds=0):
+    results = {}
+    results.update(_benchmark_pricing(repeat))
+    results.update(_benchmark_put_stats(repeat, recordings_directory, latency_seconds))
+    results.update(_benchmark_total_profit(repeat, wheel_counts))
+    return {
+        'commit': _get_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'results': results,
+    }
+
+
+def _get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save_benchmark_results(benchmark_results, directory):
+    os.makedirs(directory, exist_ok=True)
+    created = benchmark_results['created'].replace(':', '')
+    path = os.path.join(directory, f"{created}-{benchmark_results['commit']}.json")
+    with open(path, 'w') as results_file:
+        json.dump(benchmark_results, results_file, indent=2)
+    return path
+
+
+# [(name, previous median, current median, ratio, is regression)] for benchmarks in both runs
+def compare_benchmark_results(previous_results, benchmark_results, regression_ratio=BENCHMARK_REGRESSION_RATIO):
+    comparison = []
+    for name, result in benchmark_results['results'].items():
+        previous_result = previous_results['results'].get(name)
+        if previous_result is None:
+            continue
+        ratio = result['median'] / previous_result['median']
+        comparison.append((name, previous_result['median'], result['median'], ratio, ratio > regression_ratio))
+    return comparison
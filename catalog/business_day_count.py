@@ -1,8 +1,119 @@
+from datetime import date, timedelta
+
 import numpy
 
+# Stock open days follow the NYSE calendar: weekends and the holidays below are closed.
+# Holidays come from the exchange's rules for every year in the calendar range, plus the
+# one-off closures listed here.
+CALENDAR_START_YEAR = 2010
+CALENDAR_END_YEAR = 2040
+SPECIAL_CLOSURES = (
+  '2012-10-29', '2012-10-30', # Hurricane Sandy
+  '2018-12-05', # President Bush's funeral
+  '2025-01-09', # President Carter's funeral
+)
+
+def _nth_weekday(year, month, weekday, n):
+  first_day = date(year, month, 1)
+  return first_day + timedelta(days=(weekday - first_day.weekday()) % 7 + 7 * (n - 1))
+
+def _last_weekday(year, month, weekday):
+  next_month = date(year + month // 12, month % 12 + 1, 1)
+  last_day = next_month - timedelta(days=1)
+  return last_day - timedelta(days=(last_day.weekday() - weekday) % 7)
+
+def _easter(year):
+  # anonymous gregorian algorithm
+  a = year % 19
+  b, c = divmod(year, 100)
+  d, e = divmod(b, 4)
+  f = (b + 8) // 25
+  g = (b - f + 1) // 3
+  h = (19 * a + b - d - g + 15) % 30
+  i, k = divmod(c, 4)
+  l = (32 + 2 * e + 2 * i - h - k) % 7
+  m = (a + 11 * h + 22 * l) // 451
+  month, day = divmod(h + l - 7 * m + 114, 31)
+  return date(year, month, day + 1)
+
+def _observed(holiday):
+  # Saturday holidays are observed on Friday, Sunday holidays on Monday
+  if holiday.weekday() == 5:
+    return holiday - timedelta(days=1)
+  if holiday.weekday() == 6:
+    return holiday + timedelta(days=1)
+  return holiday
+
+def get_nyse_holidays(year):
+  holidays = [
+    _nth_weekday(year, 1, 0, 3), # Martin Luther King Jr. Day
+    _nth_weekday(year, 2, 0, 3), # Washington's Birthday
+    _easter(year) - timedelta(days=2), # Good Friday
+    _last_weekday(year, 5, 0), # Memorial Day
+    _observed(date(year, 7, 4)), # Independence Day
+    _nth_weekday(year, 9, 0, 1), # Labor Day
+    _nth_weekday(year, 11, 3, 4), # Thanksgiving
+    _observed(date(year, 12, 25)), # Christmas
+  ]
+  # the exchange doesn't close on Dec 31 when New Year's Day is a Saturday
+  if date(year, 1, 1).weekday() != 5:
+    holidays.append(_observed(date(year, 1, 1)))
+  if year >= 2022:
+    holidays.append(_observed(date(year, 6, 19))) # Juneteenth
+  return sorted(holidays)
+
+NYSE_HOLIDAYS = numpy.array(
+  sorted(
+    [holiday for year in range(CALENDAR_START_YEAR, CALENDAR_END_YEAR + 1) for holiday in get_nyse_holidays(year)]
+    + [date.fromisoformat(closure) for closure in SPECIAL_CLOSURES]
+  ),
+  dtype='datetime64[D]',
+)
+BUSINESS_DAY_CALENDAR = numpy.busdaycalendar(holidays=NYSE_HOLIDAYS)
+
+# _business_days_before[i] is the number of open days from the start of the calendar up to,
+# but not including, the i-th day. Counting open days between two dates is then a subtraction.
+_CALENDAR_START = date(CALENDAR_START_YEAR, 1, 1)
+_CALENDAR_START_ORDINAL = _CALENDAR_START.toordinal()
+_calendar_days = numpy.arange(
+  numpy.datetime64(_CALENDAR_START), numpy.datetime64(date(CALENDAR_END_YEAR + 1, 1, 1)), dtype='datetime64[D]'
+)
+_business_days_before = numpy.concatenate(
+  ([0], numpy.cumsum(numpy.is_busday(_calendar_days, busdaycal=BUSINESS_DAY_CALENDAR)))
+)
+
+def is_business_day(day):
+  index = day.toordinal() - _CALENDAR_START_ORDINAL
+  if 0 <= index < len(_calendar_days):
+    return bool(_business_days_before[index + 1] - _business_days_before[index])
+  return bool(numpy.is_busday(day, busdaycal=BUSINESS_DAY_CALENDAR))
+
 # Counts stock open days between the two dates, assuming both
 # end days are included
 def busday_count_inclusive(start_date, end_date):
   if (start_date == end_date):
-  	return 1
-  return numpy.busday_count(start_date, end_date) + 1
\ No newline at end of file
+    return 1
+  start_index = start_date.toordinal() - _CALENDAR_START_ORDINAL
+  end_index = end_date.toordinal() - _CALENDAR_START_ORDINAL
+  if 0 <= start_index <= end_index < len(_business_days_before):
+    return int(_business_days_before[end_index] - _business_days_before[start_index]) + 1
+  return int(numpy.busday_count(start_date, end_date, busdaycal=BUSINESS_DAY_CALENDAR)) + 1
+
+# busday_count_inclusive for arrays of dates
+def busday_count_inclusive_array(start_dates, end_dates):
+  start_dates = numpy.asarray(start_dates, dtype='datetime64[D]')
+  end_dates = numpy.asarray(end_dates, dtype='datetime64[D]')
+  start_indices = (start_dates - numpy.datetime64(_CALENDAR_START)).astype(int)
+  end_indices = (end_dates - numpy.datetime64(_CALENDAR_START)).astype(int)
+  in_calendar = (start_indices >= 0) & (start_indices <= end_indices) & (end_indices < len(_business_days_before))
+  counts = numpy.where(
+    in_calendar,
+    _business_days_before[numpy.where(in_calendar, end_indices, 0)]
+      - _business_days_before[numpy.where(in_calendar, start_indices, 0)],
+    0,
+  )
+  if not in_calendar.all():
+    counts[~in_calendar] = numpy.busday_count(
+      start_dates[~in_calendar], end_dates[~in_calendar], busdaycal=BUSINESS_DAY_CALENDAR
+    )
+  return numpy.where(start_dates == end_dates, 1, counts + 1)
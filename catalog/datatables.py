@@ -0,0 +1,132 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import F, Q
+from django.http import JsonResponse
+
+# Server-side processing for the DataTables tables (https://datatables.net/manual/server-side).
+# Every draw sends the page, ordering and search box, and gets back only the rows on that page,
+# so rendering a table costs the same no matter how much history is behind it.
+
+DATATABLES_DEFAULT_PAGE_LENGTH = 25
+DATATABLES_MAX_PAGE_LENGTH = 100
+
+
+def _get_int(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class DataTablesRequest:
+    def __init__(self, params):
+        self.draw = _get_int(params, 'draw', 0)
+        self.start = max(_get_int(params, 'start', 0), 0)
+        # DataTables asks for -1 when the table shows everything, which we don't allow
+        self.length = _get_int(params, 'length', DATATABLES_DEFAULT_PAGE_LENGTH)
+        if not 0 < self.length <= DATATABLES_MAX_PAGE_LENGTH:
+            self.length = DATATABLES_MAX_PAGE_LENGTH
+        self.search = params.get('search[value]', '').strip()
+        self.order_column = None
+        order_index = params.get('order[0][column]')
+        if order_index is not None:
+            self.order_column = params.get(f'columns[{order_index}][data]')
+        self.order_descending = params.get('order[0][dir]') == 'desc'
+        self.cursor = params.get('cursor')
+
+    def get_order(self, orderable_columns, default_column, default_descending=False):
+        """Returns (column, descending), falling back to the default for columns we can't order by"""
+        if self.order_column in orderable_columns:
+            return self.order_column, self.order_descending
+        return default_column, default_descending
+
+
+def _to_cursor_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _get_keyset_filter(field, descending, value, pk):
+    # Rows after (value, pk) in the table's order. Nulls always sort last.
+    after = '__lt' if descending else '__gt'
+    pk_after = Q(**{'pk' + after: pk})
+    if value is None:
+        return Q(**{field + '__isnull': True}) & pk_after
+    return (
+        Q(**{field + after: value})
+        | (Q(**{field: value}) & pk_after)
+        | Q(**{field + '__isnull': True})
+    )
+
+
+def get_queryset_page(
+    queryset,
+    datatables_request,
+    order_fields,
+    default_column,
+    default_descending=False,
+    search_filter=None,
+    filter_queryset=None,
+):
+    """
+    Returns (rows, records_total, records_filtered, cursor) for the requested page. order_fields
+    maps the orderable column names to indexed model fields, which are paged with a keyset on
+    (field, pk). The keyset continues from the cursor returned with the previous page; jumping
+    to an arbitrary page number falls back to an offset. search_filter turns the search box into a Q,
+    and filter_queryset applies the table's other filters, both count towards records_filtered.
+    """
+    column, descending = datatables_request.get_order(order_fields, default_column, default_descending)
+    field = order_fields[column]
+    records_total = queryset.count()
+    is_filtered = filter_queryset is not None
+    if is_filtered:
+        queryset = filter_queryset(queryset)
+    if datatables_request.search and search_filter is not None:
+        queryset = queryset.filter(search_filter(datatables_request.search))
+        is_filtered = True
+    records_filtered = queryset.count() if is_filtered else records_total
+    order_value = F(field)
+    queryset = queryset \
+        .annotate(datatables_order_value=order_value) \
+        .order_by(
+            order_value.desc(nulls_last=True) if descending else order_value.asc(nulls_last=True),
+            '-pk' if descending else 'pk',
+        )
+
+    state = [column, descending, datatables_request.search, datatables_request.start]
+    cursor = None
+    if datatables_request.cursor:
+        try:
+            cursor = json.loads(datatables_request.cursor)
+        except ValueError:
+            pass
+    if isinstance(cursor, dict) and cursor.get('state') == state and 'value' in cursor and 'pk' in cursor:
+        rows = list(queryset.filter(_get_keyset_filter(field, descending, cursor['value'], cursor['pk']))[:datatables_request.length])
+    else:
+        rows = list(queryset[datatables_request.start:datatables_request.start + datatables_request.length])
+
+    next_cursor = None
+    if len(rows) == datatables_request.length:
+        last_row = rows[-1]
+        next_state = [column, descending, datatables_request.search, datatables_request.start + len(rows)]
+        next_cursor = json.dumps({
+            'state': next_state,
+            'value': _to_cursor_value(last_row.datatables_order_value),
+            'pk': last_row.pk,
+        })
+    return rows, records_total, records_filtered, next_cursor
+
+
+def datatables_response(datatables_request, data, records_total, records_filtered, cursor=None):
+    return JsonResponse({
+        'draw': datatables_request.draw,
+        'recordsTotal': records_total,
+        'recordsFiltered': records_filtered,
+        'data': data,
+        'cursor': cursor,
+    })
@@ -1,62 +1,79 @@
-from math import sqrt, exp, log, pi
+import numpy
 from scipy.stats import norm
 from scipy.special import ndtr
 
-# taken from https://github.com/kpmooney/numerical_methods_youtube/blob/master/root_finding/implied_volatility/find_vol_put.py
-
-# volatility moves by less than 1%
-TOLERANCE = 0.01
-# bail out after 20 iterations, either we find a good volatility or just give up here
-MAX_ITERATIONS = 20
-
-# S is current price, K is strike, r is interest rate, t is time
-# Function to calculate the values of d1 and d2
-def d(sigma, S, K, r, t):
-    d1 = 1 / (sigma * sqrt(t)) * ( log(S/K) + (r + sigma**2/2) * t)
-    d2 = d1 - sigma * sqrt(t)
-    return d1, d2
-
-def call_price(sigma, S, K, r, t, d1, d2):
-    C = ndtr(d1) * S - ndtr(d2) * K * exp(-r * t)
-    return C
-
-
-def put_price(sigma, S, K, r, t, d1, d2):
-    P = -ndtr(-d1) * S + ndtr(-d2) * K * exp(-r * t)
-    return P
-
-# only works for puts right now
-def compute_delta(current_price, strike, interest_rate, days_to_expiry, option_price, is_call):
-  # epsilon is how far off the guess is
-  epsilon = 1
-  # initial guess is 0.5
-  volatility = 0.50
-  t = days_to_expiry / 365.0
-  # This calculator assumes the interest rate is a percent
-  interest_rate = interest_rate / 100.0
-
-  for _ in range(MAX_ITERATIONS):
-    #  Log the value previously calculated to computer percent change
-    #  between iterations
-    orig_volatility = volatility
-
-    #  Calculate the value of the call price
-    d1, d2 = d(volatility, current_price, strike, interest_rate, t)
+from .metrics import metrics
+
+# The solver searches the same 0% to 500% volatility range that mibian bisects over
+MINIMUM_VOLATILITY = 0.00001
+MAXIMUM_VOLATILITY = 5.0
+# a solved volatility must reproduce the option price to within a tenth of a cent
+PRICE_TOLERANCE = 0.001
+# newton usually converges in a handful of steps, bisection fallbacks need more
+VECTORIZED_MAX_ITERATIONS = 60
+
+# Black-Scholes for a whole option chain (one expiry) at once, based on
+# https://github.com/kpmooney/numerical_methods_youtube/blob/master/root_finding/implied_volatility/find_vol_put.py
+# S is current price, K is strike, r is interest rate, t is time.
+# strikes and option_prices are arrays, everything else is a scalar.
+def _vectorized_d1(volatility, S, K, r, t):
+    return (numpy.log(S / K) + (r + volatility ** 2 / 2) * t) / (volatility * numpy.sqrt(t))
+
+def _vectorized_price(volatility, S, K, r, t, is_call):
+    d1 = _vectorized_d1(volatility, S, K, r, t)
+    d2 = d1 - volatility * numpy.sqrt(t)
     if is_call:
-      value = call_price(volatility, current_price, strike, interest_rate, t, d1, d2) - option_price
+        price = ndtr(d1) * S - ndtr(d2) * K * numpy.exp(-r * t)
     else:
-      value = put_price(volatility, current_price, strike, interest_rate, t, d1, d2) - option_price
+        price = -ndtr(-d1) * S + ndtr(-d2) * K * numpy.exp(-r * t)
+    return price, d1
+
+def compute_implied_volatility_and_delta(current_price, strikes, interest_rate, days_to_expiry, option_prices, is_call):
+    """
+    Solves the implied volatility and delta of every option in a chain with a newton/bisection hybrid.
+    Newton converges quickly near the money, and whenever its step leaves the bracket known to
+    contain the root we bisect instead, so deep OTM options (where vega is ~0) still converge.
+    Returns (implied_volatility, delta) arrays, with NaN for options that don't converge,
+    e.g. prices below intrinsic value that no volatility can explain, or options expiring today.
+    """
+    strikes = numpy.asarray(strikes, dtype=float)
+    option_prices = numpy.asarray(option_prices, dtype=float)
+    if days_to_expiry <= 0:
+        # there's no time value left to explain, so there's no volatility to solve for
+        return numpy.full(strikes.shape, numpy.nan), numpy.full(strikes.shape, numpy.nan)
+    t = days_to_expiry / 365.0
+    # This calculator assumes the interest rate is a percent
+    interest_rate = interest_rate / 100.0
 
-    #  Calculate vega, the derivative of the price with respect to
-    #  volatility
-    vega = current_price * norm._pdf(d1) * sqrt(t)
+    valid = (strikes > 0) & (option_prices > 0) & numpy.isfinite(option_prices)
+    low = numpy.full(strikes.shape, MINIMUM_VOLATILITY)
+    high = numpy.full(strikes.shape, MAXIMUM_VOLATILITY)
+    volatility = numpy.full(strikes.shape, 0.5)
+    # invalid rows are priced with a dummy strike so they don't spam divide by zero warnings
+    safe_strikes = numpy.where(valid, strikes, current_price)
 
-    #  Update for value of the volatility
-    volatility += -value / vega
+    for iteration in range(VECTORIZED_MAX_ITERATIONS):
+        price, d1 = _vectorized_price(volatility, current_price, safe_strikes, interest_rate, t, is_call)
+        difference = price - option_prices
+        converged = ~valid | (numpy.abs(difference) < PRICE_TOLERANCE)
+        if converged.all():
+            break
+        # price increases with volatility, so the sign of the error tells us which side the root is on
+        too_high = difference > 0
+        high = numpy.where(too_high, volatility, high)
+        low = numpy.where(too_high, low, volatility)
+        vega = current_price * norm._pdf(d1) * numpy.sqrt(t)
+        with numpy.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            newton_volatility = volatility - difference / vega
+        use_newton = numpy.isfinite(newton_volatility) & (newton_volatility > low) & (newton_volatility < high)
+        next_volatility = numpy.where(use_newton, newton_volatility, (low + high) / 2)
+        volatility = numpy.where(converged, volatility, next_volatility)
 
-    #  Check the percent change between current and last iteration
-    epsilon = abs( (volatility - orig_volatility) / orig_volatility )
-    if epsilon < TOLERANCE:
-      break
-  # http://janroman.dhis.org/stud/I2014/BS2/BS_Daniel.pdf, compute put delta
-  return -ndtr(-d1)
+    # one iteration prices the whole chain, so this counts chain passes
+    metrics.increment('implied_volatility_solves_total', int(valid.sum()), solver='vectorized')
+    metrics.increment('implied_volatility_iterations_total', iteration + 1, solver='vectorized')
+    price, d1 = _vectorized_price(volatility, current_price, safe_strikes, interest_rate, t, is_call)
+    converged = valid & (numpy.abs(price - option_prices) < PRICE_TOLERANCE)
+    # http://janroman.dhis.org/stud/I2014/BS2/BS_Daniel.pdf, call delta is N(d1) and put delta is -N(-d1)
+    delta = ndtr(d1) if is_call else -ndtr(-d1)
+    return numpy.where(converged, volatility, numpy.nan), numpy.where(converged, delta, numpy.nan)
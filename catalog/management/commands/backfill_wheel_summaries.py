@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import OptionWheel
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the purchase summary columns (cost basis, revenue, dates, ...) on every option wheel'
+
+    def handle(self, *args, **options):
+        count = 0
+        for wheel in OptionWheel.objects.iterator(chunk_size=500):
+            wheel.update_purchase_summary()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Updated {count} wheels'))
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalog.market_data_providers import YahooFinanceProvider, record_market_data
+from catalog.models import StockTicker
+
+
+class Command(BaseCommand):
+    help = 'Records option chains, closes and earnings from yahoo for the replay market data provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help='Tickers to record, all stock tickers by default')
+        parser.add_argument('--directory', default=settings.MARKET_DATA_REPLAY_DIRECTORY)
+        parser.add_argument('--days', type=int, default=10, help='Number of expiration dates to record')
+
+    def handle(self, *args, **options):
+        stockticker_names = options['tickers'] or list(StockTicker.objects.values_list('name', flat=True))
+        recorded = record_market_data(YahooFinanceProvider(), stockticker_names, options['directory'], options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Recorded {len(recorded)} tickers to {options["directory"]}'))
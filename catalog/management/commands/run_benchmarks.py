@@ -0,0 +1,63 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+from catalog.benchmarks import (
+    BENCHMARK_REGRESSION_RATIO,
+    BENCHMARK_REPEAT,
+    BENCHMARK_WHEEL_COUNTS,
+    compare_benchmark_results,
+    run_benchmarks,
+    save_benchmark_results,
+)
+
+
+class Command(BaseCommand):
+    help = 'Times the option pricing and stats hot paths, saves the results and compares them to an earlier run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=os.path.join(settings.BASE_DIR, 'benchmark_results'))
+        parser.add_argument('--compare', help='Results file from an earlier run to compare against')
+        parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT)
+        parser.add_argument('--wheel-counts', type=int, nargs='+', default=list(BENCHMARK_WHEEL_COUNTS))
+        parser.add_argument(
+            '--recordings',
+            default=settings.MARKET_DATA_REPLAY_DIRECTORY,
+            help='Recorded market data from record_market_data, synthetic chains are used if there is none',
+        )
+        parser.add_argument('--latency', type=float, default=0, help='Seconds added to every replayed market data call')
+
+    def handle(self, *args, **options):
+        if os.environ.get('DJANGO_APP_STAGE') == 'prod':
+            # the benchmarks clear the cache between runs
+            raise CommandError('Benchmarks can only run with the development settings')
+        # wheels and market data are created for the benchmarks, so they get their own database
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            benchmark_results = run_benchmarks(
+                repeat=options['repeat'],
+                wheel_counts=options['wheel_counts'],
+                recordings_directory=options['recordings'],
+                latency_seconds=options['latency'],
+            )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        for name, result in benchmark_results['results'].items():
+            self.stdout.write(f"{name:45} {result['median'] * 1000:12.3f} ms")
+        path = save_benchmark_results(benchmark_results, options['output'])
+        self.stdout.write(self.style.SUCCESS(f'Saved results to {path}'))
+
+        if options['compare']:
+            with open(options['compare']) as previous_results_file:
+                previous_results = json.load(previous_results_file)
+            self.stdout.write(f"\nCompared to {previous_results['commit']} ({previous_results['created']}):")
+            for name, previous_median, median, ratio, is_regression in compare_benchmark_results(previous_results, benchmark_results):
+                line = f'{name:45} {previous_median * 1000:12.3f} ms -> {median * 1000:12.3f} ms  {ratio:.2f}x'
+                if is_regression:
+                    self.stdout.write(self.style.ERROR(line + f'  slower than {BENCHMARK_REGRESSION_RATIO}x'))
+                else:
+                    self.stdout.write(line)
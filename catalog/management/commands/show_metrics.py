@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from catalog.metrics import metrics
+
+
+class Command(BaseCommand):
+    help = 'Prints the hot path metrics collected by every process, in the Prometheus text format'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Clear the metrics after printing them')
+
+    def handle(self, *args, **options):
+        self.stdout.write(metrics.render(), ending='')
+        if options['reset']:
+            metrics.reset()
@@ -0,0 +1,225 @@
+import json
+import math
+import os
+import time
+from datetime import date, timedelta
+from threading import BoundedSemaphore
+
+import pandas
+import yfinance
+from django.conf import settings
+
+from .option_chain_encoding import decode_option_chain, encode_option_chain
+from .tiered_cache import LocalLRUCache
+
+# Everything option_price_computation needs from the market goes through a provider:
+#   get_option_days(name) -> expiration dates as 'YYYY-MM-DD' strings
+#   get_option_chain(name, option_day) -> (calls, puts) DataFrames in yfinance's columns
+#   get_closes(name, period=None, start=None) -> Series of closes indexed by date
+#   download_closes(names, period=None, start=None) -> DataFrame of closes, a column per ticker
+#   get_earnings_date(name) -> the next earnings date as yahoo reports it, or None
+# Providers don't cache, that's done by option_price_computation and market_data_store.
+
+# Yahoo starts throttling if we have too many requests in flight at once, which can happen
+# now that the global put comparison fetches tickers in parallel.
+YAHOO_FINANCE_MAX_CONCURRENT_REQUESTS = 8
+YAHOO_FINANCE_TICKER_TIMEOUT = 5 * 60
+
+REPLAY_MANIFEST_FILE = 'manifest.json'
+
+
+def _history_range(period, start):
+    if start is not None:
+        return {'start': start}
+    return {'period': period or "10d"}
+
+
+class YahooFinanceProvider:
+    def __init__(self, max_concurrent_requests=YAHOO_FINANCE_MAX_CONCURRENT_REQUESTS):
+        self._request_slots = BoundedSemaphore(max_concurrent_requests)
+        # yfinance.Ticker objects remember what they already downloaded (like the expiry list, which
+        # option_chain needs too), so share them between requests for a few minutes.
+        self._tickers = LocalLRUCache(max_entries=500)
+
+    def _get_ticker(self, stockticker_name):
+        yahoo_ticker = self._tickers.get(stockticker_name)
+        if yahoo_ticker is None:
+            yahoo_ticker = yfinance.Ticker(stockticker_name)
+            self._tickers.set(stockticker_name, yahoo_ticker, YAHOO_FINANCE_TICKER_TIMEOUT)
+        return yahoo_ticker
+
+    def get_option_days(self, stockticker_name):
+        yahoo_ticker = self._get_ticker(stockticker_name)
+        with self._request_slots:
+            return yahoo_ticker.options
+
+    def get_option_chain(self, stockticker_name, option_day):
+        yahoo_ticker = self._get_ticker(stockticker_name)
+        with self._request_slots:
+            option_chain = yahoo_ticker.option_chain(option_day)
+        return option_chain.calls, option_chain.puts
+
+    def get_closes(self, stockticker_name, period=None, start=None):
+        yahoo_ticker = self._get_ticker(stockticker_name)
+        with self._request_slots:
+            history = yahoo_ticker.history(**_history_range(period, start))
+        if history.empty:
+            return pandas.Series(dtype=float)
+        return history['Close']
+
+    def download_closes(self, stockticker_names, period=None, start=None):
+        with self._request_slots:
+            history = yfinance.download(
+                stockticker_names, auto_adjust=True, progress=False, **_history_range(period, start)
+            )
+        if history is None or history.empty:
+            return pandas.DataFrame()
+        closes = history['Close']
+        if isinstance(closes, pandas.Series):
+            # older yfinance versions don't group the columns by ticker if there's only one
+            closes = closes.to_frame(stockticker_names[0])
+        return closes
+
+    def get_earnings_date(self, stockticker_name):
+        yahoo_ticker = self._get_ticker(stockticker_name)
+        with self._request_slots:
+            calendar = yahoo_ticker.calendar
+        if calendar is None or calendar.empty:
+            return None
+        if 'Value' in calendar:
+            return calendar['Value'].get('Earnings Date')
+        return calendar[0].get('Earnings Date')
+
+
+# Serves market data recorded by record_market_data, so the stats pipeline can be benchmarked
+# and load tested without the network. latency_seconds is added to every call to stand in for
+# yahoo's response time. Recorded dates are moved forward by whole weeks to the current week,
+# so expirations stay on the same weekday and the same distance from today as when recorded.
+class ReplayProvider:
+    def __init__(self, directory, latency_seconds=0, shift_dates=True):
+        self.directory = directory
+        self.latency_seconds = latency_seconds
+        self.shift_dates = shift_dates
+        self._manifests = {}
+
+    def _wait(self):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def _get_manifest(self, stockticker_name):
+        if stockticker_name not in self._manifests:
+            path = os.path.join(self.directory, stockticker_name, REPLAY_MANIFEST_FILE)
+            if os.path.exists(path):
+                with open(path) as manifest_file:
+                    self._manifests[stockticker_name] = json.load(manifest_file)
+            else:
+                self._manifests[stockticker_name] = None
+        return self._manifests[stockticker_name]
+
+    def _get_date_shift(self, manifest):
+        if not self.shift_dates:
+            return timedelta(0)
+        days_since_recorded = (date.today() - date.fromisoformat(manifest['recorded'])).days
+        return timedelta(days=7 * math.ceil(days_since_recorded / 7))
+
+    def get_option_days(self, stockticker_name):
+        self._wait()
+        manifest = self._get_manifest(stockticker_name)
+        if manifest is None:
+            return ()
+        date_shift = self._get_date_shift(manifest)
+        return tuple(
+            (date.fromisoformat(option_day) + date_shift).isoformat() for option_day in manifest['option_days']
+        )
+
+    def get_option_chain(self, stockticker_name, option_day):
+        self._wait()
+        manifest = self._get_manifest(stockticker_name)
+        if manifest is None:
+            raise ValueError(f'No recorded market data for {stockticker_name}')
+        recorded_option_day = (date.fromisoformat(option_day) - self._get_date_shift(manifest)).isoformat()
+        if recorded_option_day not in manifest['option_days']:
+            raise ValueError(f'No recorded option chain for {stockticker_name} {option_day}')
+        chain_path = os.path.join(self.directory, stockticker_name, recorded_option_day)
+        with open(chain_path + '.calls', 'rb') as calls_file, open(chain_path + '.puts', 'rb') as puts_file:
+            return decode_option_chain(calls_file.read()), decode_option_chain(puts_file.read())
+
+    def get_closes(self, stockticker_name, period=None, start=None):
+        self._wait()
+        manifest = self._get_manifest(stockticker_name)
+        if manifest is None:
+            return pandas.Series(dtype=float)
+        date_shift = self._get_date_shift(manifest)
+        closes = pandas.Series(
+            list(manifest['closes'].values()),
+            index=pandas.DatetimeIndex(
+                [date.fromisoformat(close_date) + date_shift for close_date in manifest['closes']], name='Date'
+            ),
+            name='Close',
+        )
+        if start is not None:
+            closes = closes[closes.index >= pandas.Timestamp(start)]
+        return closes
+
+    def download_closes(self, stockticker_names, period=None, start=None):
+        closes = {name: self.get_closes(name, period, start) for name in stockticker_names}
+        return pandas.DataFrame({name: ticker_closes for name, ticker_closes in closes.items() if not ticker_closes.empty})
+
+    def get_earnings_date(self, stockticker_name):
+        self._wait()
+        manifest = self._get_manifest(stockticker_name)
+        if manifest is None or manifest['earnings_date'] is None:
+            return None
+        return pandas.Timestamp(date.fromisoformat(manifest['earnings_date']) + self._get_date_shift(manifest))
+
+
+def record_market_data(provider, stockticker_names, directory, maximum_option_days=10):
+    """Saves what provider returns for each ticker in the format ReplayProvider reads"""
+    recorded = []
+    for stockticker_name in stockticker_names:
+        option_days = list(provider.get_option_days(stockticker_name) or ())[:maximum_option_days]
+        if not option_days:
+            continue
+        ticker_directory = os.path.join(directory, stockticker_name)
+        os.makedirs(ticker_directory, exist_ok=True)
+        for option_day in option_days:
+            calls, puts = provider.get_option_chain(stockticker_name, option_day)
+            chain_path = os.path.join(ticker_directory, option_day)
+            with open(chain_path + '.calls', 'wb') as calls_file, open(chain_path + '.puts', 'wb') as puts_file:
+                calls_file.write(encode_option_chain(calls))
+                puts_file.write(encode_option_chain(puts))
+        closes = provider.get_closes(stockticker_name, period="10d").dropna()
+        try:
+            earnings_date = provider.get_earnings_date(stockticker_name)
+        except Exception:
+            earnings_date = None
+        manifest = {
+            'recorded': date.today().isoformat(),
+            'option_days': option_days,
+            'closes': {timestamp.date().isoformat(): float(close) for timestamp, close in closes.items()},
+            'earnings_date': pandas.Timestamp(earnings_date).date().isoformat() if earnings_date else None,
+        }
+        with open(os.path.join(ticker_directory, REPLAY_MANIFEST_FILE), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        recorded.append(stockticker_name)
+    return recorded
+
+
+_market_data_provider = None
+
+def get_market_data_provider():
+    global _market_data_provider
+    if _market_data_provider is None:
+        if settings.MARKET_DATA_PROVIDER == 'replay':
+            _market_data_provider = ReplayProvider(
+                settings.MARKET_DATA_REPLAY_DIRECTORY,
+                latency_seconds=settings.MARKET_DATA_REPLAY_LATENCY_SECONDS,
+            )
+        else:
+            _market_data_provider = YahooFinanceProvider()
+    return _market_data_provider
+
+# For benchmarks and tests that replay recorded data regardless of the settings
+def set_market_data_provider(provider):
+    global _market_data_provider
+    _market_data_provider = provider
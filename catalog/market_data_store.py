@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+
+import pandas
+from django.utils import timezone
+
+# models imports option_price_computation, which imports this module, so the models are
+# looked up through the module when they're used
+from . import models
+
+# The store is append-only: every fetch adds rows, nothing is updated or deleted, so the
+# history can be analyzed later. The request path only needs recent rows, so its reads are
+# bounded by date.
+
+# Closes older than this aren't needed to find the last two, or to know where to resume fetching
+STORED_CLOSES_LOOKBACK_DAYS = 14
+# A snapshot older than this is stale even after a long weekend, so it's never served
+OPTION_CHAIN_SNAPSHOT_LOOKBACK_DAYS = 4
+
+
+def to_daily_closes(closes):
+    # yahoo's index may carry a time zone, the store only cares about the trading day
+    return pandas.Series(
+        closes.values,
+        index=pandas.DatetimeIndex([timestamp.date() for timestamp in closes.index], name='Date'),
+        name='Close',
+    )
+
+# {name: (closes, fetched)} for the tickers that have recent closes stored.
+# A day fetched more than once (before it closed) uses its latest fetch.
+def get_stored_closes(stockticker_names):
+    daily_closes = models.DailyClose.objects.filter(
+        stock_ticker__name__in=stockticker_names,
+        date__gte=date.today() - timedelta(days=STORED_CLOSES_LOOKBACK_DAYS),
+    ).order_by('date', 'fetched').values_list('stock_ticker__name', 'date', 'close', 'fetched')
+    latest_rows = {}
+    for name, close_date, close, fetched in daily_closes:
+        latest_rows[name, close_date] = (close_date, close, fetched)
+    rows_by_name = {}
+    for (name, _), row in latest_rows.items():
+        rows_by_name.setdefault(name, []).append(row)
+    stored_closes = {}
+    for name, rows in rows_by_name.items():
+        closes = pandas.Series(
+            [row[1] for row in rows],
+            index=pandas.DatetimeIndex([row[0] for row in rows], name='Date'),
+            name='Close',
+        )
+        stored_closes[name] = (closes, max(row[2] for row in rows))
+    return stored_closes
+
+# closes_by_name values come from to_daily_closes. The last day stored may have been fetched
+# before the close, so the overlap is stored again with the new fetch time rather than replaced.
+def save_closes(closes_by_name):
+    stock_ticker_ids = dict(
+        models.StockTicker.objects.filter(name__in=closes_by_name.keys()).values_list('name', 'id')
+    )
+    fetched = timezone.now()
+    daily_closes = []
+    for name, closes in closes_by_name.items():
+        if name not in stock_ticker_ids or closes.empty:
+            continue
+        daily_closes.extend(
+            models.DailyClose(stock_ticker_id=stock_ticker_ids[name], date=timestamp.date(), close=close, fetched=fetched)
+            for timestamp, close in closes.items()
+        )
+    # a ticker saved twice in the same fetch is the same close
+    models.DailyClose.objects.bulk_create(daily_closes, ignore_conflicts=True)
+
+def merge_closes(stored_closes, closes):
+    if stored_closes is None:
+        return closes
+    return pandas.concat([stored_closes[stored_closes.index < closes.index[0]], closes])
+
+def get_latest_option_chain_snapshot(stockticker_name, option_day):
+    return models.OptionChainSnapshot.objects.filter(
+        stock_ticker__name=stockticker_name,
+        expiration_date=option_day,
+        fetched__gte=timezone.now() - timedelta(days=OPTION_CHAIN_SNAPSHOT_LOOKBACK_DAYS),
+    ).order_by('fetched').last()
+
+def save_option_chain_snapshot(stockticker_name, option_day, calls, puts):
+    stock_ticker = models.StockTicker.objects.filter(name=stockticker_name).first()
+    if stock_ticker is None:
+        return
+    models.OptionChainSnapshot.objects.create(
+        stock_ticker=stock_ticker, expiration_date=option_day, fetched=timezone.now(), calls=calls, puts=puts
+    )
+
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .business_day_count import is_business_day
+
+# MARKET_OPEN_HOUR/MARKET_CLOSE_HOUR are in server local time, like the rest of the app uses them
+
+# Prices keep settling for a bit after the close, so data fetched right after it isn't kept overnight
+MARKET_CLOSE_SETTLE_SECONDS = 15 * 60
+
+def is_market_open(now=None):
+    now = now or datetime.now()
+    if not is_business_day(now.date()):
+        return False
+    return settings.MARKET_OPEN_HOUR <= now.hour < settings.MARKET_CLOSE_HOUR
+
+def get_next_market_open(now=None):
+    now = now or datetime.now()
+    next_open = now.replace(hour=settings.MARKET_OPEN_HOUR, minute=0, second=0, microsecond=0)
+    if next_open <= now:
+        next_open += timedelta(days=1)
+    while not is_business_day(next_open.date()):
+        next_open += timedelta(days=1)
+    return next_open
+
+def get_seconds_until_market_open(now=None):
+    now = now or datetime.now()
+    return int((get_next_market_open(now) - now).total_seconds())
+
+# Cache timeout for market data: the given timeout while trading, and until the next open otherwise,
+# since closes and option chains can't change while the market is closed.
+def get_market_data_timeout(market_hours_timeout, now=None):
+    now = now or datetime.now()
+    if is_market_open(now):
+        return market_hours_timeout
+    market_close = now.replace(hour=settings.MARKET_CLOSE_HOUR, minute=0, second=0, microsecond=0)
+    if is_business_day(now.date()) and 0 <= (now - market_close).total_seconds() < MARKET_CLOSE_SETTLE_SECONDS:
+        return market_hours_timeout
+    return max(market_hours_timeout, get_seconds_until_market_open(now))
+
+# Seconds left before data fetched at `fetched` should be refreshed, following get_market_data_timeout
+def get_remaining_market_data_timeout(fetched, market_hours_timeout, now=None):
+    now = now or datetime.now()
+    # fetched comes from the database in UTC, the market hours are in local time
+    fetched = timezone.localtime(fetched).replace(tzinfo=None)
+    expires = fetched + timedelta(seconds=get_market_data_timeout(market_hours_timeout, fetched))
+    return int((expires - now).total_seconds())
@@ -0,0 +1,152 @@
+import functools
+import time
+from collections import Counter
+from contextlib import contextmanager
+from threading import Lock
+
+# Counters and histograms for the hot paths, shown in the Prometheus text format by the
+# /metrics view and the show_metrics command. Each process adds up its samples in memory and
+# flushes them to a redis hash every METRICS_FLUSH_SECONDS, so the web dynos and the rq workers
+# end up in the same numbers.
+
+METRICS_REDIS_KEY = 'metrics'
+METRICS_FLUSH_SECONDS = 10
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# name: (type, help), for the # HELP and # TYPE lines
+METRICS = {
+    'market_data_request_seconds': ('histogram', 'Time spent on market data provider calls, by call'),
+    'market_data_request_errors_total': ('counter', 'Market data provider calls that raised, by call'),
+    'cache_lookups_total': ('counter', 'Tiered cache lookups by key family and result (local_hit, shared_hit, miss)'),
+    'implied_volatility_solves_total': ('counter', 'Options priced by the vectorized implied volatility solver'),
+    'implied_volatility_iterations_total': ('counter', 'Passes over a chain by the vectorized implied volatility solver'),
+    'view_request_seconds': ('histogram', 'Time to render a view, by url name'),
+    'view_queries': ('histogram', 'Database queries per request, by url name'),
+    'rq_job_seconds': ('histogram', 'Duration of rq jobs, by job and status'),
+    'price_stream_polls_total': ('counter', 'Price stream polls for every open stream in the process, by status'),
+    'screener_refreshes_total': ('counter', 'Ticker rescans for the screener tables, by result (repriced, unchanged, failed)'),
+}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in sorted(labels.items())) + '}'
+
+def _format_value(value):
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = Lock()
+        # sample line ('name{labels}') -> amount not flushed to redis yet
+        self._pending = Counter()
+        self._last_flush = time.monotonic()
+
+    def increment(self, name, amount=1, **labels):
+        sample = name + _format_labels(labels)
+        with self._lock:
+            self._pending[sample] += amount
+        self._maybe_flush()
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        with self._lock:
+            # every bucket gets a sample, even an empty one, so the histogram is complete
+            for bucket in buckets:
+                self._pending[name + '_bucket' + _format_labels(dict(labels, le=bucket))] += int(value <= bucket)
+            self._pending[name + '_bucket' + _format_labels(dict(labels, le='+Inf'))] += 1
+            self._pending[name + '_count' + _format_labels(labels)] += 1
+            self._pending[name + '_sum' + _format_labels(labels)] += value
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush > METRICS_FLUSH_SECONDS:
+            self.flush()
+
+    def _get_connection(self):
+        # worker.py sets django up when it's imported, so it can't be imported with the models
+        from worker import conn
+        return conn
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            pipeline = self._get_connection().pipeline(transaction=False)
+            for sample, amount in pending.items():
+                pipeline.hincrbyfloat(METRICS_REDIS_KEY, sample, amount)
+            pipeline.execute()
+        except Exception:
+            # redis isn't reachable (like in development), keep the samples for the next flush
+            with self._lock:
+                self._pending.update(pending)
+
+    def get_samples(self):
+        self.flush()
+        samples = Counter()
+        try:
+            for sample, amount in self._get_connection().hgetall(METRICS_REDIS_KEY).items():
+                samples[sample.decode()] += float(amount)
+        except Exception:
+            pass
+        with self._lock:
+            samples.update(self._pending)
+        return samples
+
+    def reset(self):
+        with self._lock:
+            self._pending = Counter()
+        try:
+            self._get_connection().delete(METRICS_REDIS_KEY)
+        except Exception:
+            pass
+
+    def render(self):
+        samples = self.get_samples()
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            family_samples = sorted(
+                sample for sample in samples
+                if sample.split('{')[0] in (name, name + '_bucket', name + '_count', name + '_sum')
+            )
+            if not family_samples:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(f'{sample} {_format_value(samples[sample])}' for sample in family_samples)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+# For functions that run as rq jobs, the worker flushes right away since jobs are infrequent
+def record_job_duration(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.monotonic()
+        status = 'failed'
+        try:
+            result = function(*args, **kwargs)
+            status = 'finished'
+            return result
+        finally:
+            metrics.observe('rq_job_seconds', time.monotonic() - start, job=function.__name__, status=status)
+            metrics.flush()
+    return wrapper
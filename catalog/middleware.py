@@ -0,0 +1,30 @@
+import time
+
+from django.db import connection
+
+from .metrics import QUERY_COUNT_BUCKETS, metrics
+
+
+class MetricsMiddleware:
+    """Records how long each view takes and how many database queries it makes"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_count = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        start = time.monotonic()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        # static files and 404s don't have a view
+        if request.resolver_match is not None:
+            view = request.resolver_match.url_name or request.resolver_match.view_name
+            metrics.observe('view_request_seconds', time.monotonic() - start, view=view)
+            metrics.observe('view_queries', query_count, buckets=QUERY_COUNT_BUCKETS, view=view)
+        return response
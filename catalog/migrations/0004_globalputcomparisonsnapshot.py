@@ -0,0 +1,31 @@
+# Generated by Django 3.1.4 on 2026-10-17 03:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_auto_20210117_1541'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GlobalPutComparisonSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField()),
+                ('put_stats', models.JSONField()),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='optionpurchase',
+            options={'ordering': ['-expiration_date', '-purchase_date']},
+        ),
+        migrations.AlterField(
+            model_name='optionpurchase',
+            name='option_wheel',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='option_purchases', to='catalog.optionwheel'),
+        ),
+    ]
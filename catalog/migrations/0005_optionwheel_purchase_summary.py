@@ -0,0 +1,43 @@
+# Generated by Django 3.1.4 on 2026-10-17 03:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_globalputcomparisonsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='optionwheel',
+            name='cost_basis',
+            field=models.DecimalField(decimal_places=2, default=None, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='optionwheel',
+            name='days_active_so_far',
+            field=models.IntegerField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='optionwheel',
+            name='expiration_date',
+            field=models.DateField(db_index=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='optionwheel',
+            name='open_date',
+            field=models.DateField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='optionwheel',
+            name='open_strike',
+            field=models.DecimalField(decimal_places=2, default=None, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='optionwheel',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=None, max_digits=12, null=True),
+        ),
+    ]
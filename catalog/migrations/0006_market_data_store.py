@@ -0,0 +1,49 @@
+# Generated by Django 3.1.4 on 2026-10-17 03:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_optionwheel_purchase_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OptionChainSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expiration_date', models.DateField()),
+                ('fetched', models.DateTimeField()),
+                ('calls', models.BinaryField()),
+                ('puts', models.BinaryField()),
+                ('stock_ticker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='option_chain_snapshots', to='catalog.stockticker')),
+            ],
+            options={
+                'ordering': ['stock_ticker', 'expiration_date', 'fetched'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyClose',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('close', models.FloatField()),
+                ('fetched', models.DateTimeField()),
+                ('stock_ticker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_closes', to='catalog.stockticker')),
+            ],
+            options={
+                'ordering': ['stock_ticker', 'date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='optionchainsnapshot',
+            index=models.Index(fields=['stock_ticker', 'expiration_date', 'fetched'], name='catalog_opt_stock_t_3cafdf_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyclose',
+            constraint=models.UniqueConstraint(fields=('stock_ticker', 'date'), name='unique_daily_close'),
+        ),
+    ]
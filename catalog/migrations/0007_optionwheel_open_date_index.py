@@ -0,0 +1,18 @@
+# Generated by Django 3.1.4 on 2026-10-17 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_market_data_store'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='optionwheel',
+            name='open_date',
+            field=models.DateField(db_index=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.1.4 on 2026-10-17 03:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_optionwheel_open_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scanned', models.DateTimeField()),
+                ('strike', models.FloatField()),
+                ('price', models.FloatField()),
+                ('current_price', models.FloatField()),
+                ('expiration_date', models.DateField()),
+                ('days_to_expiry', models.IntegerField(db_index=True)),
+                ('decimal_odds_out_of_the_money_implied', models.FloatField(db_index=True)),
+                ('annualized_rate_of_return_decimal', models.FloatField(db_index=True)),
+                ('includes_earnings', models.BooleanField()),
+                ('call_max_profit_decimal', models.FloatField()),
+                ('stock_ticker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.stockticker')),
+            ],
+            options={
+                'ordering': ['-annualized_rate_of_return_decimal'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='PutCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scanned', models.DateTimeField()),
+                ('strike', models.FloatField()),
+                ('price', models.FloatField()),
+                ('current_price', models.FloatField()),
+                ('expiration_date', models.DateField()),
+                ('days_to_expiry', models.IntegerField(db_index=True)),
+                ('decimal_odds_out_of_the_money_implied', models.FloatField(db_index=True)),
+                ('annualized_rate_of_return_decimal', models.FloatField(db_index=True)),
+                ('includes_earnings', models.BooleanField()),
+                ('max_profit_decimal', models.FloatField()),
+                ('stock_ticker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.stockticker')),
+            ],
+            options={
+                'ordering': ['-annualized_rate_of_return_decimal'],
+                'abstract': False,
+            },
+        ),
+        migrations.DeleteModel(
+            name='GlobalPutComparisonSnapshot',
+        ),
+        migrations.AddIndex(
+            model_name='putcandidate',
+            index=models.Index(fields=['stock_ticker', '-annualized_rate_of_return_decimal'], name='catalog_put_stock_t_b3992e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='callcandidate',
+            index=models.Index(fields=['stock_ticker', '-annualized_rate_of_return_decimal'], name='catalog_cal_stock_t_759b4f_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.4 on 2026-10-17 04:01
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_option_candidates'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='optionwheel',
+            name='days_active_so_far',
+        ),
+    ]
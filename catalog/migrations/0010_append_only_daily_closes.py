@@ -0,0 +1,25 @@
+# Generated by Django 3.1.4 on 2026-10-17 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_remove_optionwheel_days_active_so_far'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='dailyclose',
+            options={'ordering': ['stock_ticker', 'date', 'fetched']},
+        ),
+        migrations.RemoveConstraint(
+            model_name='dailyclose',
+            name='unique_daily_close',
+        ),
+        migrations.AddConstraint(
+            model_name='dailyclose',
+            constraint=models.UniqueConstraint(fields=('stock_ticker', 'date', 'fetched'), name='unique_daily_close'),
+        ),
+    ]
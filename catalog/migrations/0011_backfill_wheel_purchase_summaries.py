@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+# Same as OptionWheel.update_purchase_summary, which migrations can't call. Wheels created before
+# 0005 would otherwise keep null summaries until backfill_wheel_summaries was run by hand.
+def backfill_purchase_summaries(apps, schema_editor):
+    OptionWheel = apps.get_model('catalog', 'OptionWheel')
+    OptionPurchase = apps.get_model('catalog', 'OptionPurchase')
+    for option_wheel in OptionWheel.objects.iterator(chunk_size=500):
+        # oldest first, the reverse of OptionPurchase.Meta.ordering
+        purchases = list(
+            OptionPurchase.objects.filter(option_wheel_id=option_wheel.pk).order_by('expiration_date', 'purchase_date')
+        )
+        if not purchases:
+            continue
+        first_purchase = purchases[0]
+        revenue = sum(purchase.premium for purchase in purchases)
+        OptionWheel.objects.filter(pk=option_wheel.pk).update(
+            cost_basis=first_purchase.strike - revenue,
+            revenue=revenue,
+            open_date=first_purchase.purchase_date.date(),
+            open_strike=first_purchase.strike,
+            expiration_date=purchases[-1].expiration_date,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_append_only_daily_closes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_purchase_summaries, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.urls import reverse
@@ -41,14 +43,15 @@ class StockTicker(models.Model):
 
     @property
     def change_today(self):
-        if self.current_price:
-            return self.current_price - get_previous_close_price(self.name)
+        current_price = self.current_price
+        if current_price:
+            return current_price - get_previous_close_price(self.name)
         return 0
 
     @property
     def percent_change_today(self):
-        if self.current_price:
-            current_price = self.current_price
+        current_price = self.current_price
+        if current_price:
             return (current_price - get_previous_close_price(self.name)) * 1.0 / current_price
         return 0
 
@@ -77,8 +80,27 @@ class Account(models.Model):
         ordering = ["name"]
 
 
+class OptionPurchaseQuerySet(models.QuerySet):
+    # update() and bulk_create() don't send the save signals, so they update the wheel summaries here.
+    # bulk_update() goes through update().
+    def update(self, **kwargs):
+        pks = list(self.values_list('pk', flat=True))
+        option_wheel_ids = set(OptionPurchase.objects.filter(pk__in=pks).values_list('option_wheel_id', flat=True))
+        rows = super().update(**kwargs)
+        option_wheel_ids.update(OptionPurchase.objects.filter(pk__in=pks).values_list('option_wheel_id', flat=True))
+        update_purchase_summaries(option_wheel_ids)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        update_purchase_summaries(obj.option_wheel_id for obj in objs)
+        return objs
+
+
 class OptionPurchase(models.Model):
     """Represents an option sold on a specific day"""
+    objects = OptionPurchaseQuerySet.as_manager()
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -115,6 +137,43 @@ class OptionPurchase(models.Model):
     class Meta:
         ordering = ['-expiration_date', '-purchase_date']
 
+
+def update_purchase_summaries(option_wheel_ids):
+    """Recomputes the purchase summary columns of the given wheels. Every way of writing purchases ends up here."""
+    for option_wheel in OptionWheel.objects.filter(pk__in=set(option_wheel_ids)):
+        option_wheel.update_purchase_summary()
+
+
+# Signals rather than OptionPurchase.save/delete, so queryset deletes and cascades are covered too
+@receiver(pre_save, sender=OptionPurchase)
+def _remember_previous_option_wheel(sender, instance, raw=False, **kwargs):
+    instance._previous_option_wheel_id = None
+    if not raw and instance.pk is not None:
+        instance._previous_option_wheel_id = OptionPurchase.objects.filter(pk=instance.pk).values_list('option_wheel_id', flat=True).first()
+
+
+@receiver(post_save, sender=OptionPurchase)
+def _update_purchase_summary_after_save(sender, instance, raw=False, **kwargs):
+    # fixtures load the summary columns along with the purchases
+    if raw:
+        return
+    update_purchase_summaries({instance.option_wheel_id, instance._previous_option_wheel_id} - {None})
+
+
+@receiver(post_delete, sender=OptionPurchase)
+def _update_purchase_summary_after_delete(sender, instance, **kwargs):
+    update_purchase_summaries([instance.option_wheel_id])
+
+
+def get_on_track(current_price, last_strike, cost_basis):
+    """Exit if the wheel can be closed at the last strike, Hold if it's above its cost basis, otherwise Under"""
+    if current_price >= last_strike:
+        return 'Exit'
+    if current_price >= cost_basis:
+        return 'Hold'
+    return 'Under'
+
+
 class OptionWheel(models.Model):
     """Referenced by multiple OptionPurchase objects to track profit from using the wheel strategy"""
     user = models.ForeignKey(
@@ -139,19 +198,45 @@ class OptionWheel(models.Model):
     total_days_active = models.IntegerField(default=None, null=True)
     collatoral = models.DecimalField(max_digits=12, decimal_places=2, default=None, null=True)
 
+    # Summary of the option purchases, kept up to date by update_purchase_summaries so they can be
+    # used in queries. These are null until the wheel has a purchase.
+    cost_basis = models.DecimalField(max_digits=12, decimal_places=2, default=None, null=True)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=None, null=True)
+    open_date = models.DateField(default=None, null=True, db_index=True)
+    open_strike = models.DecimalField(max_digits=12, decimal_places=2, default=None, null=True)
+    expiration_date = models.DateField(default=None, null=True, db_index=True)
+
     @property
     def collateral(self):
         # ugh, misspelled in the database
         return self.collatoral
 
+    @property
+    def days_active_so_far(self):
+        # computed from the summary columns when read, so it's never stale
+        if self.open_date is None or self.expiration_date is None:
+            return None
+        return int(busday_count_inclusive(self.open_date, self.expiration_date))
+
     def get_all_option_purchases(self):
-         return self.option_purchases.all()
-     
+        # Loaded once per wheel and reused by every helper below. Use
+        # prefetch_related('option_purchases') when loading many wheels, so this doesn't query at all.
+        # Purchases are ordered newest first, see OptionPurchase.Meta.
+        if not hasattr(self, '_option_purchases'):
+            self._option_purchases = list(self.option_purchases.all())
+        return self._option_purchases
+
     def get_first_option_purchase(self):
-        return self.option_purchases.all().last()
+        purchases = self.get_all_option_purchases()
+        if purchases:
+            return purchases[-1]
+        return None
 
     def get_last_option_purchase(self):
-        return self.option_purchases.all().first()
+        purchases = self.get_all_option_purchases()
+        if purchases:
+            return purchases[0]
+        return None
     
     def get_open_date(self):
         first = self.get_first_option_purchase()
@@ -188,31 +273,48 @@ class OptionWheel(models.Model):
             return 'N/A'
         return sum(purchase.premium for purchase in purchases)
 
+    def update_purchase_summary(self):
+        # Reload rather than trusting purchases that were prefetched before the change
+        purchases = list(OptionPurchase.objects.filter(option_wheel=self))
+        self._option_purchases = purchases
+        summary = {
+            'cost_basis': None,
+            'revenue': None,
+            'open_date': None,
+            'open_strike': None,
+            'expiration_date': None,
+        }
+        if purchases:
+            first_purchase = self.get_first_option_purchase()
+            summary = {
+                'cost_basis': self.get_cost_basis(),
+                'revenue': self.get_revenue(),
+                'open_date': self.get_open_date(),
+                'open_strike': first_purchase.strike,
+                'expiration_date': self.get_expiration_date(),
+            }
+        for field, value in summary.items():
+            setattr(self, field, value)
+        # update() so we don't overwrite anything else on the wheel with what this instance has
+        OptionWheel.objects.filter(pk=self.pk).update(**summary)
+
     def add_purchase_data(self, fetch_price=True):
+        # cost basis, dates and the open strike come from the summary columns
         purchases = self.get_all_option_purchases()
+        if purchases and self.cost_basis is None:
+            # the summary was never filled in, like for a wheel the backfill missed
+            self.update_purchase_summary()
+            purchases = self.get_all_option_purchases()
         if purchases:
-            cost_basis = self.get_cost_basis()
-            first_purchase = self.get_first_option_purchase()
             last_purchase = self.get_last_option_purchase()
-            profit_if_exits_here = last_purchase.strike - cost_basis
+            profit_if_exits_here = last_purchase.strike - self.cost_basis
 
-            days_active_so_far = busday_count_inclusive(
-                first_purchase.purchase_date.date(),
-                last_purchase.expiration_date,
-            )
-            decimal_rate_of_return = float(profit_if_exits_here / first_purchase.strike)
-            annualized_rate_of_return_if_exits_here = compute_annualized_rate_of_return(decimal_rate_of_return, 1, days_active_so_far)
+            decimal_rate_of_return = float(profit_if_exits_here / self.open_strike)
+            annualized_rate_of_return_if_exits_here = compute_annualized_rate_of_return(decimal_rate_of_return, 1, self.days_active_so_far)
 
-            self.cost_basis = cost_basis
             self.profit_if_exits_here = profit_if_exits_here
-            self.days_active_so_far = days_active_so_far
             self.decimal_rate_of_return = decimal_rate_of_return
             self.annualized_rate_of_return_if_exits_here = annualized_rate_of_return_if_exits_here
-
-            self.open_date = self.get_open_date()
-            self.open_strike = first_purchase.strike
-
-            self.expiration_date = self.get_expiration_date()
             self.last_purchase = last_purchase
 
             self.expired = self.is_expired()
@@ -220,12 +322,7 @@ class OptionWheel(models.Model):
                 current_price = get_current_price(self.stock_ticker.name)
                 if current_price is not None:
                     self.current_price = current_price
-                    if current_price >= last_purchase.strike:
-                        self.on_track = 'Exit'
-                    elif current_price >= cost_basis:
-                        self.on_track = 'Hold'
-                    else:
-                        self.on_track = 'Under'
+                    self.on_track = get_on_track(current_price, last_purchase.strike, self.cost_basis)
             self.purchases = purchases
 
 
@@ -243,3 +340,93 @@ class OptionWheel(models.Model):
 
     def get_absolute_url(self):
         return reverse('wheel-detail', args=[str(self.id)])
+
+
+class OptionCandidate(models.Model):
+    """An option from the last full scan of a ticker, see catalog/screener.py"""
+    stock_ticker = models.ForeignKey(StockTicker, on_delete=models.CASCADE)
+    scanned = models.DateTimeField()
+    strike = models.FloatField()
+    price = models.FloatField()
+    current_price = models.FloatField()
+    expiration_date = models.DateField()
+    days_to_expiry = models.IntegerField(db_index=True)
+    decimal_odds_out_of_the_money_implied = models.FloatField(db_index=True)
+    annualized_rate_of_return_decimal = models.FloatField(db_index=True)
+    includes_earnings = models.BooleanField()
+
+    # the stats table columns the views share with the candidates
+    STAT_FIELDS = [
+        'strike',
+        'price',
+        'current_price',
+        'expiration_date',
+        'days_to_expiry',
+        'decimal_odds_out_of_the_money_implied',
+        'annualized_rate_of_return_decimal',
+        'includes_earnings',
+    ]
+
+    def as_stat(self):
+        stat = {field: getattr(self, field) for field in self.STAT_FIELDS}
+        stat['ticker'] = self.stock_ticker
+        stat['expiration_date'] = self.expiration_date.isoformat()
+        return stat
+
+    class Meta:
+        abstract = True
+        ordering = ['-annualized_rate_of_return_decimal']
+
+
+class PutCandidate(OptionCandidate):
+    """A put from the last full scan of a ticker"""
+    max_profit_decimal = models.FloatField()
+
+    STAT_FIELDS = OptionCandidate.STAT_FIELDS + ['max_profit_decimal']
+
+    class Meta(OptionCandidate.Meta):
+        indexes = [
+            models.Index(fields=['stock_ticker', '-annualized_rate_of_return_decimal']),
+        ]
+
+
+class CallCandidate(OptionCandidate):
+    """A call from the last full scan of a ticker, priced as if the stock was just bought"""
+    call_max_profit_decimal = models.FloatField()
+
+    STAT_FIELDS = OptionCandidate.STAT_FIELDS + ['call_max_profit_decimal']
+
+    class Meta(OptionCandidate.Meta):
+        indexes = [
+            models.Index(fields=['stock_ticker', '-annualized_rate_of_return_decimal']),
+        ]
+
+
+class DailyClose(models.Model):
+    """A stock's close for one trading day, kept so yahoo only has to send the days we don't have yet"""
+    stock_ticker = models.ForeignKey(StockTicker, on_delete=models.CASCADE, related_name='daily_closes')
+    date = models.DateField()
+    close = models.FloatField()
+    # the latest day is fetched again until the market closes, each fetch is its own row
+    fetched = models.DateTimeField()
+
+    class Meta:
+        ordering = ["stock_ticker", "date", "fetched"]
+        constraints = [
+            models.UniqueConstraint(fields=['stock_ticker', 'date', 'fetched'], name='unique_daily_close'),
+        ]
+
+
+class OptionChainSnapshot(models.Model):
+    """Calls and puts for one expiration as yahoo sent them, in the option_chain_encoding format"""
+    stock_ticker = models.ForeignKey(StockTicker, on_delete=models.CASCADE, related_name='option_chain_snapshots')
+    expiration_date = models.DateField()
+    fetched = models.DateTimeField()
+    calls = models.BinaryField()
+    puts = models.BinaryField()
+
+    class Meta:
+        ordering = ["stock_ticker", "expiration_date", "fetched"]
+        indexes = [
+            models.Index(fields=['stock_ticker', 'expiration_date', 'fetched']),
+        ]
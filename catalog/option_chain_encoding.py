@@ -0,0 +1,36 @@
+import struct
+import zlib
+
+import numpy
+import pandas
+
+# yfinance option chains have ~14 columns, including strings and timestamps, and pickling the
+# whole DataFrame makes big chains (SPY) slow to load and too large for memcached.
+# The stats code only needs these columns, so they get packed into one float64 array instead.
+OPTION_CHAIN_COLUMNS = ['strike', 'lastPrice', 'bid', 'ask', 'volume', 'impliedVolatility']
+
+_MAGIC = b'OWC'
+_VERSION = 1
+# magic, version, is compressed
+_HEADER = struct.Struct('<3sB?')
+# level 1 is nearly as small as the default level and much faster
+COMPRESSION_LEVEL = 1
+
+def encode_option_chain(option_chain, compress=True):
+    # row major, so decoding can hand the buffer straight to pandas. That's only zero copy when
+    # compress=False: decompressing (the default, to fit big chains in memcached) makes one copy
+    values = numpy.ascontiguousarray(option_chain[OPTION_CHAIN_COLUMNS].to_numpy(dtype='<f8'))
+    payload = values.tobytes()
+    if compress:
+        payload = zlib.compress(payload, COMPRESSION_LEVEL)
+    return _HEADER.pack(_MAGIC, _VERSION, compress) + payload
+
+def decode_option_chain(encoded):
+    magic, version, is_compressed = _HEADER.unpack_from(encoded)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError('Not an encoded option chain')
+    payload = memoryview(encoded)[_HEADER.size:]
+    if is_compressed:
+        payload = zlib.decompress(payload)
+    values = numpy.frombuffer(payload, dtype='<f8').reshape(-1, len(OPTION_CHAIN_COLUMNS))
+    return pandas.DataFrame(values, columns=OPTION_CHAIN_COLUMNS, copy=False)
@@ -1,16 +1,27 @@
 from datetime import datetime
 
-import yfinance
-import mibian
 import numpy
+import pandas
 from django.core.cache import caches
-from django.core.cache import cache
+from .tiered_cache import cache
 from json import JSONDecodeError
 
-from .implied_volatility import compute_delta
+from .implied_volatility import compute_implied_volatility_and_delta
 from .business_day_count import busday_count_inclusive
+from .market_data_providers import get_market_data_provider
+from .metrics import metrics
+from .market_hours import get_market_data_timeout, get_remaining_market_data_timeout
+from .market_data_store import (
+    get_latest_option_chain_snapshot,
+    get_stored_closes,
+    merge_closes,
+    save_closes,
+    save_option_chain_snapshot,
+    to_daily_closes,
+)
+from .single_flight import single_flight
+from .option_chain_encoding import encode_option_chain, decode_option_chain
 
-import time
 
 # interest rate: https://ycharts.com/indicators/10_year_treasury_rate#:~:text=10%20Year%20Treasury%20Rate%20is%20at%200.94%25%2C%20compared%20to%200.94,long%20term%20average%20of%204.39%25.
 INTEREST_RATE = 1
@@ -23,18 +34,39 @@ IMPOSSIBLE_BIDS_BUFFER_PERCENT_PUT = 0.99
 IMPOSSIBLE_IMPLIED_VOLATILITY = 4.4
 
 
+# Timeouts while the market is open, outside of market hours get_market_data_timeout keeps entries until the next open
 YAHOO_FINANCE_CACHE_TIMEOUT = 5 * 60
 YAHOO_FINANCE_LONG_CACHE_TIMEOUT = 60 * 60 * 24
 
+# Calls a method of the market data provider, timing it for the metrics
+def _request_market_data(method_name, *args, **kwargs):
+    with metrics.timer('market_data_request_seconds', call=method_name):
+        try:
+            return getattr(get_market_data_provider(), method_name)(*args, **kwargs)
+        except Exception:
+            metrics.increment('market_data_request_errors_total', call=method_name)
+            raise
+
+def _get_option_days_cache_key(stockticker_name):
+    return '_get_option_days' + stockticker_name
+
+def _get_option_chain_cache_key(stockticker_name, option_day):
+    return '_get_option_chain_encoded' + stockticker_name + option_day
+
 def _get_option_days(stockticker_name, maximum_option_days):
-    cache_key = '_get_option_days' + stockticker_name + str(maximum_option_days)
+    # the whole expiry list is cached, so callers asking for a different number of days share it
+    cache_key = _get_option_days_cache_key(stockticker_name)
     cached_result = cache.get(cache_key)
-    if cached_result is not None:
-        return cached_result
-    yahoo_ticker = yfinance.Ticker(stockticker_name)
+    if cached_result is None:
+        cached_result = single_flight(cache_key, lambda: _fetch_option_days(cache_key, stockticker_name))
+    if cached_result is None:
+        return None
+    return cached_result[:maximum_option_days]
+
+def _fetch_option_days(cache_key, stockticker_name):
     try:
-        result = yahoo_ticker.options[:maximum_option_days]
-        cache.set(cache_key, result, YAHOO_FINANCE_CACHE_TIMEOUT)
+        result = _request_market_data('get_option_days', stockticker_name)
+        cache.set(cache_key, result, get_market_data_timeout(YAHOO_FINANCE_CACHE_TIMEOUT))
     except:
         # On certain downloads yahoo finance might fail :(.
         # Let's avoid caching in that case
@@ -42,37 +74,84 @@ def _get_option_days(stockticker_name, maximum_option_days):
 
     return result
 
-def _get_option_chain(stockticker_name, option_day, is_call):
-    cache_key = '_get_option_chain' + stockticker_name + option_day + str(is_call)
+# yahoo always sends both calls and puts for an expiry, so both sides are cached together.
+# Chains are cached in the compact form from option_chain_encoding, see encode_option_chain
+def _get_encoded_option_chain(stockticker_name, option_day):
+    cache_key = _get_option_chain_cache_key(stockticker_name, option_day)
     cached_result = cache.get(cache_key)
-    if cached_result is not None:
-        return cached_result
-    start = time.time()
-    yahoo_ticker = yfinance.Ticker(stockticker_name)
-    option_chain = yahoo_ticker.option_chain(option_day)
+    if cached_result is None:
+        cached_result = single_flight(cache_key, lambda: _fetch_option_chain(cache_key, stockticker_name, option_day))
+    return cached_result
+
+# Every cache key holding a ticker's market data, for the benchmarks to clear just their own tickers
+def get_market_data_cache_keys(stockticker_name, option_days):
+    return [
+        _get_option_days_cache_key(stockticker_name),
+        'get_recent_closes_' + stockticker_name,
+        'get_earnings_' + stockticker_name,
+    ] + [_get_option_chain_cache_key(stockticker_name, option_day) for option_day in option_days]
+
+# For the prefetch job: downloads the expiry list or chain again, even if it's cached, so the
+# entries are renewed before they expire. refresh_option_days returns None if yahoo failed.
+def refresh_option_days(stockticker_name):
+    return _fetch_option_days(_get_option_days_cache_key(stockticker_name), stockticker_name)
+
+def refresh_option_chain(stockticker_name, option_day):
+    return _fetch_option_chain(
+        _get_option_chain_cache_key(stockticker_name, option_day), stockticker_name, option_day, refresh=True
+    )
+
+def _get_option_chain(stockticker_name, option_day, is_call):
+    cached_result = _get_encoded_option_chain(stockticker_name, option_day)
     if is_call:
-        result = option_chain.calls
-    else:
-        result = option_chain.puts
-    cache.set(cache_key, result, YAHOO_FINANCE_CACHE_TIMEOUT)
-    ending = time.time() - start
-    print(stockticker_name, option_day, ending)
-    return result
+        return decode_option_chain(cached_result['calls'])
+    return decode_option_chain(cached_result['puts'])
 
-def _get_odds_otm(current_price, strike, days_to_expiry, put_price):
-    cache_key = '_get_odds_otm' + str(current_price) + str(strike) + str(days_to_expiry) + str(put_price)
-    cached_result = cache.get(cache_key)
-    if cached_result is not None:
-        return cached_result
-    put_implied_volatility_calculator = mibian.BS([current_price, strike, INTEREST_RATE, days_to_expiry], putPrice=put_price)
-    # kinda silly, we need to construct another object to extract delta for a computation based on real put price
-    # Yahoo's volatility in interesting_put.impliedVolatility seems low, ~20% too low, so lets use the implied volatility
-    implied_volatility = put_implied_volatility_calculator.impliedVolatility
-    put_with_implied_volatility = mibian.BS([current_price, strike, INTEREST_RATE, days_to_expiry], volatility=implied_volatility)
-    result = 1 + put_with_implied_volatility.putDelta
-    cache.set(cache_key, result, YAHOO_FINANCE_CACHE_TIMEOUT)
+# Chains are also kept in the database, see market_data_store. A snapshot that hasn't expired yet
+# is served from there, unless refresh=True which always asks yahoo. Only the prefetch job
+# (refresh=True) writes snapshots, so a request never waits on the insert.
+def _fetch_option_chain(cache_key, stockticker_name, option_day, refresh=False):
+    latest_snapshot = None if refresh else get_latest_option_chain_snapshot(stockticker_name, option_day)
+    if latest_snapshot is not None:
+        timeout = get_remaining_market_data_timeout(latest_snapshot.fetched, YAHOO_FINANCE_CACHE_TIMEOUT)
+        if timeout > 0:
+            result = {'calls': bytes(latest_snapshot.calls), 'puts': bytes(latest_snapshot.puts)}
+            cache.set(cache_key, result, timeout)
+            return result
+    calls, puts = _request_market_data('get_option_chain', stockticker_name, option_day)
+    result = {
+        'calls': encode_option_chain(calls),
+        'puts': encode_option_chain(puts),
+    }
+    if refresh:
+        save_option_chain_snapshot(stockticker_name, option_day, result['calls'], result['puts'])
+    cache.set(cache_key, result, get_market_data_timeout(YAHOO_FINANCE_CACHE_TIMEOUT))
     return result
 
+def _get_effective_prices(options):
+    # bid and ask will be 0 during off hours, so use last_price as an estimate.
+    # During trading hours we assume we'll assuming worse case that we can only get it for bid price
+    bid = options['bid'].to_numpy(dtype=float)
+    ask = options['ask'].to_numpy(dtype=float)
+    last_price = options['lastPrice'].to_numpy(dtype=float)
+    return numpy.where((bid == 0) & (ask == 0), last_price, bid)
+
+def _compute_odds_for_chain(current_price, options, days_to_expiry, is_call):
+    # Solves every option of one expiry in a single vectorized pass instead of two mibian objects per row.
+    # Puts return the odds of expiring out of the money, calls return the call delta.
+    # Options that don't converge come back as NaN and get skipped by the stat computation.
+    _, delta = compute_implied_volatility_and_delta(
+        current_price=current_price,
+        strikes=options['strike'].to_numpy(dtype=float),
+        interest_rate=INTEREST_RATE,
+        days_to_expiry=days_to_expiry,
+        option_prices=_get_effective_prices(options),
+        is_call=is_call,
+    )
+    if is_call:
+        return delta
+    return 1 + delta
+
 
 # We assume that when we fail (for a put we acquire stock, or call we keep stock)
 # we get a rate of return of 1x, which is profit_decimal_fail_case as 0
@@ -93,30 +172,20 @@ def get_earnings(stockticker_name):
     cached_result = cache.get(cache_key)
     if cached_result is not None:
         return cached_result
-    start = time.time()
+    return single_flight(cache_key, lambda: _fetch_earnings(cache_key, stockticker_name))
+
+def _fetch_earnings(cache_key, stockticker_name):
     result = False
-    earnings_date = None
     try:
-        yahoo_ticker = yfinance.Ticker(stockticker_name)
-        calendar = yahoo_ticker.calendar
-        if yahoo_ticker.calendar is not None and not calendar.empty:
-            if 'Value' in calendar:
-                data = calendar['Value']
-                earnings_date = data.get('Earnings Date')
-            else:
-                data = calendar[0]
-                earnings_date = data.get('Earnings Date')
-            
-            # Only care about future earnings dates.
-            if earnings_date and earnings_date > datetime.now().date():
-                result = earnings_date.date()
+        earnings_date = _request_market_data('get_earnings_date', stockticker_name)
+        # Only care about future earnings dates.
+        if earnings_date and earnings_date > datetime.now().date():
+            result = earnings_date.date()
     except:
         # Handle yahoo finance download failure.
         result = None
     
-    cache.set(cache_key, result, YAHOO_FINANCE_LONG_CACHE_TIMEOUT)
-    elapsed = time.time() - start
-    print('get_earnings', stockticker_name, elapsed, result)
+    cache.set(cache_key, result, get_market_data_timeout(YAHOO_FINANCE_LONG_CACHE_TIMEOUT))
     return result
 
 
@@ -126,47 +195,135 @@ def get_current_price(stockticker_name):
         return None
     # Second element, since 2 closes are saved in cache
     if len(closes) < 2:
-        return closes[0]
-    return closes[1]
+        return closes.iloc[0]
+    return closes.iloc[1]
 
 def get_previous_close_price(stockticker_name):
     closes = _get_recent_closes(stockticker_name)
     if closes is None:
         return None
     # First element, since 2 closes are saved in cache
-    return closes[0]
+    return closes.iloc[0]
 
 def _get_recent_closes(stockticker_name):
     cache_key = 'get_recent_closes_' + stockticker_name
     cached_result = cache.get(cache_key)
     if cached_result is not None:
         return cached_result
-    start = time.time()
+    return single_flight(cache_key, lambda: _fetch_recent_closes(cache_key, stockticker_name))
+
+# Closes are kept in the database, see market_data_store, so yahoo is only asked for the days
+# since the last one stored. Closes that haven't expired yet are served from there.
+def _fetch_recent_closes(cache_key, stockticker_name):
+    stored_closes, fetched = get_stored_closes([stockticker_name]).get(stockticker_name, (None, None))
+    if stored_closes is not None:
+        timeout = get_remaining_market_data_timeout(fetched, YAHOO_FINANCE_CACHE_TIMEOUT)
+        if timeout > 0:
+            result = stored_closes.tail(2)
+            cache.set(cache_key, result, timeout)
+            return result
     try:
-        yahoo_ticker = yfinance.Ticker(stockticker_name)
-        yahoo_ticker_history = yahoo_ticker.history(period="10d")
+        if stored_closes is None:
+            closes = _request_market_data('get_closes', stockticker_name, period="10d")
+        else:
+            closes = _request_market_data('get_closes', stockticker_name, start=stored_closes.index[-1].date())
     except JSONDecodeError:
-        return None
-    if yahoo_ticker_history.empty:
-        return None
-    result = yahoo_ticker_history.tail(2)['Close']
-    cache.set(cache_key, result, YAHOO_FINANCE_CACHE_TIMEOUT)
-    ending = time.time() - start
-    print('_get_recent_closes', stockticker_name, ending)
+        return None if stored_closes is None else stored_closes.tail(2)
+    if closes.empty:
+        return None if stored_closes is None else stored_closes.tail(2)
+    closes = to_daily_closes(closes)
+    save_closes({stockticker_name: closes})
+    result = merge_closes(stored_closes, closes).tail(2)
+    cache.set(cache_key, result, get_market_data_timeout(YAHOO_FINANCE_CACHE_TIMEOUT))
     return result
 
+# Wheel and ticker list pages show prices for many tickers, so fetch all of the missing ones
+# with a single download instead of one history request per ticker.
+# refresh=True downloads every ticker even if it's cached, to renew entries before they expire.
+def prefetch_recent_closes(stockticker_names, refresh=False):
+    cache_keys = {name: 'get_recent_closes_' + name for name in set(stockticker_names)}
+    cached_results = {} if refresh else cache.get_many(list(cache_keys.values()))
+    missing_names = sorted(name for name, cache_key in cache_keys.items() if cache_key not in cached_results)
+    if not missing_names:
+        return
+    stored_closes = get_stored_closes(missing_names)
+    if not refresh:
+        for name, (closes, fetched) in stored_closes.items():
+            timeout = get_remaining_market_data_timeout(fetched, YAHOO_FINANCE_CACHE_TIMEOUT)
+            if timeout > 0:
+                cache.set(cache_keys[name], closes.tail(2), timeout)
+                missing_names.remove(name)
+        if not missing_names:
+            return
+    if all(name in stored_closes for name in missing_names):
+        # only the days since the oldest of the last stored closes
+        history_range = {'start': min(stored_closes[name][0].index[-1] for name in missing_names).date()}
+    else:
+        history_range = {'period': "10d"}
+    try:
+        closes = _request_market_data('download_closes', missing_names, **history_range)
+    except:
+        # the per ticker fetch will try again if this fails
+        return
+    if closes.empty:
+        return
+    closes_by_name = {}
+    for name in missing_names:
+        if name not in closes:
+            continue
+        ticker_closes = closes[name].dropna()
+        if not ticker_closes.empty:
+            closes_by_name[name] = to_daily_closes(ticker_closes)
+    save_closes(closes_by_name)
+    results = {}
+    for name, ticker_closes in closes_by_name.items():
+        ticker_stored_closes = stored_closes.get(name, (None, None))[0]
+        results[cache_keys[name]] = merge_closes(ticker_stored_closes, ticker_closes).tail(2)
+    cache.set_many(results, get_market_data_timeout(YAHOO_FINANCE_CACHE_TIMEOUT))
+
+PUT_STAT_COLUMNS = [
+    "strike",
+    "price",
+    "expiration_date",
+    "days_to_expiry",
+    "max_profit_decimal",
+    "decimal_odds_out_of_the_money_implied",
+    "annualized_rate_of_return_decimal",
+    "current_price",
+    "includes_earnings",
+]
+CALL_STAT_COLUMNS = [
+    "strike",
+    "price",
+    "expiration_date",
+    "days_to_expiry",
+    "call_max_profit_decimal",
+    "wheel_total_max_profit_decimal",
+    "decimal_odds_out_of_the_money_implied",
+    "annualized_rate_of_return_decimal",
+    "includes_earnings",
+]
+
+# The stats functions below return pandas DataFrames with one row per option, so templates
+# should go through stats_table_to_records to get the dicts they iterate over.
+def stats_table_to_records(stats_table, ticker):
+    records = stats_table.to_dict('records')
+    for record in records:
+        record["ticker"] = ticker
+    return records
+
 # only look at the 10 closest option days, so about 2 months weekly options
 def get_put_stats_for_ticker(ticker, maximum_option_days=10, options_per_day_to_consider=10):
     ticker_name = ticker.name
     current_price = get_current_price(ticker_name)
     earnings = get_earnings(ticker_name)
     if current_price is None:
-        return {'put_stats': [], 'current_price': None}
+        return {'put_stats': pandas.DataFrame(columns=PUT_STAT_COLUMNS), 'current_price': None}
     put_stats = []
     option_days = _get_option_days(ticker_name, maximum_option_days)
     if option_days is None:
         # can happen if option days fails to download
-        return {'put_stats': [], 'current_price': None}
+        return {'put_stats': pandas.DataFrame(columns=PUT_STAT_COLUMNS), 'current_price': None}
     for option_day in option_days:
         puts = _get_option_chain(ticker_name, option_day, is_call=False)
         interesting_indicies = puts[puts['strike'].gt(current_price)].index
@@ -179,29 +336,29 @@ def get_put_stats_for_ticker(ticker, maximum_option_days=10, options_per_day_to_
         option_day_as_date_object = datetime.strptime(option_day, '%Y-%m-%d').date()
         # add one to business days since it includes the current day too
         days_to_expiry = busday_count_inclusive(datetime.now().date(), option_day_as_date_object)
-        for index, interesting_put in interesting_puts.iterrows():
-            put_stat = compute_put_stat(
-                current_price,
-                interesting_put,
-                days_to_expiry,
-                expiration_date=option_day
-            )
-            if put_stat is not None:
-                put_stat.update({"ticker": ticker})
-                if earnings and earnings <= option_day_as_date_object:
-                    put_stat.update({"includes_earnings": True})
-                put_stats.append(put_stat)
-    return {'put_stats': put_stats, 'current_price': current_price}
-
-# only look at the 10 closest option days, so about 2 months on weekly options
-def get_call_stats_for_option_wheel(ticker, days_active_so_far, revenue, collateral, maximum_option_days=10):
+        put_stats_for_day = compute_put_stats_table(
+            current_price,
+            interesting_puts,
+            days_to_expiry,
+            expiration_date=option_day
+        )
+        put_stats_for_day["includes_earnings"] = bool(earnings and earnings <= option_day_as_date_object)
+        put_stats.append(put_stats_for_day)
+    return {'put_stats': _concat_stats_tables(put_stats, PUT_STAT_COLUMNS), 'current_price': current_price}
+
+# only look at the 10 closest option days, so about 2 months on weekly options. Without a wheel's
+# revenue and collateral, the wheel total column is left out.
+def get_call_stats_for_ticker(ticker, maximum_option_days=10, days_active_so_far=None, revenue=None, collateral=None):
     ticker_name = ticker.name
     current_price = get_current_price(ticker_name)
     earnings = get_earnings(ticker_name)
     if current_price is None:
-        return {'call_stats': [], 'current_price': None}
+        return {'call_stats': pandas.DataFrame(columns=CALL_STAT_COLUMNS), 'current_price': None}
     call_stats = []
     option_days = _get_option_days(ticker_name, maximum_option_days)
+    if option_days is None:
+        # can happen if option days fails to download
+        return {'call_stats': pandas.DataFrame(columns=CALL_STAT_COLUMNS), 'current_price': None}
     for option_day in option_days:
         option_day_as_date_object = datetime.strptime(option_day, '%Y-%m-%d').date()
         # add one to business days since it includes the current day too
@@ -215,146 +372,147 @@ def get_call_stats_for_option_wheel(ticker, days_active_so_far, revenue, collate
         # ITM calls might be useful to make sure the stock gets sold, while OTM calls are useful
         # to hold onto the stock until it recovers.
         interesting_calls = calls[max(otm_threshold_index - 10, 0):min(otm_threshold_index + 10, calls.shape[0])]
-        for index, interesting_call in interesting_calls.iterrows():
-            call_stat = compute_call_stat(
-                current_price,
-                interesting_call,
-                days_to_expiry,
-                expiration_date=option_day,
-                days_active_so_far=days_active_so_far,
-                revenue=revenue,
-                collateral=collateral,
-            )
-            if call_stat is not None:
-                call_stat.update({"ticker": ticker})
-                if earnings and earnings <= option_day_as_date_object:
-                    call_stat.update({"includes_earnings": True})
-                call_stats.append(call_stat)
-    return {'call_stats': call_stats, 'current_price': current_price}
+        call_stats_for_day = compute_call_stats_table(
+            current_price,
+            interesting_calls,
+            days_to_expiry,
+            expiration_date=option_day,
+            days_active_so_far=days_active_so_far,
+            revenue=revenue,
+            collateral=collateral,
+        )
+        call_stats_for_day["includes_earnings"] = bool(earnings and earnings <= option_day_as_date_object)
+        call_stats.append(call_stats_for_day)
+    return {'call_stats': _concat_stats_tables(call_stats, CALL_STAT_COLUMNS), 'current_price': current_price}
 
-def compute_put_stat(current_price, interesting_put, days_to_expiry, expiration_date):
-    volume = interesting_put.volume
-    if volume < MINIMUM_VOLUME or numpy.isnan(volume):
-        # These are probably too low volume to be legit. Yahoo finance will show wrong prices
-        return None
-    if interesting_put.impliedVolatility == 0:
-        # This likely indicates a broken option (bid/ask is busted),
-        # and mibian will take a long time computing these
-        return None
-    strike, last_price, bid, ask = [interesting_put.strike, interesting_put.lastPrice, interesting_put.bid, interesting_put.ask]
-    effective_price = last_price
-    if (bid == 0 and ask == 0) == False:
-        # bid and ask will be 0 during off hours, so use last_price as an estimate.
-        # During trading hours we assume we'll assuming worse case that we can only get it for bid price
-        effective_price = bid
-    if effective_price == 0 or numpy.isnan(effective_price):
-        return None
-    if strike > (current_price * IMPOSSIBLE_BIDS_BUFFER_PERCENT_PUT) + effective_price:
-        # this option has no intrinsic value, since it would be more efficient
-        # to just buy the stock on the open market in this case. This is probably from
-        # there being no legitimate bids, and we need to skip, since mibian will lag out
-        # if it attempts to compute this
-        return None
-    if effective_price > last_price * 1.1 or effective_price < last_price * 0.9:
-        # The price seems pretty stale. We should avoid computation since mibian's computation
-        # will tend to time out in this case.
-        return None
+def _concat_stats_tables(stats_tables, columns):
+    if not stats_tables:
+        return pandas.DataFrame(columns=columns)
+    return pandas.concat(stats_tables, ignore_index=True)
 
-    RUN_NEW_FORUMLA = False
-    if interesting_put.impliedVolatility > IMPOSSIBLE_IMPLIED_VOLATILITY:
-        # Mibian times out if the implied volatility is too high. In this case run the new formula.
-        RUN_NEW_FORUMLA = True
-    if RUN_NEW_FORUMLA:
-        delta = compute_delta(
-            current_price=current_price,
-            strike=strike,
-            interest_rate=INTEREST_RATE,
-            days_to_expiry=days_to_expiry,
-            option_price=effective_price,
-            is_call=False
-        )
-        probability_out_of_the_money = 1 + delta
-    else:
-        probability_out_of_the_money = _get_odds_otm(current_price, strike, days_to_expiry, effective_price)
-    if numpy.isnan(probability_out_of_the_money):
-        return None
-    max_profit_decimal = effective_price / strike
-    stats = {
-        "strike": strike,
-        "price": effective_price,
+def _get_candidates_mask(options, effective_prices):
+    # Guards shared by puts and calls. These are written as "not (reject condition)" so NaNs
+    # in the chain get treated the same way the old row by row checks treated them.
+    volume = options['volume'].to_numpy(dtype=float)
+    implied_volatility = options['impliedVolatility'].to_numpy(dtype=float)
+    last_price = options['lastPrice'].to_numpy(dtype=float)
+    # These are probably too low volume to be legit. Yahoo finance will show wrong prices
+    mask = ~(volume < MINIMUM_VOLUME) & ~numpy.isnan(volume)
+    # This likely indicates a broken option (bid/ask is busted)
+    mask &= implied_volatility != 0
+    mask &= (effective_prices != 0) & ~numpy.isnan(effective_prices)
+    # The price seems pretty stale, so the implied volatility would be garbage
+    mask &= ~((effective_prices > last_price * 1.1) | (effective_prices < last_price * 0.9))
+    return mask
+
+def _get_put_candidates_mask(current_price, puts, effective_prices):
+    strikes = puts['strike'].to_numpy(dtype=float)
+    mask = _get_candidates_mask(puts, effective_prices)
+    # this option has no intrinsic value, since it would be more efficient
+    # to just buy the stock on the open market in this case. This is probably from
+    # there being no legitimate bids, so there is no volatility that explains the price
+    mask &= ~(strikes > (current_price * IMPOSSIBLE_BIDS_BUFFER_PERCENT_PUT) + effective_prices)
+    return mask
+
+def _get_call_candidates_mask(current_price, calls, effective_prices):
+    strikes = calls['strike'].to_numpy(dtype=float)
+    implied_volatility = calls['impliedVolatility'].to_numpy(dtype=float)
+    mask = _get_candidates_mask(calls, effective_prices)
+    # this option has no intrinsic value, since it would be more efficient
+    # to just sell the stock on the open market in this case. This is probably from
+    # there being no legitimate bids, so there is no volatility that explains the price
+    mask &= ~(strikes + effective_prices < current_price * IMPOSSIBLE_BIDS_BUFFER_PERCENT_CALL)
+    # Yahoo's volatility is wildly off for these, skip them like we always have
+    mask &= ~(implied_volatility > IMPOSSIBLE_IMPLIED_VOLATILITY)
+    return mask
+
+def compute_put_stats_table(current_price, puts, days_to_expiry, expiration_date):
+    effective_prices = _get_effective_prices(puts)
+    mask = _get_put_candidates_mask(current_price, puts, effective_prices)
+    candidates = puts[mask]
+    effective_prices = effective_prices[mask]
+    probability_out_of_the_money = _compute_odds_for_chain(current_price, candidates, days_to_expiry, is_call=False)
+    converged = ~numpy.isnan(probability_out_of_the_money)
+
+    strikes = candidates['strike'].to_numpy(dtype=float)[converged]
+    effective_prices = effective_prices[converged]
+    probability_out_of_the_money = probability_out_of_the_money[converged]
+    max_profit_decimal = effective_prices / strikes
+    return pandas.DataFrame({
+        "strike": strikes,
+        "price": effective_prices,
         "expiration_date": expiration_date,
         "days_to_expiry": days_to_expiry,
         # https://www.macroption.com/delta-calls-puts-probability-expiring-itm/ "Option’s delta as probability proxy"
         "max_profit_decimal": max_profit_decimal,
         "decimal_odds_out_of_the_money_implied": probability_out_of_the_money,
         "annualized_rate_of_return_decimal": compute_annualized_rate_of_return(max_profit_decimal, probability_out_of_the_money, days_to_expiry),
-        "current_price" : current_price
-    }
-
-    return stats
+        "current_price" : current_price,
+    })
 
-def compute_call_stat(
+def compute_call_stats_table(
     current_price,
-    interesting_call,
+    calls,
     days_to_expiry,
     expiration_date,
-    days_active_so_far,
-    revenue,
-    collateral,
+    days_active_so_far=None,
+    revenue=None,
+    collateral=None,
 ):
-    volume = interesting_call.volume
-    if volume < MINIMUM_VOLUME or numpy.isnan(volume):
-        # These are probably too low volume to be legit. Yahoo finance will show wrong prices
-        return None
-    if interesting_call.impliedVolatility == 0:
-        # This likely indicates a broken option (bid/ask is busted),
-        # and mibian will take a long time computing these
-        return None
-    strike, last_price, bid, ask = [interesting_call.strike, interesting_call.lastPrice, interesting_call.bid, interesting_call.ask]
-    effective_price = last_price
-    if (bid == 0 and ask == 0) == False:
-        # bid and ask will be 0 during off hours, so use last_price as an estimate.
-        # During trading hours we assume we'll assuming worse case that we can only get it for bid price
-        effective_price = bid
-    if effective_price == 0 or numpy.isnan(effective_price):
-        return None
-    if strike + effective_price < current_price * IMPOSSIBLE_BIDS_BUFFER_PERCENT_CALL:
-        # this option has no intrinsic value, since it would be more efficient
-        # to just sell the stock on the open market in this case. This is probably from
-        # there being no legitimate bids, and we need to skip, since mibian will lag out
-        # if it attempts to compute this
-        return None
-    if effective_price > last_price * 1.1 or effective_price < last_price * 0.9:
-        # The price seems pretty stale. We should avoid computation since mibian's computation
-        # will tend to time out in this case.
-        return None
-    
-    if interesting_call.impliedVolatility > IMPOSSIBLE_IMPLIED_VOLATILITY:
-        # Bail early, since mibian will fail
-        return None
-    call_implied_volatility_calculator = mibian.BS([current_price, strike, INTEREST_RATE, days_to_expiry], callPrice=effective_price)
-    # kinda silly, we need to construct another object to extract delta for a computation based on real call price
-    # Yahoo's volatility in interesting_call.impliedVolatility seems low, ~20% too low, so lets use the implied volatility
-    implied_volatility = call_implied_volatility_calculator.impliedVolatility
-    call_with_implied_volatility = mibian.BS([current_price, strike, INTEREST_RATE, days_to_expiry], volatility=implied_volatility)
+    effective_prices = _get_effective_prices(calls)
+    mask = _get_call_candidates_mask(current_price, calls, effective_prices)
+    candidates = calls[mask]
+    effective_prices = effective_prices[mask]
+    odds = _compute_odds_for_chain(current_price, candidates, days_to_expiry, is_call=True)
+    converged = ~numpy.isnan(odds)
 
-    proposed_strike_difference_proceeds = strike - float(collateral)
-    wheel_total_max_profit_decimal = (proposed_strike_difference_proceeds + effective_price + float(revenue)) / float(collateral)
+    strikes = candidates['strike'].to_numpy(dtype=float)[converged]
+    effective_prices = effective_prices[converged]
+    odds = odds[converged]
 
     # For computing the return of just this call, we ignore any previous profit/losses
     # and assume we had to buy the stock at the current price
-    call_max_profit_decimal = (strike + effective_price - current_price) / current_price
-    odds = call_with_implied_volatility.callDelta
-
-    annualized_rate_of_return = compute_annualized_rate_of_return(call_max_profit_decimal, odds, days_to_expiry)
-    stats = {
-        "strike": strike,
-        "price": effective_price,
+    call_max_profit_decimal = (strikes + effective_prices - current_price) / current_price
+    call_stats = pandas.DataFrame({
+        "strike": strikes,
+        "price": effective_prices,
         "expiration_date": expiration_date,
         "days_to_expiry": days_to_expiry,
         "call_max_profit_decimal": call_max_profit_decimal,
-        "wheel_total_max_profit_decimal": wheel_total_max_profit_decimal,
         "decimal_odds_out_of_the_money_implied": odds,
-        "annualized_rate_of_return_decimal": annualized_rate_of_return
-    }
-    return stats
+        "annualized_rate_of_return_decimal": compute_annualized_rate_of_return(call_max_profit_decimal, odds, days_to_expiry),
+    })
+    if collateral is not None:
+        proposed_strike_difference_proceeds = strikes - float(collateral)
+        wheel_total_max_profit_decimal = (proposed_strike_difference_proceeds + effective_prices + float(revenue)) / float(collateral)
+        call_stats.insert(5, "wheel_total_max_profit_decimal", wheel_total_max_profit_decimal)
+    return call_stats
+
+# Single option versions of the tables above, returns None if the option should be skipped
+def compute_put_stat(current_price, interesting_put, days_to_expiry, expiration_date):
+    put_stats = compute_put_stats_table(current_price, interesting_put.to_frame().T, days_to_expiry, expiration_date)
+    if put_stats.empty:
+        return None
+    return put_stats.to_dict('records')[0]
+
+def compute_call_stat(
+    current_price,
+    interesting_call,
+    days_to_expiry,
+    expiration_date,
+    days_active_so_far,
+    revenue,
+    collateral,
+):
+    call_stats = compute_call_stats_table(
+        current_price,
+        interesting_call.to_frame().T,
+        days_to_expiry,
+        expiration_date,
+        days_active_so_far,
+        revenue,
+        collateral,
+    )
+    if call_stats.empty:
+        return None
+    return call_stats.to_dict('records')[0]
@@ -0,0 +1,235 @@
+import asyncio
+import json
+from urllib.parse import parse_qsl
+
+from django.core.cache import cache
+
+from .async_market_data import run_in_thread
+from .market_hours import get_market_data_timeout
+from .metrics import metrics
+from .models import OptionWheel, StockTicker, get_on_track
+from .option_price_computation import get_current_price, get_previous_close_price, prefetch_recent_closes
+from .schedule_async import GLOBAL_PUT_CACHE_KEY
+
+# Server-sent events with the prices and on track badges for whatever a page has on screen:
+#   GET prices/stream?tickers=TSLA,AAPL&wheels=1,2&global_put_comparison=1
+#   event: price           data: {"ticker": "TSLA", "price": 1.0, "change": 0.1, "percent_change": 0.1}
+#   event: on_track        data: {"wheel": 1, "on_track": "Exit"}
+#   event: global_put_comparison  data: {"ready": true}
+# Events are only sent when something changed. Under ASGI (see option_wheel_tracker/asgi.py) the
+# stream stays open, and every stream in the process is fed by one PriceStreamHub poll. The
+# prices come from the same cache as the pages, so the upstream fetches don't grow with the
+# number of open tabs. Under WSGI the price_stream view sends the current values once and the
+# browser reconnects after PRICE_STREAM_RECONNECT_MILLISECONDS.
+
+PRICE_STREAM_POLL_SECONDS = 15
+PRICE_STREAM_KEEPALIVE_SECONDS = 30
+PRICE_STREAM_RECONNECT_MILLISECONDS = 60 * 1000
+PRICE_STREAM_MAX_TICKERS = 100
+PRICE_STREAM_MAX_WHEELS = 200
+# a client this far behind is only missing stale prices, newer ones replace them
+PRICE_STREAM_QUEUE_SIZE = 1000
+PRICE_STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    # keep heroku's router and nginx from buffering the stream
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _split(value, maximum):
+    return [item.strip() for item in value.split(',') if item.strip()][:maximum]
+
+
+def load_price_stream_subscription(params):
+    """
+    Returns (stockticker_names, wheels, global_put_comparison) for the stream's query params.
+    Only tickers in the database are watched. wheels maps the pk of each active wheel to
+    (ticker name, last strike, cost basis), what it takes to tell whether it's on track.
+    """
+    stockticker_names = set(StockTicker.objects.filter(
+        name__in=[name.upper() for name in _split(params.get('tickers', ''), PRICE_STREAM_MAX_TICKERS)]
+    ).values_list('name', flat=True))
+    wheel_pks = [pk for pk in _split(params.get('wheels', ''), PRICE_STREAM_MAX_WHEELS) if pk.isdigit()]
+    wheels = {}
+    option_wheels = OptionWheel.objects \
+        .filter(pk__in=wheel_pks, is_active=True) \
+        .select_related('stock_ticker') \
+        .prefetch_related('option_purchases')
+    for option_wheel in option_wheels:
+        last_purchase = option_wheel.get_last_option_purchase()
+        if last_purchase is not None:
+            wheels[option_wheel.pk] = (option_wheel.stock_ticker.name, last_purchase.strike, option_wheel.cost_basis)
+    return stockticker_names, wheels, params.get('global_put_comparison') == '1'
+
+
+def get_price_updates(stockticker_names):
+    """The price event data for each ticker that has a price"""
+    prefetch_recent_closes(stockticker_names)
+    prices = {}
+    for name in stockticker_names:
+        current_price = get_current_price(name)
+        if not current_price:
+            continue
+        change = current_price - get_previous_close_price(name)
+        # rounded to what the pages show, so nothing is sent for changes nobody can see
+        prices[name] = {
+            'ticker': name,
+            'price': round(float(current_price), 2),
+            'change': round(float(change), 2),
+            'percent_change': round(float(change / current_price), 4),
+        }
+    return prices
+
+
+def is_global_put_comparison_ready():
+    return cache.get(GLOBAL_PUT_CACHE_KEY) is not None
+
+
+class PriceStreamSubscription:
+    def __init__(self, stockticker_names, wheels, global_put_comparison=False):
+        self.stockticker_names = set(stockticker_names) | {name for name, _, _ in wheels.values()}
+        self.wheels = wheels
+        self.global_put_comparison = global_put_comparison
+        self._on_track = {}
+        self._sent_global_put_comparison_ready = False
+        self.queue = None
+
+    def get_price_events(self, price):
+        if price['ticker'] not in self.stockticker_names:
+            return []
+        events = [format_event('price', price)]
+        for pk, (name, last_strike, cost_basis) in self.wheels.items():
+            if name != price['ticker']:
+                continue
+            on_track = get_on_track(price['price'], last_strike, cost_basis)
+            if self._on_track.get(pk) != on_track:
+                self._on_track[pk] = on_track
+                events.append(format_event('on_track', {'wheel': pk, 'on_track': on_track}))
+        return events
+
+    def get_global_put_comparison_events(self, ready):
+        if not self.global_put_comparison or not ready or self._sent_global_put_comparison_ready:
+            return []
+        self._sent_global_put_comparison_ready = True
+        return [format_event('global_put_comparison', {'ready': True})]
+
+    def send(self, events):
+        for event in events:
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+
+def get_price_stream_snapshot(stockticker_names, wheels, global_put_comparison=False):
+    """Every event for the current values, for the WSGI price_stream view"""
+    subscription = PriceStreamSubscription(stockticker_names, wheels, global_put_comparison)
+    events = []
+    for price in get_price_updates(sorted(subscription.stockticker_names)).values():
+        events += subscription.get_price_events(price)
+    if global_put_comparison:
+        events += subscription.get_global_put_comparison_events(is_global_put_comparison_ready())
+    return events
+
+
+def _get_updates(stockticker_names, global_put_comparison):
+    ready = is_global_put_comparison_ready() if global_put_comparison else False
+    return get_price_updates(stockticker_names), ready
+
+
+class PriceStreamHub:
+    """Polls the prices once for every open stream in the process, and sends each stream what changed"""
+    def __init__(self, poll_seconds=PRICE_STREAM_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._subscriptions = set()
+        self._prices = {}
+        self._global_put_comparison_ready = False
+        self._poll_task = None
+        self._wake = None
+
+    def subscribe(self, subscription):
+        subscription.queue = asyncio.Queue(maxsize=PRICE_STREAM_QUEUE_SIZE)
+        self._subscriptions.add(subscription)
+        # what's already known goes out right away, anything new comes with the next poll
+        for name in subscription.stockticker_names:
+            if name in self._prices:
+                subscription.send(subscription.get_price_events(self._prices[name]))
+        subscription.send(subscription.get_global_put_comparison_events(self._global_put_comparison_ready))
+        if self._poll_task is None or self._poll_task.done():
+            self._wake = asyncio.Event()
+            self._poll_task = asyncio.ensure_future(self._poll())
+        else:
+            self._wake.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions.discard(subscription)
+
+    async def _poll(self):
+        while self._subscriptions:
+            self._wake.clear()
+            subscriptions = list(self._subscriptions)
+            stockticker_names = sorted(set().union(*(subscription.stockticker_names for subscription in subscriptions)))
+            global_put_comparison = any(subscription.global_put_comparison for subscription in subscriptions)
+            try:
+                prices, ready = await run_in_thread(_get_updates, stockticker_names, global_put_comparison)
+                metrics.increment('price_stream_polls_total', status='ok')
+            except Exception:
+                prices, ready = {}, self._global_put_comparison_ready
+                metrics.increment('price_stream_polls_total', status='error')
+            # forget tickers nobody is watching, so a later subscriber doesn't get an old price
+            self._prices = {name: price for name, price in self._prices.items() if name in stockticker_names}
+            for name, price in prices.items():
+                if self._prices.get(name) == price:
+                    continue
+                self._prices[name] = price
+                for subscription in subscriptions:
+                    subscription.send(subscription.get_price_events(price))
+            self._global_put_comparison_ready = ready
+            for subscription in subscriptions:
+                subscription.send(subscription.get_global_put_comparison_events(ready))
+            try:
+                await asyncio.wait_for(self._wake.wait(), get_market_data_timeout(self.poll_seconds))
+            except asyncio.TimeoutError:
+                pass
+
+
+price_stream_hub = PriceStreamHub()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def price_stream_application(scope, receive, send):
+    """ASGI application for the price stream, routed to by option_wheel_tracker/asgi.py"""
+    params = dict(parse_qsl(scope['query_string'].decode()))
+    subscription = PriceStreamSubscription(*await run_in_thread(load_price_stream_subscription, params))
+    await send({'type': 'http.response.start', 'status': 200, 'headers': PRICE_STREAM_HEADERS})
+    await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+    price_stream_hub.subscribe(subscription)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        while True:
+            next_event = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnected}, timeout=PRICE_STREAM_KEEPALIVE_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnected in done:
+                next_event.cancel()
+                break
+            if next_event in done:
+                body = next_event.result()
+            else:
+                next_event.cancel()
+                body = ': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+    finally:
+        price_stream_hub.unsubscribe(subscription)
+        disconnected.cancel()
@@ -1,27 +1,196 @@
-from rq import Queue
-from worker import conn
-from .option_price_computation import (
-  get_put_stats_for_ticker,
-)
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from uuid import uuid4
+from rq import Queue, Retry, get_current_job
+from worker import conn, listen
+from .metrics import record_job_duration
+from .market_hours import get_market_data_timeout, get_seconds_until_market_open, is_market_open
+from .option_price_computation import prefetch_recent_closes, refresh_option_chain, refresh_option_days
+from .screener import refresh_candidates
 from django.core.cache import cache
-from catalog.models import StockTicker
+from django.db import connections
+from django.utils import timezone
+from catalog.models import OptionWheel, StockTicker
 
+logger = logging.getLogger(__name__)
+
+# The global put comparison is a full scan of every ticker into the screener tables, see
+# screener.py. Only the tickers whose market data changed get repriced, the rest keep their
+# candidates. GLOBAL_PUT_CACHE_KEY holds when the last scan finished, until it's due again.
 GLOBAL_PUT_CACHE_KEY = 'global_put_comparison'
 GLOBAL_PUT_TIMEOUT_SECONDS = 10 * 60
 GLOBAL_PUT_RUNNING_CACHE_KEY = 'global_put_comparison_running'
+# Tickers are almost entirely waiting on yahoo, so fetch many at once. The number of requests
+# actually in flight is capped by YAHOO_FINANCE_MAX_CONCURRENT_REQUESTS.
+GLOBAL_PUT_MAX_WORKERS = 16
+# The scan is split into shards of this many tickers so every worker.py process can help out.
+# The last shard to finish marks the scan as done. A shard counts as finished once it succeeds or
+# runs out of retries, and if some shard never finishes (like when its worker dies) the scan is
+# marked as done after GLOBAL_PUT_TIMEOUT_SECONDS anyway, so the refresh loop keeps going.
+GLOBAL_PUT_SHARD_SIZE = 25
+GLOBAL_PUT_SHARD_RETRIES = 2
+GLOBAL_PUT_SHARDS_REMAINING_KEY = 'global_put_comparison_shards_remaining_'
+# Refresh a bit before GLOBAL_PUT_CACHE_KEY expires, so visitors don't have to see the older scan
+GLOBAL_PUT_REFRESH_SECONDS = 8 * 60
+GLOBAL_PUT_REFRESH_SCHEDULED_KEY = 'global_put_comparison_refresh_scheduled'
+
+# For functions run on a ThreadPoolExecutor. Every thread opens its own database connection,
+# which has to be closed before the thread goes away.
+def _closing_connections(function):
+  @functools.wraps(function)
+  def wrapper(*args):
+    try:
+      return function(*args)
+    finally:
+      connections.close_all()
+  return wrapper
 
 def schedule_global_put_comparison_async():
   is_currently_running = cache.get(GLOBAL_PUT_RUNNING_CACHE_KEY)
   if is_currently_running is None:
     cache.set(GLOBAL_PUT_RUNNING_CACHE_KEY, True, GLOBAL_PUT_TIMEOUT_SECONDS)
-    q = Queue(connection=conn)
-    return q.enqueue(_run_global_put_comparison, job_timeout=GLOBAL_PUT_TIMEOUT_SECONDS)
+    return _enqueue_global_put_comparison_shards()
   return True
 
+def _enqueue_global_put_comparison_shards():
+  scan_id = uuid4().hex
+  ticker_ids = list(StockTicker.objects.values_list('id', flat=True))
+  shards = [ticker_ids[i:i + GLOBAL_PUT_SHARD_SIZE] for i in range(0, len(ticker_ids), GLOBAL_PUT_SHARD_SIZE)]
+  if not shards:
+    return Queue(connection=conn).enqueue(_save_global_put_comparison)
+  # the count outlives the timeout, so _finish_global_put_comparison can tell if the scan is done
+  conn.set(GLOBAL_PUT_SHARDS_REMAINING_KEY + scan_id, len(shards), ex=2 * GLOBAL_PUT_TIMEOUT_SECONDS)
+  Queue(connection=conn).enqueue_in(
+    timedelta(seconds=GLOBAL_PUT_TIMEOUT_SECONDS), _finish_global_put_comparison, scan_id
+  )
+  jobs = []
+  for shard_index, shard_ticker_ids in enumerate(shards):
+    # spread the shards over every queue worker.py listens on, each worker drains all of them anyway
+    q = Queue(listen[shard_index % len(listen)], connection=conn)
+    jobs.append(q.enqueue(
+      _run_global_put_comparison_shard,
+      scan_id,
+      shard_ticker_ids,
+      job_timeout=GLOBAL_PUT_TIMEOUT_SECONDS,
+      retry=Retry(max=GLOBAL_PUT_SHARD_RETRIES),
+    ))
+  return jobs
+
+@record_job_duration
+def _run_global_put_comparison_shard(scan_id, ticker_ids):
+  try:
+    _refresh_candidates(list(StockTicker.objects.filter(id__in=ticker_ids)))
+  except Exception:
+    # rq retries a failed shard on its own and the scan waits for it, until the last attempt
+    job = get_current_job()
+    if job is None or not job.retries_left:
+      _finish_global_put_comparison_shard(scan_id)
+    raise
+  _finish_global_put_comparison_shard(scan_id)
+
+def _finish_global_put_comparison_shard(scan_id):
+  remaining = conn.decr(GLOBAL_PUT_SHARDS_REMAINING_KEY + scan_id)
+  if remaining == 0:
+    _finish_global_put_comparison(scan_id)
+  elif remaining < 0:
+    # the scan already timed out, decr just made a new count
+    conn.delete(GLOBAL_PUT_SHARDS_REMAINING_KEY + scan_id)
+
+def _finish_global_put_comparison(scan_id):
+  # run by the last shard and by the timeout, whichever deletes the count saves the scan
+  if conn.delete(GLOBAL_PUT_SHARDS_REMAINING_KEY + scan_id):
+    _save_global_put_comparison()
+
+def _refresh_candidates(stock_tickers):
+  with ThreadPoolExecutor(max_workers=GLOBAL_PUT_MAX_WORKERS) as executor:
+    list(executor.map(_closing_connections(refresh_candidates), stock_tickers))
+
+# Runs the whole scan in this process, without sharding it over the workers
 def _run_global_put_comparison():
-  put_stats = []
-  for stock_ticker in StockTicker.objects.all():
-    put_stats += get_put_stats_for_ticker(stock_ticker, maximum_option_days=2, options_per_day_to_consider=3)['put_stats']
-  result = sorted(put_stats, key=lambda put: put['annualized_rate_of_return_decimal'], reverse=True)
-  cache.set(GLOBAL_PUT_CACHE_KEY, result, GLOBAL_PUT_TIMEOUT_SECONDS)
-  return result
+  _refresh_candidates(list(StockTicker.objects.all()))
+  _save_global_put_comparison()
+
+def _save_global_put_comparison():
+  cache.set(GLOBAL_PUT_CACHE_KEY, timezone.now(), get_market_data_timeout(GLOBAL_PUT_TIMEOUT_SECONDS))
+  cache.delete(GLOBAL_PUT_RUNNING_CACHE_KEY)
+  _schedule_global_put_comparison_refresh()
+
+def _schedule_global_put_comparison_refresh():
+  # Outside of market hours the comparison can't change, so the next refresh waits for the open
+  refresh_seconds = get_market_data_timeout(GLOBAL_PUT_REFRESH_SECONDS)
+  # Only one refresh should be pending, even if a visitor kicked off an extra run in the meantime
+  if conn.set(GLOBAL_PUT_REFRESH_SCHEDULED_KEY, 1, nx=True, ex=refresh_seconds):
+    q = Queue(connection=conn)
+    q.enqueue_in(timedelta(seconds=refresh_seconds), schedule_global_put_comparison_async)
+
+
+# The market data prefetch keeps yahoo data warm for every ticker, so visitors don't pay for
+# fetches on cache misses. During market hours it runs a bit more often than
+# YAHOO_FINANCE_CACHE_TIMEOUT, outside of them cached data lasts until the open so it waits for that.
+MARKET_DATA_PREFETCH_MARKET_HOURS_SECONDS = 4 * 60
+MARKET_DATA_PREFETCH_SCHEDULED_KEY = 'market_data_prefetch_scheduled'
+# A run can take as long as its job timeout, which is as long as the wait for the next one, so
+# runs hold this key while they work and a run that finds it taken skips its turn.
+# It expires with the job timeout, in case the worker running it dies.
+MARKET_DATA_PREFETCH_RUNNING_KEY = 'market_data_prefetch_running'
+# Tickers with active wheels get the 10 expiries the wheel pages show, the rest get the
+# expiries the global put comparison looks at.
+MARKET_DATA_PREFETCH_ACTIVE_OPTION_DAYS = 10
+MARKET_DATA_PREFETCH_OPTION_DAYS = 2
+
+def schedule_market_data_prefetch():
+  if is_market_open():
+    delay_seconds = MARKET_DATA_PREFETCH_MARKET_HOURS_SECONDS
+  else:
+    delay_seconds = max(MARKET_DATA_PREFETCH_MARKET_HOURS_SECONDS, get_seconds_until_market_open())
+  # the key outlives the delay a little, so a worker restarting doesn't start a second loop
+  if conn.set(MARKET_DATA_PREFETCH_SCHEDULED_KEY, 1, nx=True, ex=delay_seconds + 60):
+    q = Queue(listen[-1], connection=conn)
+    return q.enqueue_in(
+      timedelta(seconds=delay_seconds),
+      _run_market_data_prefetch,
+      job_timeout=MARKET_DATA_PREFETCH_MARKET_HOURS_SECONDS,
+    )
+  return None
+
+def _prefetch_market_data_for_ticker(stockticker_name, maximum_option_days):
+  option_days = refresh_option_days(stockticker_name)
+  if option_days is None:
+    return
+  for option_day in option_days[:maximum_option_days]:
+    try:
+      refresh_option_chain(stockticker_name, option_day)
+    except Exception:
+      # yahoo failed on this one, the request path will try again
+      logger.warning('Prefetching the %s %s option chain failed', stockticker_name, option_day, exc_info=True)
+
+@record_job_duration
+def _run_market_data_prefetch():
+  # schedule the next run first, so a failure here doesn't stop the loop
+  conn.delete(MARKET_DATA_PREFETCH_SCHEDULED_KEY)
+  schedule_market_data_prefetch()
+
+  run_id = uuid4().hex.encode()
+  if not conn.set(MARKET_DATA_PREFETCH_RUNNING_KEY, run_id, nx=True, ex=MARKET_DATA_PREFETCH_MARKET_HOURS_SECONDS):
+    logger.info('Skipping the market data prefetch, the previous run is still going')
+    return
+  try:
+    _prefetch_market_data()
+  finally:
+    if conn.get(MARKET_DATA_PREFETCH_RUNNING_KEY) == run_id:
+      conn.delete(MARKET_DATA_PREFETCH_RUNNING_KEY)
+
+def _prefetch_market_data():
+  stockticker_names = list(StockTicker.objects.values_list('name', flat=True))
+  active_stockticker_names = set(
+    OptionWheel.objects.filter(is_active=True).values_list('stock_ticker__name', flat=True)
+  )
+  prefetch_recent_closes(stockticker_names, refresh=True)
+  maximum_option_days = [
+    MARKET_DATA_PREFETCH_ACTIVE_OPTION_DAYS if name in active_stockticker_names else MARKET_DATA_PREFETCH_OPTION_DAYS
+    for name in stockticker_names
+  ]
+  with ThreadPoolExecutor(max_workers=GLOBAL_PUT_MAX_WORKERS) as executor:
+    list(executor.map(_closing_connections(_prefetch_market_data_for_ticker), stockticker_names, maximum_option_days))
@@ -0,0 +1,171 @@
+import hashlib
+from datetime import date
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Max, Value
+from django.utils import timezone
+
+from .market_hours import get_market_data_timeout
+from .metrics import metrics
+from .models import CallCandidate, PutCandidate
+from .option_price_computation import (
+    YAHOO_FINANCE_LONG_CACHE_TIMEOUT,
+    _get_encoded_option_chain,
+    _get_option_days,
+    get_call_stats_for_ticker,
+    get_current_price,
+    get_earnings,
+    get_put_stats_for_ticker,
+)
+
+# The option tables read from PutCandidate/CallCandidate, which hold the full scan of every
+# ticker: the closest SCREENER_MAXIMUM_OPTION_DAYS expiries, SCREENER_OPTIONS_PER_DAY strikes
+# each. The worker refreshes every ticker with the global put comparison (see schedule_async.py),
+# and the data views refresh a ticker on demand when its scan is missing or stale, so the pages
+# only run indexed queries. A ticker is only repriced when something its candidates are
+# computed from changed, see get_candidate_inputs_hash, so a scan costs about as much as the
+# number of tickers that moved.
+
+SCREENER_MAXIMUM_OPTION_DAYS = 10
+SCREENER_OPTIONS_PER_DAY = 10
+# a scan is stale after this long while the market is open, like the global put comparison
+SCREENER_STALE_SECONDS = 10 * 60
+SCREENER_SCANNED_CACHE_KEY = 'screener_scanned_'
+SCREENER_INPUTS_CACHE_KEY = 'screener_inputs_'
+
+
+def _to_python(value):
+    # the stats tables hold numpy scalars, which the database drivers don't take
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _stats_table_to_candidates(model, stats_table, stock_ticker, scanned, current_price):
+    candidates = []
+    for stat in stats_table.to_dict('records'):
+        fields = {field: _to_python(stat[field]) for field in model.STAT_FIELDS if field in stat}
+        fields['current_price'] = float(current_price)
+        candidates.append(model(stock_ticker=stock_ticker, scanned=scanned, **fields))
+    return candidates
+
+
+def get_candidate_inputs_hash(stock_ticker):
+    """
+    A hash of everything the ticker's candidates are computed from: the price, the earnings date,
+    today (days to expiry count from it) and the encoded chains. None if yahoo has no price or expiries.
+    """
+    stockticker_name = stock_ticker.name
+    current_price = get_current_price(stockticker_name)
+    option_days = _get_option_days(stockticker_name, SCREENER_MAXIMUM_OPTION_DAYS)
+    if current_price is None or option_days is None:
+        return None
+    inputs = hashlib.sha1(repr((
+        float(current_price),
+        str(get_earnings(stockticker_name)),
+        date.today().isoformat(),
+        list(option_days),
+    )).encode())
+    for option_day in option_days:
+        option_chain = _get_encoded_option_chain(stockticker_name, option_day)
+        inputs.update(option_chain['calls'])
+        inputs.update(option_chain['puts'])
+    return inputs.hexdigest()
+
+
+def _mark_scanned(stock_ticker, scanned):
+    cache.set(SCREENER_SCANNED_CACHE_KEY + stock_ticker.name, scanned, get_market_data_timeout(SCREENER_STALE_SECONDS))
+
+
+def refresh_candidates(stock_ticker):
+    """
+    Rescans the ticker's options and replaces its candidates, unless nothing they're computed
+    from changed since the last scan. Returns False if there was no price.
+    """
+    inputs_hash = get_candidate_inputs_hash(stock_ticker)
+    if inputs_hash is None:
+        metrics.increment('screener_refreshes_total', result='failed')
+        return False
+    if inputs_hash == cache.get(SCREENER_INPUTS_CACHE_KEY + stock_ticker.name):
+        _mark_scanned(stock_ticker, timezone.now())
+        metrics.increment('screener_refreshes_total', result='unchanged')
+        return True
+    put_stats = get_put_stats_for_ticker(
+        stock_ticker,
+        maximum_option_days=SCREENER_MAXIMUM_OPTION_DAYS,
+        options_per_day_to_consider=SCREENER_OPTIONS_PER_DAY,
+    )
+    call_stats = get_call_stats_for_ticker(stock_ticker, maximum_option_days=SCREENER_MAXIMUM_OPTION_DAYS)
+    # yahoo failed, keep the last scan rather than emptying the tables
+    if put_stats['current_price'] is None or call_stats['current_price'] is None:
+        metrics.increment('screener_refreshes_total', result='failed')
+        return False
+    scanned = timezone.now()
+    put_candidates = _stats_table_to_candidates(
+        PutCandidate, put_stats['put_stats'], stock_ticker, scanned, put_stats['current_price']
+    )
+    call_candidates = _stats_table_to_candidates(
+        CallCandidate, call_stats['call_stats'], stock_ticker, scanned, call_stats['current_price']
+    )
+    with transaction.atomic():
+        PutCandidate.objects.filter(stock_ticker=stock_ticker).delete()
+        CallCandidate.objects.filter(stock_ticker=stock_ticker).delete()
+        PutCandidate.objects.bulk_create(put_candidates)
+        CallCandidate.objects.bulk_create(call_candidates)
+    _mark_scanned(stock_ticker, scanned)
+    cache.set(SCREENER_INPUTS_CACHE_KEY + stock_ticker.name, inputs_hash, YAHOO_FINANCE_LONG_CACHE_TIMEOUT)
+    metrics.increment('screener_refreshes_total', result='repriced')
+    return True
+
+
+def get_stale_stockticker_names(stockticker_names):
+    """The tickers that haven't been scanned recently, including the ones that never were"""
+    stockticker_names = list(stockticker_names)
+    scanned = cache.get_many([SCREENER_SCANNED_CACHE_KEY + name for name in stockticker_names])
+    return [name for name in stockticker_names if SCREENER_SCANNED_CACHE_KEY + name not in scanned]
+
+
+def refresh_stale_candidates(stock_ticker):
+    if get_stale_stockticker_names([stock_ticker.name]):
+        refresh_candidates(stock_ticker)
+
+
+def filter_candidates(candidates, min_odds=None, max_days_to_expiry=None, exclude_earnings=False):
+    """min_odds is a percentage, like the option tables' minimum odds box"""
+    if min_odds is not None:
+        candidates = candidates.filter(decimal_odds_out_of_the_money_implied__gt=min_odds / 100)
+    if max_days_to_expiry is not None:
+        candidates = candidates.filter(days_to_expiry__lte=max_days_to_expiry)
+    if exclude_earnings:
+        candidates = candidates.filter(includes_earnings=False)
+    return candidates
+
+
+def get_put_candidates(stock_ticker=None):
+    candidates = PutCandidate.objects.select_related('stock_ticker')
+    if stock_ticker is not None:
+        candidates = candidates.filter(stock_ticker=stock_ticker)
+    return candidates
+
+
+def get_call_candidates(stock_ticker, revenue, collateral, avoid_negative_returns=False):
+    """
+    The ticker's calls for a wheel. The wheel total return only depends on the wheel's revenue
+    and collateral, so it's computed by the query rather than stored.
+    """
+    revenue = Value(float(revenue), output_field=FloatField())
+    collateral = Value(float(collateral), output_field=FloatField())
+    candidates = CallCandidate.objects \
+        .select_related('stock_ticker') \
+        .filter(stock_ticker=stock_ticker) \
+        .annotate(wheel_total_max_profit_decimal=ExpressionWrapper(
+            (F('strike') - collateral + F('price') + revenue) / collateral,
+            output_field=FloatField(),
+        ))
+    if avoid_negative_returns:
+        candidates = candidates.filter(wheel_total_max_profit_decimal__gte=0)
+    return candidates
+
+
+def get_last_scanned():
+    """When the put candidates were last refreshed, or None if they never were"""
+    return PutCandidate.objects.aggregate(last_scanned=Max('scanned'))['last_scanned']
@@ -0,0 +1,59 @@
+from threading import Lock
+from weakref import WeakValueDictionary
+import time
+
+from django.core.cache import cache
+
+# When a popular cache entry expires, every request for it would otherwise hit yahoo at once.
+# single_flight makes sure only one fetch per cache key runs at a time: threads in this process
+# queue up on a local lock, and other processes see a lock entry in the shared cache and wait
+# for the result to show up instead.
+
+SINGLE_FLIGHT_LOCK_PREFIX = 'single_flight_lock_'
+# if the fetching process dies, the lock expires on its own after this long
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+# how long to wait for another process before giving up and fetching ourselves
+SINGLE_FLIGHT_WAIT_SECONDS = 10
+SINGLE_FLIGHT_POLL_SECONDS = 0.1
+
+_local_locks = WeakValueDictionary()
+_local_locks_lock = Lock()
+
+def _get_local_lock(cache_key):
+    with _local_locks_lock:
+        lock = _local_locks.get(cache_key)
+        if lock is None:
+            lock = Lock()
+            _local_locks[cache_key] = lock
+        return lock
+
+def _wait_for_other_process(cache_key):
+    deadline = time.time() + SINGLE_FLIGHT_WAIT_SECONDS
+    while time.time() < deadline:
+        time.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+        cached_result = cache.get(cache_key)
+        if cached_result is not None:
+            return cached_result
+        if cache.get(SINGLE_FLIGHT_LOCK_PREFIX + cache_key) is None:
+            # the other process finished without caching anything, e.g. yahoo failed
+            return None
+    return None
+
+# fetch should download the value and store it under cache_key itself, since the helpers
+# have their own rules about what is worth caching.
+def single_flight(cache_key, fetch):
+    with _get_local_lock(cache_key):
+        # another thread might have fetched it while we waited on the lock
+        cached_result = cache.get(cache_key)
+        if cached_result is not None:
+            return cached_result
+        lock_key = SINGLE_FLIGHT_LOCK_PREFIX + cache_key
+        if not cache.add(lock_key, True, SINGLE_FLIGHT_LOCK_TIMEOUT):
+            cached_result = _wait_for_other_process(cache_key)
+            if cached_result is not None:
+                return cached_result
+            return fetch()
+        try:
+            return fetch()
+        finally:
+            cache.delete(lock_key)
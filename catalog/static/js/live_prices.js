@@ -0,0 +1,79 @@
+// Keeps the prices on the page up to date with the price stream, see catalog/price_stream.py.
+// Elements with data-ticker and data-price-field show that field of the ticker's price, and
+// elements with data-wheel show the wheel's on track badge. The stream is reopened whenever
+// a table draws something else.
+const ON_TRACK_BADGES = {'Exit': 'success', 'Hold': 'warning', 'Under': 'danger'};
+
+function formatPriceField(field, price) {
+  if (field === 'price') {
+    return '$' + price.price.toFixed(2);
+  } else if (field === 'change') {
+    return price.change.toFixed(2);
+  }
+  return (price.percent_change * 100).toFixed(2) + '%';
+}
+
+$(document).ready(function () {
+  const streamUrl = $('body').data('price-stream-url');
+  let source = null;
+  let query = null;
+
+  function watch() {
+    const tickers = new Set();
+    $('[data-ticker]').each(function () {
+      tickers.add($(this).data('ticker'));
+    });
+    const wheels = $('[data-wheel]').map(function () {
+      return $(this).data('wheel');
+    }).get();
+    const params = {};
+    if (tickers.size) {
+      params.tickers = Array.from(tickers).sort().join(',');
+    }
+    if (wheels.length) {
+      params.wheels = wheels.join(',');
+    }
+    if ($('[data-global-put-comparison]').length) {
+      params.global_put_comparison = 1;
+    }
+    const newQuery = $.param(params);
+    if (newQuery === query) {
+      return;
+    }
+    query = newQuery;
+    if (source) {
+      source.close();
+      source = null;
+    }
+    if (!query) {
+      return;
+    }
+    source = new EventSource(streamUrl + '?' + query);
+    source.addEventListener('price', function (event) {
+      const price = JSON.parse(event.data);
+      $('[data-ticker="' + price.ticker + '"][data-price-field]').each(function () {
+        $(this).text(formatPriceField($(this).data('price-field'), price));
+      });
+    });
+    source.addEventListener('on_track', function (event) {
+      const update = JSON.parse(event.data);
+      const badge = $('<span>')
+        .addClass('badge badge-pill badge-' + ON_TRACK_BADGES[update.on_track])
+        .text(update.on_track);
+      $('[data-wheel="' + update.wheel + '"]').empty().append(badge);
+    });
+    source.addEventListener('global_put_comparison', function () {
+      const table = $('#option_detail_table');
+      if (table.length) {
+        // newer results replace the old ones in the table, without reloading the page
+        $('[data-global-put-comparison]').remove();
+        table.DataTable().ajax.reload(null, false);
+      } else {
+        location.reload();
+      }
+    });
+  }
+
+  watch();
+  $(document).on('draw.dt', watch);
+});
\ No newline at end of file
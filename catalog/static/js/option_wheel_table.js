@@ -1,3 +1,5 @@
 $(document).ready(function () {
-    $('table.wheel_table').DataTable();
+    $('table.wheel_table').each(function () {
+        $(this).DataTable(serverSideTableOptions($(this)));
+    });
 });
\ No newline at end of file
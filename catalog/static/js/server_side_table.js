@@ -0,0 +1,31 @@
+// Options for a DataTable that loads its rows a page at a time from the table's data-url,
+// see catalog/datatables.py. Columns are matched to the rows by their data-name, and only
+// the ones with data-orderable can be sorted. Every page comes back with a cursor for the
+// page after it, which is sent back so the server can continue from there.
+function serverSideTableOptions(table, extraParams) {
+  let cursor = null;
+  return {
+    "serverSide": true,
+    "processing": true,
+    "searchDelay": 400,
+    "columns": table.find('thead th').map(function () {
+      return {
+        "data": $(this).data('name'),
+        "orderable": $(this).data('orderable') === true
+      };
+    }).get(),
+    "ajax": {
+      "url": table.data('url'),
+      "data": function (data) {
+        data.cursor = cursor;
+        if (extraParams) {
+          Object.assign(data, extraParams());
+        }
+      },
+      "dataSrc": function (json) {
+        cursor = json.cursor;
+        return json.data;
+      }
+    }
+  };
+}
\ No newline at end of file
@@ -1,3 +1,986 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import mibian
+import numpy
+import pandas
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog.async_market_data import gather_market_data
+from catalog.implied_volatility import compute_implied_volatility_and_delta
+from catalog.business_day_count import busday_count_inclusive, busday_count_inclusive_array, is_business_day
+from catalog.market_data_store import (
+    OPTION_CHAIN_SNAPSHOT_LOOKBACK_DAYS,
+    get_latest_option_chain_snapshot,
+    get_stored_closes,
+    merge_closes,
+    save_closes,
+)
+from catalog.market_data_providers import (
+    ReplayProvider,
+    get_market_data_provider,
+    record_market_data,
+    set_market_data_provider,
+)
+from catalog.market_hours import get_market_data_timeout
+from catalog.metrics import MetricsRegistry
+from catalog.option_chain_encoding import OPTION_CHAIN_COLUMNS, decode_option_chain, encode_option_chain
+from catalog.option_price_computation import (
+    IMPOSSIBLE_BIDS_BUFFER_PERCENT_CALL,
+    IMPOSSIBLE_BIDS_BUFFER_PERCENT_PUT,
+    IMPOSSIBLE_IMPLIED_VOLATILITY,
+    MINIMUM_VOLUME,
+    _get_call_candidates_mask,
+    _get_effective_prices,
+    _get_encoded_option_chain,
+    _get_put_candidates_mask,
+    refresh_option_chain,
+)
+from catalog.models import (
+    Account,
+    DailyClose,
+    OptionChainSnapshot,
+    OptionPurchase,
+    OptionWheel,
+    PutCandidate,
+    StockTicker,
+)
+from catalog.price_stream import PriceStreamHub, PriceStreamSubscription
+from catalog import single_flight as single_flight_module
+from catalog.screener import get_stale_stockticker_names, refresh_candidates
+from catalog.tiered_cache import LocalLRUCache, TieredCache
+from catalog.views import _setup_context_for_total_profit
+
+
+# the manifest storage needs collectstatic to have run
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+@mock.patch('catalog.views.prefetch_recent_closes', mock.Mock())
+@mock.patch('catalog.models.get_current_price', mock.Mock(return_value=100))
+class WheelListQueryCountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='wheeler', password='wheeler-password')
+        self.account = Account.objects.create(user=self.user, name='Robinhood')
+        self.client.login(username='wheeler', password='wheeler-password')
+
+    def _create_wheels(self, count, is_active):
+        for i in range(count):
+            ticker = StockTicker.objects.create(name=f'T{is_active}{OptionWheel.objects.count()}')
+            wheel = OptionWheel.objects.create(
+                user=self.user,
+                stock_ticker=ticker,
+                account=self.account,
+                is_active=is_active,
+                total_profit=1,
+                total_days_active=5,
+                collatoral=90,
+            )
+            for weeks in range(3):
+                purchase_date = timezone.make_aware(datetime(2021, 1, 4) + timedelta(weeks=weeks))
+                OptionPurchase.objects.create(
+                    user=self.user,
+                    option_wheel=wheel,
+                    purchase_date=purchase_date,
+                    expiration_date=purchase_date.date() + timedelta(days=4),
+                    strike=90,
+                    price_at_date=95,
+                    premium=1,
+                    call_or_put='P' if weeks == 0 else 'C',
+                )
+
+    def _count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def _assert_constant_queries(self, url, is_active):
+        self._create_wheels(2, is_active)
+        few_wheels_queries = self._count_queries(url)
+        self._create_wheels(8, is_active)
+        self.assertEqual(self._count_queries(url), few_wheels_queries)
+
+    def test_my_active_wheels(self):
+        self._assert_constant_queries(reverse('my-active-wheels'), is_active=True)
+
+    def test_user_active_wheels(self):
+        self._assert_constant_queries(reverse('user-active-wheels', args=[self.user.pk]), is_active=True)
+
+    def test_all_active_wheels(self):
+        self._assert_constant_queries(reverse('all-active-wheels'), is_active=True)
+
+    def test_todays_active_wheels(self):
+        self._assert_constant_queries(reverse('todays-active-wheels'), is_active=True)
+
+    def test_my_completed_wheels(self):
+        self._assert_constant_queries(reverse('my-completed-wheels'), is_active=False)
+
+    def test_all_completed_wheels(self):
+        self._assert_constant_queries(reverse('all-completed-wheels'), is_active=False)
+
+    def test_total_profit(self):
+        self._assert_constant_queries(reverse('my-total-profit'), is_active=False)
+
+    def test_wheels_data(self):
+        url = reverse('wheels-data') + f'?active=1&user={self.user.pk}&length=5'
+        self._assert_constant_queries(url, is_active=True)
+        self._assert_constant_queries(reverse('wheels-data') + '?active=0&length=5', is_active=False)
+
+    def test_wheels_data_pages_with_cursor(self):
+        self._create_wheels(10, is_active=False)
+        # ordered by open date, which every wheel shares, so the pages are told apart by pk
+        params = {
+            'active': 0, 'length': 4, 'columns[0][data]': 'open_date', 'order[0][column]': 0, 'order[0][dir]': 'desc',
+        }
+        seen = []
+        cursor = ''
+        for start in range(0, 12, 4):
+            response = self.client.get(reverse('wheels-data'), dict(params, start=start, cursor=cursor)).json()
+            self.assertEqual(response['recordsTotal'], 10)
+            seen += [row['details'] for row in response['data']]
+            cursor = response['cursor']
+        self.assertIsNone(cursor)
+        expected = [
+            reverse('wheel-detail', kwargs={'pk': pk})
+            for pk in OptionWheel.objects.order_by('-pk').values_list('pk', flat=True)
+        ]
+        self.assertEqual([row.split('href="')[1].split('"')[0] for row in seen], expected)
+
+
+class WheelPurchaseSummaryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='wheeler')
+        self.wheel = OptionWheel.objects.create(
+            user=self.user,
+            stock_ticker=StockTicker.objects.create(name='TSLA'),
+            is_active=True,
+        )
+
+    def _create_purchase(self, purchase_date, strike, premium, call_or_put, option_wheel=None):
+        return OptionPurchase.objects.create(
+            user=self.user,
+            option_wheel=option_wheel or self.wheel,
+            purchase_date=timezone.make_aware(purchase_date),
+            expiration_date=purchase_date.date() + timedelta(days=4),
+            strike=strike,
+            price_at_date=strike,
+            premium=premium,
+            call_or_put=call_or_put,
+        )
+
+    def test_summary_follows_purchases(self):
+        put = self._create_purchase(datetime(2021, 1, 4), strike=90, premium=2, call_or_put='P')
+        call = self._create_purchase(datetime(2021, 1, 11), strike=95, premium=1, call_or_put='C')
+        wheel = OptionWheel.objects.get(pk=self.wheel.pk)
+        self.assertEqual(wheel.cost_basis, 87)
+        self.assertEqual(wheel.revenue, 3)
+        self.assertEqual(wheel.open_date, put.purchase_date.date())
+        self.assertEqual(wheel.open_strike, 90)
+        self.assertEqual(wheel.expiration_date, call.expiration_date)
+        self.assertEqual(wheel.days_active_so_far, 10)
+
+        call.premium = 3
+        call.save()
+        self.assertEqual(OptionWheel.objects.get(pk=self.wheel.pk).revenue, 5)
+
+        call.delete()
+        wheel = OptionWheel.objects.get(pk=self.wheel.pk)
+        self.assertEqual(wheel.revenue, 2)
+        self.assertEqual(wheel.expiration_date, put.expiration_date)
+
+        put.delete()
+        self.assertIsNone(OptionWheel.objects.get(pk=self.wheel.pk).cost_basis)
+
+    def test_moving_purchase_updates_both_wheels(self):
+        other_wheel = OptionWheel.objects.create(user=self.user, stock_ticker=self.wheel.stock_ticker, is_active=True)
+        put = self._create_purchase(datetime(2021, 1, 4), strike=90, premium=2, call_or_put='P')
+        put.option_wheel = other_wheel
+        put.save()
+        self.assertIsNone(OptionWheel.objects.get(pk=self.wheel.pk).cost_basis)
+        self.assertEqual(OptionWheel.objects.get(pk=other_wheel.pk).cost_basis, 88)
+
+    def test_queryset_writes_update_the_summary(self):
+        self._create_purchase(datetime(2021, 1, 4), strike=90, premium=2, call_or_put='P')
+        OptionPurchase.objects.bulk_create([OptionPurchase(
+            user=self.user,
+            option_wheel=self.wheel,
+            purchase_date=timezone.make_aware(datetime(2021, 1, 11)),
+            expiration_date=date(2021, 1, 15),
+            strike=95,
+            price_at_date=95,
+            premium=1,
+            call_or_put='C',
+        )])
+        self.assertEqual(OptionWheel.objects.get(pk=self.wheel.pk).revenue, 3)
+
+        OptionPurchase.objects.filter(call_or_put='C').update(premium=4)
+        self.assertEqual(OptionWheel.objects.get(pk=self.wheel.pk).revenue, 6)
+
+        OptionPurchase.objects.filter(call_or_put='C').delete()
+        wheel = OptionWheel.objects.get(pk=self.wheel.pk)
+        self.assertEqual(wheel.revenue, 2)
+        self.assertEqual(wheel.expiration_date, date(2021, 1, 8))
+
+    def test_days_active_so_far_is_computed_when_read(self):
+        self.assertIsNone(self.wheel.days_active_so_far)
+        self.wheel.open_date = date(2021, 1, 4)
+        self.wheel.expiration_date = date(2021, 1, 15)
+        self.assertEqual(self.wheel.days_active_so_far, 10)
+
+    def _clear_summary(self):
+        OptionWheel.objects.filter(pk=self.wheel.pk).update(
+            cost_basis=None, revenue=None, open_date=None, open_strike=None, expiration_date=None
+        )
+
+    def test_migration_backfills_the_summary(self):
+        put = self._create_purchase(datetime(2021, 1, 4), strike=90, premium=2, call_or_put='P')
+        call = self._create_purchase(datetime(2021, 1, 11), strike=95, premium=1, call_or_put='C')
+        self._clear_summary()
+        backfill_migration = importlib.import_module('catalog.migrations.0011_backfill_wheel_purchase_summaries')
+        backfill_migration.backfill_purchase_summaries(apps, None)
+        wheel = OptionWheel.objects.get(pk=self.wheel.pk)
+        self.assertEqual(wheel.cost_basis, 87)
+        self.assertEqual(wheel.revenue, 3)
+        self.assertEqual(wheel.open_date, put.purchase_date.date())
+        self.assertEqual(wheel.open_strike, 90)
+        self.assertEqual(wheel.expiration_date, call.expiration_date)
+
+    def test_add_purchase_data_fills_in_a_missing_summary(self):
+        self._create_purchase(datetime(2021, 1, 4), strike=90, premium=2, call_or_put='P')
+        self._clear_summary()
+        wheel = OptionWheel.objects.get(pk=self.wheel.pk)
+        wheel.add_purchase_data(fetch_price=False)
+        self.assertEqual(wheel.profit_if_exits_here, 2)
+        self.assertEqual(OptionWheel.objects.get(pk=self.wheel.pk).cost_basis, 88)
+
+
+class TotalProfitTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='wheeler')
+        stock_ticker = StockTicker.objects.create(name='TSLA')
+        for open_date, expiration_date, collateral, quantity, profit in (
+            (date(2021, 1, 4), date(2021, 1, 8), '90', 2, '1.5'),
+            # spans Martin Luther King Jr. Day, 2021-01-18
+            (date(2021, 1, 15), date(2021, 1, 19), '50.25', 1, '-0.5'),
+            # opens and expires on the same day, which another wheel also expires on
+            (date(2021, 1, 8), date(2021, 1, 8), '30', 1, '0.75'),
+            (date(2021, 2, 1), date(2021, 2, 2), '12.5', 3, '0.2'),
+        ):
+            OptionWheel.objects.create(
+                user=user,
+                stock_ticker=stock_ticker,
+                is_active=False,
+                quantity=quantity,
+                total_profit=Decimal(profit),
+                collatoral=Decimal(collateral),
+                total_days_active=busday_count_inclusive(open_date, expiration_date),
+                open_date=open_date,
+                expiration_date=expiration_date,
+            )
+        self.wheels = OptionWheel.objects.filter(user=user)
+
+    def _reference(self):
+        # the old way: walk every wheel's business days
+        collateral_on_the_line_per_day = defaultdict(float)
+        profit_per_day = defaultdict(float)
+        for wheel in self.wheels:
+            profit_per_day[wheel.expiration_date.strftime('%Y-%m-%d')] += float(wheel.total_profit * wheel.quantity)
+            day = wheel.open_date
+            while day <= wheel.expiration_date:
+                if is_business_day(day):
+                    collateral_on_the_line_per_day[day.strftime('%Y-%m-%d')] += float(wheel.collateral * wheel.quantity)
+                day += timedelta(days=1)
+        return collateral_on_the_line_per_day, profit_per_day
+
+    def test_matches_the_per_day_loop(self):
+        context = _setup_context_for_total_profit(self.wheels, {})
+        collateral_on_the_line_per_day, profit_per_day = self._reference()
+
+        collateral_result = json.loads(context['collateral_on_the_line_per_day'])
+        self.assertEqual([day for day, _ in collateral_result], sorted(collateral_on_the_line_per_day))
+        for day, collateral in collateral_result:
+            self.assertAlmostEqual(collateral, collateral_on_the_line_per_day[day])
+        self.assertNotIn('2021-01-18', dict(collateral_result))
+        self.assertAlmostEqual(dict(collateral_result)['2021-01-08'], 210)
+
+        profit_result = json.loads(context['profit_per_day'])
+        self.assertEqual([day for day, _ in profit_result], sorted(profit_per_day))
+        for day, profit in profit_result:
+            self.assertAlmostEqual(profit, profit_per_day[day])
+
+        self.assertAlmostEqual(context['max_collateral'], max(collateral_on_the_line_per_day.values()))
+
+
+@override_settings(MARKET_OPEN_HOUR=6, MARKET_CLOSE_HOUR=13)
+class MarketDataTimeoutTest(TestCase):
+    def test_short_timeout_while_trading(self):
+        # Friday during trading, and right after the close while prices settle
+        self.assertEqual(get_market_data_timeout(300, datetime(2026, 10, 16, 12, 58)), 300)
+        self.assertEqual(get_market_data_timeout(300, datetime(2026, 10, 16, 13, 5)), 300)
+
+    def test_kept_until_next_open(self):
+        # Friday evening and Saturday both last until Monday's open
+        friday_evening = datetime(2026, 10, 16, 20)
+        saturday = datetime(2026, 10, 17, 9)
+        monday_open = datetime(2026, 10, 19, 6)
+        self.assertEqual(get_market_data_timeout(300, friday_evening), (monday_open - friday_evening).total_seconds())
+        self.assertEqual(get_market_data_timeout(300, saturday), (monday_open - saturday).total_seconds())
+        # never shorter than the trading timeout
+        self.assertEqual(get_market_data_timeout(300, datetime(2026, 10, 19, 5, 59)), 300)
+
+
+class MarketDataStoreTest(TestCase):
+    def _closes(self, start, values):
+        dates = pandas.bdate_range(start, periods=len(values))
+        return pandas.Series(values, index=pandas.DatetimeIndex(dates, name='Date'), name='Close')
+
+    @mock.patch('catalog.market_data_store.timezone')
+    def test_later_fetch_wins_for_overlapping_days(self, timezone_mock):
+        timezone_mock.now.side_effect = [timezone.now() - timedelta(hours=1), timezone.now()]
+        StockTicker.objects.create(name='TSLA')
+        today = datetime.now().date()
+        first_fetch = self._closes(today - timedelta(days=7), [1.0, 2.0, 3.0])
+        save_closes({'TSLA': first_fetch})
+        # the next fetch starts at the last stored day, which may have changed since
+        stored_closes, _ = get_stored_closes(['TSLA'])['TSLA']
+        second_fetch = self._closes(stored_closes.index[-1], [4.0, 5.0])
+        save_closes({'TSLA': second_fetch})
+
+        stored_closes, _ = get_stored_closes(['TSLA'])['TSLA']
+        self.assertEqual(stored_closes.tolist(), [1.0, 2.0, 4.0, 5.0])
+        self.assertEqual(merge_closes(first_fetch, second_fetch).tolist(), [1.0, 2.0, 4.0, 5.0])
+        # both fetches of the overlapping day are kept
+        self.assertEqual(DailyClose.objects.count(), 5)
+
+    @mock.patch('catalog.option_price_computation._request_market_data')
+    def test_only_the_prefetch_saves_snapshots(self, request_market_data):
+        cache.clear()
+        StockTicker.objects.create(name='TSLA')
+        option_chain = pandas.DataFrame([[90, 1.5, 1.4, 1.6, 120, 0.45]], columns=OPTION_CHAIN_COLUMNS)
+        request_market_data.return_value = (option_chain, option_chain)
+        _get_encoded_option_chain('TSLA', '2099-01-02')
+        self.assertFalse(OptionChainSnapshot.objects.exists())
+        refresh_option_chain('TSLA', '2099-01-02')
+        refresh_option_chain('TSLA', '2099-01-02')
+        # every snapshot is kept, the latest one is served
+        snapshots = list(OptionChainSnapshot.objects.all())
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual(get_latest_option_chain_snapshot('TSLA', '2099-01-02'), snapshots[-1])
+
+    def test_old_snapshots_are_not_served(self):
+        OptionChainSnapshot.objects.create(
+            stock_ticker=StockTicker.objects.create(name='TSLA'),
+            expiration_date=date(2099, 1, 2),
+            fetched=timezone.now() - timedelta(days=OPTION_CHAIN_SNAPSHOT_LOOKBACK_DAYS + 1),
+            calls=b'',
+            puts=b'',
+        )
+        self.assertIsNone(get_latest_option_chain_snapshot('TSLA', '2099-01-02'))
+
+
+class _RecordedProvider:
+    option_chain = pandas.DataFrame([[90, 1.5, 1.4, 1.6, 120, 0.45], [95, 3.25, 3.2, 3.4, 40, 0.5]], columns=OPTION_CHAIN_COLUMNS)
+
+    def get_option_days(self, stockticker_name):
+        return ('2021-01-08', '2021-01-15')
+
+    def get_option_chain(self, stockticker_name, option_day):
+        return self.option_chain, self.option_chain * 2
+
+    def get_closes(self, stockticker_name, period=None, start=None):
+        return pandas.Series([100.0, 101.5], index=pandas.DatetimeIndex(['2021-01-04', '2021-01-05'], name='Date'), name='Close')
+
+    def get_earnings_date(self, stockticker_name):
+        return pandas.Timestamp('2021-01-27')
+
+
+class ReplayProviderTest(TestCase):
+    def setUp(self):
+        recordings_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(recordings_directory.cleanup)
+        self.directory = recordings_directory.name
+        self.assertEqual(record_market_data(_RecordedProvider(), ['TSLA'], self.directory), ['TSLA'])
+        self.addCleanup(set_market_data_provider, None)
+
+    def test_replays_the_recording(self):
+        provider = ReplayProvider(self.directory, shift_dates=False)
+        self.assertEqual(provider.get_option_days('TSLA'), ('2021-01-08', '2021-01-15'))
+        calls, puts = provider.get_option_chain('TSLA', '2021-01-15')
+        pandas.testing.assert_frame_equal(calls, _RecordedProvider.option_chain.astype(float))
+        pandas.testing.assert_frame_equal(puts, (_RecordedProvider.option_chain * 2).astype(float))
+        self.assertEqual(provider.get_closes('TSLA').tolist(), [100.0, 101.5])
+        self.assertEqual(provider.get_earnings_date('TSLA'), pandas.Timestamp('2021-01-27'))
+
+    def test_replay_directory_setting(self):
+        with override_settings(
+            MARKET_DATA_PROVIDER='replay', MARKET_DATA_REPLAY_DIRECTORY=self.directory, MARKET_DATA_REPLAY_LATENCY_SECONDS=0
+        ):
+            set_market_data_provider(None)
+            provider = get_market_data_provider()
+        self.assertIsInstance(provider, ReplayProvider)
+        # recorded today, so the dates aren't shifted
+        self.assertEqual(provider.get_option_days('TSLA'), ('2021-01-08', '2021-01-15'))
+
+    def test_missing_recording(self):
+        provider = ReplayProvider(self.directory, shift_dates=False)
+        self.assertEqual(provider.get_option_days('AAPL'), ())
+        self.assertTrue(provider.get_closes('AAPL').empty)
+        self.assertIsNone(provider.get_earnings_date('AAPL'))
+        with self.assertRaises(ValueError):
+            provider.get_option_chain('AAPL', '2021-01-15')
+        with self.assertRaises(ValueError):
+            provider.get_option_chain('TSLA', '2021-01-22')
+
+
+class MetricsRegistryTest(TestCase):
+    def test_render(self):
+        registry = MetricsRegistry()
+        registry.increment('cache_lookups_total', family='get_earnings', result='miss')
+        registry.observe('market_data_request_seconds', 0.3, call='get_option_chain')
+        # without redis the samples stay in this process
+        with mock.patch.object(registry, '_get_connection', side_effect=ConnectionError):
+            rendered = registry.render()
+        self.assertIn('# TYPE cache_lookups_total counter', rendered)
+        self.assertIn('cache_lookups_total{family="get_earnings",result="miss"} 1', rendered)
+        self.assertIn('market_data_request_seconds_bucket{call="get_option_chain",le="0.25"} 0', rendered)
+        self.assertIn('market_data_request_seconds_bucket{call="get_option_chain",le="0.5"} 1', rendered)
+        self.assertIn('market_data_request_seconds_count{call="get_option_chain"} 1', rendered)
+
+
+class TieredCacheTest(TestCase):
+    def setUp(self):
+        self.shared = LocMemCache('tiered-cache-test', {})
+        self.local = LocalLRUCache(max_entries=2)
+        self.cache = TieredCache(self.shared, self.local)
+
+    def test_evicts_least_recently_used(self):
+        self.local.set('a', 1, 30)
+        self.local.set('b', 2, 30)
+        self.local.get('a')
+        self.local.set('c', 3, 30)
+        self.assertEqual(len(self.local), 2)
+        self.assertIsNone(self.local.get('b'))
+        self.assertEqual(self.local.get('a'), 1)
+        self.assertEqual(self.local.get('c'), 3)
+
+    @mock.patch('catalog.tiered_cache.time')
+    def test_entries_expire_after_their_timeout(self, time_mock):
+        time_mock.monotonic.return_value = 100
+        self.local.set('a', 1, 5)
+        time_mock.monotonic.return_value = 104
+        self.assertEqual(self.local.get('a'), 1)
+        time_mock.monotonic.return_value = 105
+        self.assertIsNone(self.local.get('a'))
+        self.assertEqual(len(self.local), 0)
+
+    def test_falls_through_to_the_shared_cache(self):
+        self.shared.set('get_earnings_TSLA', 'earnings')
+        self.assertEqual(self.cache.get('get_earnings_TSLA'), 'earnings')
+        self.assertEqual(self.cache.get('get_earnings_TSLA'), 'earnings')
+        self.assertIsNone(self.cache.get('get_earnings_AAPL'))
+        self.assertEqual(self.cache.get_many(['get_earnings_TSLA', 'get_earnings_AAPL']), {'get_earnings_TSLA': 'earnings'})
+        stats = self.cache.stats()
+        self.assertEqual((stats['local_hits'], stats['shared_hits'], stats['misses']), (2, 1, 2))
+
+    def test_counts_every_lookup_across_threads(self):
+        self.cache.set('get_earnings_TSLA', 'earnings')
+
+        def lookup():
+            for _ in range(500):
+                self.cache.get('get_earnings_TSLA')
+
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.stats()['local_hits'], 4000)
+
+
+class OptionChainEncodingTest(TestCase):
+    def _option_chain(self, rows):
+        option_chain = pandas.DataFrame(rows, columns=OPTION_CHAIN_COLUMNS, dtype=float)
+        # yfinance columns the encoding drops
+        option_chain['contractSymbol'] = 'TSLA210115P00090000'
+        return option_chain
+
+    def test_round_trip(self):
+        option_chain = self._option_chain([
+            [90, 1.5, 1.4, 1.6, 120, 0.45],
+            [95, 3.25, numpy.nan, 3.4, numpy.nan, 0.5],
+        ])
+        for compress in (True, False):
+            decoded = decode_option_chain(encode_option_chain(option_chain, compress=compress))
+            pandas.testing.assert_frame_equal(decoded, option_chain[OPTION_CHAIN_COLUMNS])
+            self.assertTrue(numpy.isnan(decoded['bid'][1]))
+            self.assertTrue(numpy.isnan(decoded['volume'][1]))
+
+    def test_empty_chain(self):
+        decoded = decode_option_chain(encode_option_chain(self._option_chain([])))
+        self.assertEqual(list(decoded.columns), OPTION_CHAIN_COLUMNS)
+        self.assertEqual(len(decoded), 0)
+
+    def test_rejects_other_headers(self):
+        encoded = encode_option_chain(self._option_chain([[90, 1.5, 1.4, 1.6, 120, 0.45]]))
+        with self.assertRaises(ValueError):
+            decode_option_chain(b'XYZ' + encoded[3:])
+        with self.assertRaises(ValueError):
+            decode_option_chain(encoded[:3] + bytes([encoded[3] + 1]) + encoded[4:])
+
+
+class BusinessDayCountTest(TestCase):
+    def test_skips_holidays(self):
+        # Good Friday 2021 is Apr 2, Memorial Day 2021 is May 31
+        self.assertEqual(busday_count_inclusive(datetime(2021, 3, 29).date(), datetime(2021, 4, 5).date()), 5)
+        self.assertEqual(busday_count_inclusive(datetime(2021, 5, 28).date(), datetime(2021, 6, 1).date()), 2)
+        self.assertEqual(busday_count_inclusive(datetime(2021, 1, 4).date(), datetime(2021, 1, 4).date()), 1)
+
+    def test_array_matches_scalar(self):
+        start_dates = [datetime(2021, 3, 29).date(), datetime(2021, 1, 4).date(), datetime(1999, 12, 1).date()]
+        end_dates = [datetime(2021, 4, 5).date(), datetime(2021, 1, 4).date(), datetime(2000, 1, 31).date()]
+        self.assertEqual(
+            busday_count_inclusive_array(start_dates, end_dates).tolist(),
+            [busday_count_inclusive(start, end) for start, end in zip(start_dates, end_dates)],
+        )
+
+
+@mock.patch('catalog.price_stream.prefetch_recent_closes', mock.Mock())
+@mock.patch('catalog.price_stream.get_current_price', mock.Mock(return_value=100))
+@mock.patch('catalog.price_stream.get_previous_close_price', mock.Mock(return_value=98))
+class PriceStreamTest(TestCase):
+    def test_price_stream_view(self):
+        user = User.objects.create_user(username='wheeler')
+        wheel = OptionWheel.objects.create(user=user, stock_ticker=StockTicker.objects.create(name='TSLA'), is_active=True)
+        OptionPurchase.objects.create(
+            user=user,
+            option_wheel=wheel,
+            purchase_date=timezone.now(),
+            expiration_date=timezone.now().date(),
+            strike=95,
+            price_at_date=96,
+            premium=1,
+            call_or_put='P',
+        )
+        response = self.client.get(reverse('price-stream'), {'tickers': 'tsla,UNKNOWN', 'wheels': f'{wheel.pk},x'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.content.decode()
+        self.assertIn('event: price\ndata: {"ticker": "TSLA", "price": 100.0, "change": 2.0, "percent_change": 0.02}', content)
+        self.assertIn(f'event: on_track\ndata: {{"wheel": {wheel.pk}, "on_track": "Exit"}}', content)
+        self.assertNotIn('UNKNOWN', content)
+
+    def test_hub_polls_once_for_every_stream(self):
+        updates = mock.Mock(return_value=({'TSLA': {'ticker': 'TSLA', 'price': 100.0}}, False))
+
+        async def stream_twice():
+            hub = PriceStreamHub(poll_seconds=60)
+            subscriptions = [hub.subscribe(PriceStreamSubscription({'TSLA'}, {})) for _ in range(2)]
+            events = [await asyncio.wait_for(subscription.queue.get(), 5) for subscription in subscriptions]
+            for subscription in subscriptions:
+                hub.unsubscribe(subscription)
+            hub._poll_task.cancel()
+            return events
+
+        with mock.patch('catalog.price_stream._get_updates', updates):
+            events = asyncio.run(stream_twice())
+        self.assertEqual(updates.call_count, 1)
+        self.assertEqual(events, ['event: price\ndata: {"ticker": "TSLA", "price": 100.0}\n\n'] * 2)
+
+
+class AsyncMarketDataTest(TestCase):
+    def test_fetches_concurrently(self):
+        in_flight = []
+        most_in_flight = []
+        lock = threading.Lock()
+
+        def fetch(*args):
+            with lock:
+                in_flight.append(args)
+                most_in_flight.append(len(in_flight))
+            time.sleep(0.2)
+            with lock:
+                in_flight.remove(args)
+
+        option_days = ['2021-01-08', '2021-01-15', '2021-01-22', '2021-01-29', '2021-02-05']
+        with mock.patch('catalog.async_market_data.prefetch_recent_closes', side_effect=fetch), \
+                mock.patch('catalog.async_market_data.get_earnings', side_effect=fetch), \
+                mock.patch('catalog.async_market_data._get_option_days', return_value=option_days), \
+                mock.patch('catalog.async_market_data._get_encoded_option_chain', side_effect=fetch) as get_chain:
+            start = time.monotonic()
+            asyncio.run(gather_market_data(['TSLA'], earnings=True, maximum_option_days=5))
+            elapsed = time.monotonic() - start
+        self.assertEqual(get_chain.call_count, 5)
+        self.assertGreater(max(most_in_flight), 2)
+        # 7 fetches one after the other would take 1.4s
+        self.assertLess(elapsed, 1)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_ticker_detail(self):
+        ticker = StockTicker.objects.create(name='TSLA')
+        with mock.patch('catalog.async_market_data.gather_market_data') as gather, \
+                mock.patch('catalog.views.get_current_price', return_value=100), \
+                mock.patch('catalog.views.get_earnings', return_value=None):
+            response = self.client.get(reverse('ticker-detail', args=[ticker.pk]))
+        self.assertEqual(response.status_code, 200)
+        gather.assert_called_once_with(['TSLA'], True, 0)
+
+
+class ScreenerTest(TestCase):
+    def _put_stats(self, strikes):
+        return pandas.DataFrame({
+            'strike': strikes,
+            'price': [1.0] * len(strikes),
+            'expiration_date': ['2021-01-15'] * len(strikes),
+            'days_to_expiry': [5] * len(strikes),
+            'max_profit_decimal': [0.01] * len(strikes),
+            'decimal_odds_out_of_the_money_implied': [0.8] * len(strikes),
+            'annualized_rate_of_return_decimal': [1.5] * len(strikes),
+            'current_price': [100.0] * len(strikes),
+            'includes_earnings': [False] * len(strikes),
+        })
+
+    def test_refresh_replaces_candidates(self):
+        cache.delete_many(['screener_inputs_TSLA', 'screener_scanned_TSLA'])
+        ticker = StockTicker.objects.create(name='TSLA')
+        call_stats = {'call_stats': pandas.DataFrame(), 'current_price': 100.0}
+        inputs_hashes = ['first', 'second', 'second', None]
+        with mock.patch('catalog.screener.get_call_stats_for_ticker', return_value=call_stats), \
+                mock.patch('catalog.screener.get_put_stats_for_ticker') as get_put_stats, \
+                mock.patch('catalog.screener.get_candidate_inputs_hash', side_effect=inputs_hashes):
+            get_put_stats.return_value = {'put_stats': self._put_stats([90.0, 95.0]), 'current_price': 100.0}
+            refresh_candidates(ticker)
+            get_put_stats.return_value = {'put_stats': self._put_stats([85.0]), 'current_price': 100.0}
+            refresh_candidates(ticker)
+            # the inputs didn't change, so there's nothing to reprice
+            get_put_stats.return_value = {'put_stats': self._put_stats([80.0]), 'current_price': 100.0}
+            refresh_candidates(ticker)
+            # a failed download keeps the last scan
+            refresh_candidates(ticker)
+        self.assertEqual(get_put_stats.call_count, 2)
+        self.assertEqual(list(PutCandidate.objects.values_list('strike', flat=True)), [85.0])
+        self.assertEqual(get_stale_stockticker_names(['TSLA', 'AAPL']), ['AAPL'])
+
+    def test_global_put_comparison_data(self):
+        scanned = timezone.now()
+        for name in ['TSLA', 'AAPL', 'MSFT']:
+            ticker = StockTicker.objects.create(name=name)
+            for day in range(3):
+                PutCandidate.objects.create(
+                    stock_ticker=ticker,
+                    scanned=scanned,
+                    strike=90,
+                    price=1,
+                    current_price=100,
+                    expiration_date=scanned.date() + timedelta(days=day),
+                    days_to_expiry=day + 1,
+                    decimal_odds_out_of_the_money_implied=0.9 - day * 0.1,
+                    annualized_rate_of_return_decimal=1 + day,
+                    includes_earnings=name == 'MSFT',
+                    max_profit_decimal=0.01,
+                )
+        response = self.client.get(reverse('global-put-comparison-data'), {
+            'length': 2,
+            'min_odds': 75,
+            'max_days': 2,
+            'exclude_earnings': 1,
+        })
+        content = response.json()
+        self.assertEqual(content['recordsTotal'], 9)
+        self.assertEqual(content['recordsFiltered'], 4)
+        # only the first two expiries of TSLA and AAPL pass the filters, best annualized return first
+        self.assertEqual([row['annualized_return'] for row in content['data']], ['2.00x', '2.00x'])
+        next_page = self.client.get(reverse('global-put-comparison-data'), {
+            'length': 2,
+            'start': 2,
+            'min_odds': 75,
+            'max_days': 2,
+            'exclude_earnings': 1,
+            'cursor': content['cursor'],
+        }).json()
+        self.assertEqual([row['annualized_return'] for row in next_page['data']], ['1.00x', '1.00x'])
+
+
+class MarketDataPrefetchTest(TestCase):
+    def test_failed_chain_is_logged_and_skipped(self):
+        from catalog.schedule_async import _prefetch_market_data_for_ticker
+        option_days = ['2021-01-08', '2021-01-15', '2021-01-22']
+        with mock.patch('catalog.schedule_async.refresh_option_days', return_value=option_days), \
+                mock.patch('catalog.schedule_async.refresh_option_chain', side_effect=[ValueError, None]) as refresh_chain, \
+                self.assertLogs('catalog.schedule_async', 'WARNING') as logs:
+            _prefetch_market_data_for_ticker('TSLA', 2)
+        self.assertEqual(refresh_chain.call_args_list, [mock.call('TSLA', '2021-01-08'), mock.call('TSLA', '2021-01-15')])
+        self.assertIn('TSLA 2021-01-08', logs.output[0])
+
+    def test_overlapping_runs_are_skipped(self):
+        from catalog.schedule_async import MARKET_DATA_PREFETCH_RUNNING_KEY, _run_market_data_prefetch
+        fake_redis = FakeRedis()
+        with mock.patch('catalog.schedule_async.conn', fake_redis), \
+                mock.patch('catalog.schedule_async.schedule_market_data_prefetch') as schedule, \
+                mock.patch('catalog.schedule_async._prefetch_market_data') as prefetch:
+            fake_redis.set(MARKET_DATA_PREFETCH_RUNNING_KEY, b'another run')
+            _run_market_data_prefetch()
+            self.assertFalse(prefetch.called)
+            self.assertEqual(fake_redis.values, {MARKET_DATA_PREFETCH_RUNNING_KEY: b'another run'})
+
+            fake_redis.delete(MARKET_DATA_PREFETCH_RUNNING_KEY)
+            prefetch.side_effect = lambda: self.assertIn(MARKET_DATA_PREFETCH_RUNNING_KEY, fake_redis.values)
+            _run_market_data_prefetch()
+            self.assertTrue(prefetch.called)
+            self.assertEqual(fake_redis.values, {})
+        self.assertEqual(schedule.call_count, 2)
+
+
+class ImpliedVolatilityTest(TestCase):
+    def test_matches_mibian(self):
+        strikes = [80.0, 95.0, 100.0, 105.0, 120.0]
+        for is_call in (True, False):
+            models = [mibian.BS([100, strike, 1, 20], volatility=40) for strike in strikes]
+            prices = [model.callPrice if is_call else model.putPrice for model in models]
+            volatility, delta = compute_implied_volatility_and_delta(100.0, strikes, 1, 20, prices, is_call)
+            numpy.testing.assert_allclose(volatility, 0.4, atol=0.005)
+            expected_delta = [model.callDelta if is_call else model.putDelta for model in models]
+            numpy.testing.assert_allclose(delta, expected_delta, atol=0.005)
+
+    def test_bisects_when_newton_leaves_the_bracket(self):
+        # far out of the money, vega at the first guess is about 0 so the newton step is useless
+        price = mibian.BS([100, 60, 1, 5], volatility=250).putPrice
+        volatility, _ = compute_implied_volatility_and_delta(100.0, [60.0], 1, 5, [price], False)
+        numpy.testing.assert_allclose(volatility, 2.5, atol=0.01)
+
+    def test_unsolvable_options_are_nan(self):
+        # below intrinsic value, no price at all, and a broken strike
+        volatility, delta = compute_implied_volatility_and_delta(100.0, [150.0, 95.0, 0.0], 1, 20, [40.0, 0.0, 1.0], False)
+        self.assertTrue(numpy.isnan(volatility).all())
+        self.assertTrue(numpy.isnan(delta).all())
+
+    def test_expiring_today_is_nan(self):
+        volatility, delta = compute_implied_volatility_and_delta(100.0, [95.0, 105.0], 1, 0, [1.0, 6.0], False)
+        self.assertTrue(numpy.isnan(volatility).all())
+        self.assertTrue(numpy.isnan(delta).all())
+
+
+class CandidatesMaskTest(TestCase):
+    # The row by row checks the masks replaced, True if the option is a candidate
+    def _is_candidate(self, current_price, option, is_call):
+        if option.volume < MINIMUM_VOLUME or numpy.isnan(option.volume):
+            return False
+        if option.impliedVolatility == 0:
+            return False
+        effective_price = option.lastPrice
+        if (option.bid == 0 and option.ask == 0) == False:
+            effective_price = option.bid
+        if effective_price == 0 or numpy.isnan(effective_price):
+            return False
+        if is_call and option.strike + effective_price < current_price * IMPOSSIBLE_BIDS_BUFFER_PERCENT_CALL:
+            return False
+        if not is_call and option.strike > (current_price * IMPOSSIBLE_BIDS_BUFFER_PERCENT_PUT) + effective_price:
+            return False
+        if effective_price > option.lastPrice * 1.1 or effective_price < option.lastPrice * 0.9:
+            return False
+        if is_call and option.impliedVolatility > IMPOSSIBLE_IMPLIED_VOLATILITY:
+            return False
+        return True
+
+    def _options(self):
+        nan = float('nan')
+        # strike, lastPrice, bid, ask, volume, impliedVolatility
+        rows = [
+            (95, 1.0, 1.0, 1.1, 100, 0.4),
+            (95, 1.0, 1.0, 1.1, MINIMUM_VOLUME, 0.4),
+            (95, 1.0, 1.0, 1.1, MINIMUM_VOLUME - 1, 0.4),
+            (95, 1.0, 1.0, 1.1, nan, 0.4),
+            (95, 1.0, 1.0, 1.1, 100, 0),
+            (95, 1.0, 0, 0, 100, 0.4),
+            (95, 0, 0, 0, 100, 0.4),
+            (95, 1.0, nan, 1.1, 100, 0.4),
+            # stale prices, right on and just past the 10% limits
+            (95, 1.0, 1.1, 1.2, 100, 0.4),
+            (95, 1.0, 1.11, 1.2, 100, 0.4),
+            (95, 1.0, 0.9, 1.0, 100, 0.4),
+            (95, 1.0, 0.89, 1.0, 100, 0.4),
+            # put strikes right on and just past current price * 0.99 + price
+            (100, 1.0, 1.0, 1.1, 100, 0.4),
+            (100.01, 1.0, 1.0, 1.1, 100, 0.4),
+            # call strikes right on and just under current price * 1.01 - price
+            (100, 1.0, 1.0, 1.1, 100, 0.4),
+            (99.99, 1.0, 1.0, 1.1, 100, 0.4),
+            (105, 1.0, 1.0, 1.1, 100, 0.4),
+            # call implied volatility right on and just past the limit
+            (105, 1.0, 1.0, 1.1, 100, IMPOSSIBLE_IMPLIED_VOLATILITY),
+            (105, 1.0, 1.0, 1.1, 100, IMPOSSIBLE_IMPLIED_VOLATILITY + 0.01),
+        ]
+        return pandas.DataFrame(rows, columns=['strike', 'lastPrice', 'bid', 'ask', 'volume', 'impliedVolatility'])
+
+    def test_masks_match_row_checks(self):
+        options = self._options()
+        effective_prices = _get_effective_prices(options)
+        for is_call, get_mask in ((False, _get_put_candidates_mask), (True, _get_call_candidates_mask)):
+            expected = [self._is_candidate(100.0, option, is_call) for option in options.itertuples()]
+            self.assertEqual(list(get_mask(100.0, options, effective_prices)), expected)
+        # the boundaries themselves are candidates
+        self.assertTrue(_get_put_candidates_mask(100.0, options, effective_prices)[[8, 10, 12]].all())
+        self.assertTrue(_get_call_candidates_mask(100.0, options, effective_prices)[[14, 17]].all())
+
+
+# The few redis commands the shard bookkeeping uses
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def decr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) - 1
+        return self.values[key]
+
+    def delete(self, key):
+        return int(self.values.pop(key, None) is not None)
+
+
+class GlobalPutComparisonTest(TestCase):
+    def test_worker_threads_close_their_connections(self):
+        from catalog.schedule_async import _refresh_candidates
+        closed_by = []
+        tickers = [StockTicker(name='TSLA'), StockTicker(name='AAPL')]
+        with mock.patch('catalog.schedule_async.refresh_candidates', side_effect=[True, ValueError]), \
+                mock.patch('catalog.schedule_async.connections') as connections:
+            connections.close_all.side_effect = lambda: closed_by.append(threading.get_ident())
+            with self.assertRaises(ValueError):
+                _refresh_candidates(tickers)
+        self.assertEqual(len(closed_by), 2)
+        self.assertNotIn(threading.get_ident(), closed_by)
+
+    def test_failed_shard_still_finishes_the_scan(self):
+        from catalog import schedule_async
+        tickers = [StockTicker.objects.create(name=name) for name in ['TSLA', 'AAPL']]
+        fake_conn = FakeRedis()
+        with mock.patch.object(schedule_async, 'conn', fake_conn), \
+                mock.patch.object(schedule_async, 'GLOBAL_PUT_SHARD_SIZE', 1), \
+                mock.patch.object(schedule_async, 'Queue') as queue, \
+                mock.patch.object(schedule_async, '_save_global_put_comparison') as save, \
+                mock.patch.object(schedule_async, '_refresh_candidates', side_effect=[None, ValueError, ValueError]), \
+                mock.patch.object(schedule_async, 'get_current_job') as get_current_job:
+            schedule_async._enqueue_global_put_comparison_shards()
+            shards = [enqueue_call.args for enqueue_call in queue.return_value.enqueue.call_args_list]
+            finish = queue.return_value.enqueue_in.call_args.args
+            self.assertEqual(len(shards), 2)
+            self.assertEqual(finish[1], schedule_async._finish_global_put_comparison)
+
+            _, scan_id, ticker_ids = shards[0]
+            schedule_async._run_global_put_comparison_shard(scan_id, ticker_ids)
+            _, scan_id, ticker_ids = shards[1]
+            # the first failure gets retried, so the scan keeps waiting
+            get_current_job.return_value.retries_left = 1
+            with self.assertRaises(ValueError):
+                schedule_async._run_global_put_comparison_shard(scan_id, ticker_ids)
+            save.assert_not_called()
+            get_current_job.return_value.retries_left = 0
+            with self.assertRaises(ValueError):
+                schedule_async._run_global_put_comparison_shard(scan_id, ticker_ids)
+            save.assert_called_once_with()
+            # the timeout finds the scan already done
+            schedule_async._finish_global_put_comparison(*finish[2:])
+            save.assert_called_once_with()
+
+    def test_stuck_scan_finishes_after_the_timeout(self):
+        from catalog import schedule_async
+        StockTicker.objects.create(name='TSLA')
+        fake_conn = FakeRedis()
+        with mock.patch.object(schedule_async, 'conn', fake_conn), \
+                mock.patch.object(schedule_async, 'Queue') as queue, \
+                mock.patch.object(schedule_async, '_save_global_put_comparison') as save, \
+                mock.patch.object(schedule_async, '_refresh_candidates'):
+            schedule_async._enqueue_global_put_comparison_shards()
+            _, scan_id, ticker_ids = queue.return_value.enqueue.call_args.args
+            schedule_async._finish_global_put_comparison(scan_id)
+            save.assert_called_once_with()
+            # the shard finishing late doesn't save it again, or leave a count behind
+            schedule_async._run_global_put_comparison_shard(scan_id, ticker_ids)
+            save.assert_called_once_with()
+            self.assertEqual(fake_conn.values, {})
+
+
+class SingleFlightTest(TestCase):
+    def _run_concurrently(self, functions):
+        results = [None] * len(functions)
+
+        def run(index):
+            try:
+                results[index] = functions[index]()
+            except Exception as exception:
+                results[index] = exception
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(len(functions))]
+        for thread in threads:
+            thread.start()
+            # so the first thread is the one holding the lock
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_callers_fetch_once(self):
+        cache_key = 'single_flight_test_once'
+        cache.delete(cache_key)
+        fetches = []
+
+        def fetch():
+            fetches.append(cache_key)
+            time.sleep(0.1)
+            cache.set(cache_key, 'value')
+            return 'value'
+        results = self._run_concurrently([lambda: single_flight_module.single_flight(cache_key, fetch)] * 5)
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(fetches), 1)
+
+    def test_failed_fetch_lets_the_waiters_fetch(self):
+        cache_key = 'single_flight_test_failed'
+        cache.delete(cache_key)
+
+        def failing_fetch():
+            time.sleep(0.1)
+            raise ValueError
+
+        def fetch():
+            cache.set(cache_key, 'value')
+            return 'value'
+        results = self._run_concurrently([
+            lambda: single_flight_module.single_flight(cache_key, failing_fetch),
+            lambda: single_flight_module.single_flight(cache_key, fetch),
+        ])
+        self.assertIsInstance(results[0], ValueError)
+        self.assertEqual(results[1], 'value')
+
+    def test_gives_up_on_another_process_after_the_timeout(self):
+        cache_key = 'single_flight_test_timeout'
+        cache.delete(cache_key)
+        # another process took the lock and died without releasing it
+        cache.set(single_flight_module.SINGLE_FLIGHT_LOCK_PREFIX + cache_key, True)
+        with mock.patch.object(single_flight_module, 'SINGLE_FLIGHT_WAIT_SECONDS', 0.3):
+            start = time.monotonic()
+            result = single_flight_module.single_flight(cache_key, lambda: 'value')
+        self.assertEqual(result, 'value')
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+        cache.delete(single_flight_module.SINGLE_FLIGHT_LOCK_PREFIX + cache_key)
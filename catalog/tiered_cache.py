@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+from django.core.cache import cache as shared_cache
+
+from .metrics import metrics
+
+# Market data gets read many times per request (a ticker list row reads the closes 3 times),
+# and each of those would be a memcached round trip. TieredCache keeps a small LRU of recently
+# used entries in this process in front of the shared django cache. Entries only live locally
+# for LOCAL_CACHE_TIMEOUT, so processes can't drift far from memcached.
+
+LOCAL_CACHE_MAX_ENTRIES = 2000
+LOCAL_CACHE_TIMEOUT = 30
+# Cache keys start with one of these, followed by the ticker and such. Hit ratios are reported per family
+CACHE_KEY_FAMILIES = (
+    '_get_option_chain_encoded',
+    '_get_option_days',
+    'get_recent_closes_',
+    'get_earnings_',
+    'global_put_comparison',
+)
+
+
+def get_cache_key_family(key):
+    for family in CACHE_KEY_FAMILIES:
+        if key.startswith(family):
+            return family.strip('_')
+    return 'other'
+
+
+class LocalLRUCache:
+    """Size bounded in-process cache, where every entry also expires after its own timeout"""
+
+    def __init__(self, max_entries=LOCAL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TieredCache:
+    """Subset of the django cache api, checking the local LRU before the shared cache"""
+
+    def __init__(self, shared, local):
+        self.shared = shared
+        self.local = local
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        # the counters are shared by the request threads
+        self._lock = Lock()
+
+    def _count(self, local_hits=0, shared_hits=0, misses=0):
+        with self._lock:
+            self.local_hits += local_hits
+            self.shared_hits += shared_hits
+            self.misses += misses
+
+    def _local_timeout(self, timeout):
+        if timeout is None:
+            return LOCAL_CACHE_TIMEOUT
+        return min(timeout, LOCAL_CACHE_TIMEOUT)
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is not None:
+            self._count(local_hits=1)
+            self._record_lookup(key, 'local_hit')
+            return value
+        value = self.shared.get(key)
+        if value is None:
+            self._count(misses=1)
+            self._record_lookup(key, 'miss')
+            return default
+        self._count(shared_hits=1)
+        self._record_lookup(key, 'shared_hit')
+        self.local.set(key, value, LOCAL_CACHE_TIMEOUT)
+        return value
+
+    def get_many(self, keys):
+        result = {}
+        missing_keys = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                missing_keys.append(key)
+            else:
+                result[key] = value
+        self._count(local_hits=len(result))
+        if missing_keys:
+            shared_result = self.shared.get_many(missing_keys)
+            self._count(shared_hits=len(shared_result), misses=len(missing_keys) - len(shared_result))
+            for key, value in shared_result.items():
+                self.local.set(key, value, LOCAL_CACHE_TIMEOUT)
+            result.update(shared_result)
+        missing_key_set = set(missing_keys)
+        for key in keys:
+            if key in missing_key_set:
+                self._record_lookup(key, 'shared_hit' if key in result else 'miss')
+            else:
+                self._record_lookup(key, 'local_hit')
+        return result
+
+    def _record_lookup(self, key, result):
+        metrics.increment('cache_lookups_total', family=get_cache_key_family(key), result=result)
+
+    def set(self, key, value, timeout=None):
+        self.shared.set(key, value, timeout)
+        self.local.set(key, value, self._local_timeout(timeout))
+
+    def set_many(self, data, timeout=None):
+        self.shared.set_many(data, timeout)
+        for key, value in data.items():
+            self.local.set(key, value, self._local_timeout(timeout))
+
+    def delete(self, key):
+        self.shared.delete(key)
+        self.local.delete(key)
+
+    def stats(self):
+        with self._lock:
+            local_hits, shared_hits, misses = self.local_hits, self.shared_hits, self.misses
+        lookups = local_hits + shared_hits + misses
+        return {
+            'local_hits': local_hits,
+            'shared_hits': shared_hits,
+            'misses': misses,
+            'local_hit_ratio': local_hits / lookups if lookups else 0,
+            'local_entries': len(self.local),
+        }
+
+
+cache = TieredCache(shared_cache, LocalLRUCache())
@@ -6,8 +6,12 @@ urlpatterns = [
     path('signup/', views.signup, name='signup'),
     path('signup_complete/', views.signup_complete, name='signup-complete'),
     path('global_put_comparison/', views.global_put_comparison, name='global-put-comparison'),
+    path('global_put_comparison/data/', views.global_put_comparison_data, name='global-put-comparison-data'),
+    path('metrics', views.prometheus_metrics, name='metrics'),
+    path('prices/stream', views.price_stream, name='price-stream'),
     path('tickers/', views.StockTickerListView.as_view(), name='tickers'),
-    path('tickers/<int:pk>', views.StockTickerDetailView.as_view(), name='ticker-detail'),
+    path('tickers/<int:pk>', views.ticker_detail, name='ticker-detail'),
+    path('tickers/<int:pk>/put_stats/', views.ticker_put_stats_data, name='ticker-put-stats'),
     path('tickers/create/', views.StockTickerCreate.as_view(), name='ticker-create'),
     path('tickers/<int:pk>/update/', views.StockTickerUpdate.as_view(), name='ticker-update'),
     path('tickers/<int:pk>/delete/', views.StockTickerDelete.as_view(), name='ticker-delete'),
@@ -16,9 +20,11 @@ urlpatterns = [
     path('all_active_wheels/', views.all_active_wheels, name='all-active-wheels'),
     path('all_completed_wheels/', views.all_completed_wheels, name='all-completed-wheels'),
     path('todays_active_wheels/', views.todays_active_wheels, name='todays-active-wheels'),
-    path('wheels/<int:pk>', views.OptionWheelDetailView.as_view(), name='wheel-detail'),
+    path('wheels/data/', views.wheels_data, name='wheels-data'),
+    path('wheels/<int:pk>', views.wheel_detail, name='wheel-detail'),
     path('wheels/<int:wheel_id>/purchase/<int:pk>', views.OptionPurchaseDetailView.as_view(), name='purchase-detail-view'),
-    path('wheels/<int:wheel_id>/purchase/create/', views.OptionPurchaseCreate.as_view(), name='purchase-create'),
+    path('wheels/<int:wheel_id>/purchase/create/', views.purchase_create, name='purchase-create'),
+    path('wheels/<int:wheel_id>/call_stats/', views.wheel_call_stats_data, name='wheel-call-stats'),
     path('wheels/<int:wheel_id>/purchase/<int:pk>/update/', views.OptionPurchaseUpdate.as_view(), name='purchase-update'),
     path('wheels/<int:wheel_id>/purchase/<int:pk>/delete/', views.OptionPurchaseDelete.as_view(), name='purchase-delete'),
     path('wheels/<int:pk>/complete/', views.complete_wheel, name='wheel-complete'),
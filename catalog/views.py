@@ -1,33 +1,55 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
 from django.shortcuts import render, reverse, redirect
+from django.template.defaultfilters import floatformat
 from django.urls import reverse_lazy
+from django.utils.formats import date_format
+from django.utils.html import escape, format_html
 from django.views import generic
 from django.contrib.auth.models import User
-from django.db.models import Count, Q, Sum, F, fields
+from django.db.models import Count, Q, Sum, F, OuterRef, Subquery, fields
 from django.db.models.functions import Coalesce, Round, Cast, Power
 
 from catalog.forms import OptionPurchaseForm, StockTickerForm, SignupForm, OptionWheelForm, AccountForm
-from catalog.models import Account, OptionPurchase, StockTicker, OptionWheel
+from catalog.models import Account, CallCandidate, OptionPurchase, StockTicker, OptionWheel
 
 from datetime import timedelta, datetime
-from collections import defaultdict 
 
 from .option_price_computation import (
     get_current_price,
-    get_put_stats_for_ticker,
-    get_call_stats_for_option_wheel,
+    prefetch_recent_closes,
     get_earnings,
     compute_annualized_rate_of_return,
     BUSINESS_DAYS_IN_YEAR
 )
-from .business_day_count import busday_count_inclusive
-from .schedule_async import schedule_global_put_comparison_async, GLOBAL_PUT_CACHE_KEY
+from .async_market_data import prefetch_market_data
+from .business_day_count import BUSINESS_DAY_CALENDAR, busday_count_inclusive, is_business_day
+from .datatables import DataTablesRequest, datatables_response, get_queryset_page
+from .metrics import metrics
+from .price_stream import (
+    PRICE_STREAM_RECONNECT_MILLISECONDS,
+    get_price_stream_snapshot,
+    load_price_stream_subscription,
+)
+from .screener import (
+    filter_candidates,
+    get_call_candidates,
+    get_last_scanned,
+    get_put_candidates,
+    get_stale_stockticker_names,
+    refresh_stale_candidates,
+)
+from .templatetags.filter_tags import call_or_put, percentage
+from .schedule_async import (
+    schedule_global_put_comparison_async,
+    GLOBAL_PUT_CACHE_KEY,
+)
 
 import numpy
-import pandas
 import json
+from urllib.parse import urlencode
 
 from django.views.decorators.cache import cache_page
 from django.core.cache import cache
@@ -46,10 +68,22 @@ def _get_last_trading_day():
     today = _get_today()
     if now.hour < settings.MARKET_OPEN_HOUR:
         today -= timedelta(days=1)
-    while today.weekday() > 4:
+    while not is_business_day(today):
         today -= timedelta(days=1)
     return today
 
+def _get_wheels_queryset():
+    # Everything the wheel tables touch, so a page of wheels costs the same number of queries
+    # no matter how many wheels are on it
+    return OptionWheel.objects \
+        .select_related('account') \
+        .select_related('user') \
+        .select_related('stock_ticker') \
+        .prefetch_related('option_purchases')
+
+def _prefetch_prices(wheels):
+    prefetch_recent_closes(wheel.stock_ticker.name for wheel in wheels)
+
 def _inject_earnings(context, stockticker_name):
     earnings = get_earnings(stockticker_name)
     if earnings:
@@ -90,24 +124,148 @@ def signup(request):
 def signup_complete(request):
     return render(request, 'signup_complete.html')
 
+def prometheus_metrics(request):
+    token = settings.METRICS_TOKEN
+    has_token = token and request.headers.get('Authorization') == 'Bearer ' + token
+    if not has_token and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4')
+
 def global_put_comparison(request):
-    context = {}
-    cached_result = cache.get(GLOBAL_PUT_CACHE_KEY)
-    if cached_result is not None:
-        context['put_stats'] = cached_result
+    # the put table is filled in by global_put_comparison_data
+    context = {'put_stats_data_url': reverse('global-put-comparison-data')}
+    if cache.get(GLOBAL_PUT_CACHE_KEY) is not None:
         return render(request, 'global_put_comparison.html', context=context)
     try:
         schedule_global_put_comparison_async()
     except:
         context['permanently_unavailable'] = True
+    # Serve the last scan while the refresh runs, rather than making everyone wait
+    snapshot_created = get_last_scanned()
+    if snapshot_created is not None:
+        context['snapshot_created'] = snapshot_created
+        return render(request, 'global_put_comparison.html', context=context)
     context['unavailable'] = True
     return render(request, 'global_put_comparison.html', context=context)
 
 
+# Columns the option tables can be ordered by, each one is indexed on the candidate tables
+OPTION_TABLE_ORDER_FIELDS = {
+    'ticker': 'stock_ticker__name',
+    'days_to_expiry': 'days_to_expiry',
+    'odds': 'decimal_odds_out_of_the_money_implied',
+    'annualized_return': 'annualized_rate_of_return_decimal',
+}
+
+def _get_float_param(request, name):
+    try:
+        return float(request.GET.get(name, ''))
+    except ValueError:
+        return None
+
+def _filter_option_candidates(request, candidates):
+    # the minimum odds, maximum days and exclude earnings boxes on the option tables
+    return filter_candidates(
+        candidates,
+        min_odds=_get_float_param(request, 'min_odds'),
+        max_days_to_expiry=_get_float_param(request, 'max_days'),
+        exclude_earnings=request.GET.get('exclude_earnings') == '1',
+    )
+
+def _option_stats_row(stat):
+    # Cells for _option_put_table.html and _option_call_table.html, keyed by the data-name of each column
+    days_to_expiry = format_html('{} ({})', stat['days_to_expiry'], stat['expiration_date'])
+    if stat['includes_earnings']:
+        days_to_expiry = format_html('{} <span class="badge badge-pill badge-danger">Earnings</span>', days_to_expiry)
+    row = {
+        'ticker': format_html('<a href="{}">{}</a>', stat['ticker'].get_absolute_url(), stat['ticker']),
+        'strike': str(stat['strike']),
+        'price': str(stat['price']),
+        'days_to_expiry': days_to_expiry,
+        'odds': percentage(stat['decimal_odds_out_of_the_money_implied']),
+        'annualized_return': f"{floatformat(stat['annualized_rate_of_return_decimal'], 2)}x",
+    }
+    if 'max_profit_decimal' in stat:
+        row['current_price'] = floatformat(stat['current_price'], 2)
+        row['max_profit'] = percentage(stat['max_profit_decimal'])
+    else:
+        row['call_max_profit'] = percentage(stat['call_max_profit_decimal'])
+        row['wheel_total_max_return'] = percentage(stat['wheel_total_max_profit_decimal'])
+    return row
+
+def _option_stats_response(request, candidates):
+    datatables_request = DataTablesRequest(request.GET)
+    candidates, records_total, records_filtered, cursor = get_queryset_page(
+        candidates,
+        datatables_request,
+        OPTION_TABLE_ORDER_FIELDS,
+        default_column='annualized_return',
+        default_descending=True,
+        search_filter=lambda search: Q(stock_ticker__name__icontains=search),
+        filter_queryset=lambda candidates: _filter_option_candidates(request, candidates),
+    )
+    data = []
+    for candidate in candidates:
+        stat = candidate.as_stat()
+        if hasattr(candidate, 'wheel_total_max_profit_decimal'):
+            stat['wheel_total_max_profit_decimal'] = candidate.wheel_total_max_profit_decimal
+        data.append(_option_stats_row(stat))
+    return datatables_response(datatables_request, data, records_total, records_filtered, cursor)
+
+def global_put_comparison_data(request):
+    """One page of the global put comparison, from the last scan of every ticker"""
+    return _option_stats_response(request, get_put_candidates())
+
+def _get_ticker_stockticker_names(request, pk):
+    return StockTicker.objects.filter(pk=pk).values_list('name', flat=True)
+
+def _get_wheel_stockticker_names(request, pk):
+    return OptionWheel.objects.filter(pk=pk).values_list('stock_ticker__name', flat=True)
+
+def _get_my_wheel_stockticker_names(request, wheel_id):
+    # only for pages that need a login, so nobody else makes us fetch anything
+    if not request.user.is_authenticated:
+        return []
+    return OptionWheel.objects.filter(pk=wheel_id).values_list('stock_ticker__name', flat=True)
+
+# The option tables only need market data when the ticker's candidates have to be rescanned
+def _get_stale_ticker_stockticker_names(request, pk):
+    return get_stale_stockticker_names(_get_ticker_stockticker_names(request, pk))
+
+def _get_stale_my_wheel_stockticker_names(request, wheel_id):
+    return get_stale_stockticker_names(_get_my_wheel_stockticker_names(request, wheel_id))
+
+@prefetch_market_data(_get_stale_ticker_stockticker_names, earnings=True, maximum_option_days=10)
+def ticker_put_stats_data(request, pk):
+    """One page of the put table on the ticker detail page"""
+    ticker = StockTicker.objects.get(pk=pk)
+    refresh_stale_candidates(ticker)
+    return _option_stats_response(request, get_put_candidates(ticker))
+
+
+def price_stream(request):
+    """
+    The price stream for servers running the WSGI application: the current values are sent once,
+    and the browser reconnects for new ones. Under ASGI, asgi.py streams this url instead.
+    """
+    events = get_price_stream_snapshot(*load_price_stream_subscription(request.GET))
+    response = HttpResponse(
+        f'retry: {PRICE_STREAM_RECONNECT_MILLISECONDS}\n\n' + ''.join(events),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
 # StockTicker views
 class StockTickerListView(PageTitleMixin, generic.ListView):
     page_title = "Tickers"
     model = StockTicker
+
+    def get_context_data(self, **kwargs):
+        context = super(StockTickerListView, self).get_context_data(**kwargs)
+        prefetch_recent_closes(ticker.name for ticker in context['object_list'])
+        return context
  
 class StockTickerDetailView(PageTitleMixin, generic.DetailView):
     model = StockTicker
@@ -116,9 +274,9 @@ class StockTickerDetailView(PageTitleMixin, generic.DetailView):
         context = super(StockTickerDetailView, self).get_context_data(**kwargs)
         num_wheels = OptionWheel.objects.filter(stock_ticker=self.object.id).count()
         _inject_earnings(context, self.object.name)
-        result = get_put_stats_for_ticker(self.object)
-        context['put_stats'] = sorted(result['put_stats'], key=lambda put: put['annualized_rate_of_return_decimal'], reverse=True)
-        context['current_price'] = result['current_price']
+        # the put table is filled in by ticker_put_stats_data
+        context['put_stats_data_url'] = reverse('ticker-put-stats', kwargs={'pk': self.object.pk})
+        context['current_price'] = get_current_price(self.object.name)
         context['num_wheels'] = num_wheels
         return context
 
@@ -126,6 +284,9 @@ class StockTickerDetailView(PageTitleMixin, generic.DetailView):
         return self.object.name
 
 
+ticker_detail = prefetch_market_data(_get_ticker_stockticker_names, earnings=True)(StockTickerDetailView.as_view())
+
+
 class StockTickerCreate(PageTitleMixin, generic.edit.CreateView):
     page_title = "Create Ticker"
     model = StockTicker
@@ -190,31 +351,26 @@ class AccountDetailView(PageTitleMixin, LoginRequiredMixin, generic.DetailView):
         return f"{self.object.name} Account"
 
 # OptionWheel views
+# The wheel tables are filled in by wheels_data a page at a time, so these only check that there is something to show
+def _get_wheels_data_url(request, **params):
+    # next is where the complete buttons come back to
+    return reverse('wheels-data') + '?' + urlencode(dict(params, next=request.path))
+
 @login_required
 def my_active_wheels(request):
     user = request.user
-        # .select_related('account') \
-        # .select_related('user') \
-        # .select_related('stock_ticker') \
-        # .prefetch_related('option_purchases') \
-    wheels = OptionWheel.objects \
-        .filter(user=user, is_active=True)
-    for wheel in wheels:
-        print("adding purchase data", wheel)
-        wheel.add_purchase_data()
     context = {'wheel_user': user}
-    context["wheels"] = wheels
+    context["has_wheels"] = OptionWheel.objects.filter(user=user, is_active=True).exists()
+    context["wheels_data_url"] = _get_wheels_data_url(request, user=user.pk, active=1)
     context["can_edit"] = True
     context["page_title"] = "My Active Wheels"
     return render(request, 'active_wheels.html', context=context)
 
 def active_wheels(request, pk):
     user = User.objects.get(pk=pk)
-    wheels = OptionWheel.objects.filter(user=user, is_active=True)
-    for wheel in wheels:
-        wheel.add_purchase_data()
     context = {'wheel_user': user}
-    context["wheels"] = wheels
+    context["has_wheels"] = OptionWheel.objects.filter(user=user, is_active=True).exists()
+    context["wheels_data_url"] = _get_wheels_data_url(request, user=user.pk, active=1)
     context["can_edit"] = request.user == user
     context["page_title"] = f"{user}'s Active Wheels"
     return render(request, 'active_wheels.html', context=context)
@@ -222,31 +378,25 @@ def active_wheels(request, pk):
 @login_required
 def my_completed_wheels(request):
     user = request.user
-    wheels = OptionWheel.objects.filter(user=user, is_active=False)
-    for wheel in wheels:
-        wheel.add_purchase_data(fetch_price=False)
     context = {'wheel_user': user}
-    context["wheels"] = wheels
+    context["has_wheels"] = OptionWheel.objects.filter(user=user, is_active=False).exists()
+    context["wheels_data_url"] = _get_wheels_data_url(request, user=user.pk, active=0)
     context["page_title"] = "My Completed Wheels"
     return render(request, 'completed_wheels.html', context=context)
 
 def completed_wheels(request, pk):
     user = User.objects.get(pk=pk)
-    wheels = OptionWheel.objects.filter(user=user, is_active=False)
-    for wheel in wheels:
-        wheel.add_purchase_data(fetch_price=False)
     context = {'wheel_user': user}
-    context["wheels"] = wheels
+    context["has_wheels"] = OptionWheel.objects.filter(user=user, is_active=False).exists()
+    context["wheels_data_url"] = _get_wheels_data_url(request, user=user.pk, active=0)
     context["page_title"] = f"{user}'s Completed Wheels"
     return render(request, 'completed_wheels.html', context=context)
 
 @cache_page(ALL_VIEWS_PAGE_CACHE_IN_SECONDS)
 def all_active_wheels(request):
     context = {}
-    wheels = OptionWheel.objects.filter(is_active=True)
-    for wheel in wheels:
-        wheel.add_purchase_data()
-    context["wheels"] = wheels
+    context["has_wheels"] = OptionWheel.objects.filter(is_active=True).exists()
+    context["wheels_data_url"] = _get_wheels_data_url(request, active=1)
     context["page_title"] = "All Active Wheels"
     return render(request, 'all_active_wheels.html', context=context)
 
@@ -254,10 +404,8 @@ def all_active_wheels(request):
 @cache_page(ALL_VIEWS_PAGE_CACHE_IN_SECONDS)
 def all_completed_wheels(request):
     context = {}
-    wheels = OptionWheel.objects.select_related('account').select_related('user').select_related('stock_ticker').filter(is_active=False)
-    for wheel in wheels:
-        wheel.add_purchase_data(fetch_price=False)
-    context["wheels"] = wheels
+    context["has_wheels"] = OptionWheel.objects.filter(is_active=False).exists()
+    context["wheels_data_url"] = _get_wheels_data_url(request, active=0)
     context["page_title"] = "All Completed Wheels"
     return render(request, 'all_completed_wheels.html', context=context)
 
@@ -265,19 +413,112 @@ def all_completed_wheels(request):
 def todays_active_wheels(request):
     date = _get_last_trading_day()
     context = {}
-    wheels = OptionWheel.objects.filter(is_active=True)
-    todays_wheels = []
-    for wheel in wheels:
-        last_purchase = wheel.get_last_option_purchase()
-        if last_purchase:
-            if date == last_purchase.purchase_date.date():
-                wheel.add_purchase_data()
-                todays_wheels.append(wheel)
-    context["wheels"] = todays_wheels
+    context["has_wheels"] = _filter_last_purchased_on(OptionWheel.objects.filter(is_active=True), date).exists()
+    context["wheels_data_url"] = _get_wheels_data_url(request, active=1, today=1)
     context["date"] = date
     context["page_title"] = "Today's Active Wheels"
     return render(request, 'todays_active_wheels.html', context=context)
 
+def _filter_last_purchased_on(wheels, date):
+    # OptionPurchase.Meta orders the newest purchase first
+    last_purchase_dates = OptionPurchase.objects.filter(option_wheel=OuterRef('pk')).values('purchase_date')[:1]
+    return wheels.annotate(last_purchase_date=Subquery(last_purchase_dates)).filter(last_purchase_date__date=date)
+
+# Columns the wheel tables can be ordered by, all indexed so pages can be found with a keyset
+WHEEL_TABLE_ORDER_FIELDS = {
+    'expiration_date': 'expiration_date',
+    'open_date': 'open_date',
+}
+ON_TRACK_BADGES = {'Exit': 'success', 'Hold': 'warning', 'Under': 'danger'}
+
+def _search_wheels(search):
+    return Q(stock_ticker__name__icontains=search) \
+        | Q(account__name__icontains=search) \
+        | Q(user__username__icontains=search)
+
+def _button(variant, url, label):
+    return format_html('<a type="button" class="btn btn-{} btn-sm" href="{}">{}</a>', variant, url, label)
+
+def _wheel_table_row(wheel, can_edit, next_url):
+    # Cells for _base_wheel_table.html, keyed by the data-name of each column
+    last_purchase = getattr(wheel, 'last_purchase', None)
+    expiration_date = date_format(wheel.expiration_date, 'M j') if wheel.expiration_date else ''
+    if getattr(wheel, 'expired', False):
+        expiration_date = format_html('{} <span class="badge badge-pill badge-warning">Expired</span>', expiration_date)
+    ticker = format_html('<a href="{}">{}</a>', wheel.stock_ticker.get_absolute_url(), wheel.stock_ticker)
+    if wheel.quantity > 1:
+        ticker = format_html('{} <strong>({})</strong>', ticker, wheel.quantity)
+    on_track = getattr(wheel, 'on_track', None)
+    row = {
+        'expiration_date': expiration_date,
+        'user': escape(wheel.user),
+        'account': escape(wheel.account or ''),
+        'last_transaction': escape(
+            f"${last_purchase.strike} {call_or_put(last_purchase.call_or_put)}" if last_purchase else ''
+        ),
+        'ticker': ticker,
+        'current_price': '',
+        # live_prices.js keeps these two up to date
+        'on_track': format_html(
+            '<span data-wheel="{}"><span class="badge badge-pill badge-{}">{}</span></span>',
+            wheel.pk, ON_TRACK_BADGES[on_track], on_track,
+        ) if on_track else format_html('<span data-wheel="{}"></span>', wheel.pk),
+        'cost_basis': f"${wheel.cost_basis if wheel.cost_basis is not None else ''}",
+        'open_date': date_format(wheel.open_date, 'M j') if wheel.open_date else '',
+        'open_strike': f"${wheel.open_strike if wheel.open_strike is not None else ''}",
+        'profit': f"${getattr(wheel, 'profit_if_exits_here', '')}",
+        'return_rate': escape(percentage(getattr(wheel, 'decimal_rate_of_return', ''))),
+        'annual_rate': '',
+        'details': _button('secondary', reverse('wheel-detail', kwargs={'pk': wheel.pk}), 'Details'),
+    }
+    if hasattr(wheel, 'current_price'):
+        row['current_price'] = format_html(
+            '<span data-ticker="{}" data-price-field="price">${}</span>',
+            wheel.stock_ticker.name, floatformat(wheel.current_price, 2),
+        )
+    if hasattr(wheel, 'annualized_rate_of_return_if_exits_here'):
+        row['annual_rate'] = f"{floatformat(wheel.annualized_rate_of_return_if_exits_here, 2)}x"
+    if can_edit:
+        row['add_call'] = _button('primary', reverse('purchase-create', kwargs={'wheel_id': wheel.pk}), 'Call')
+        row['complete'] = ''
+        if getattr(wheel, 'expired', False) and on_track == 'Exit':
+            complete_url = reverse('wheel-complete', kwargs={'pk': wheel.pk}) + '?' + urlencode({'next': next_url})
+            row['complete'] = _button('success', complete_url, 'Complete')
+        row['edit'] = _button('info', reverse('wheel-update', kwargs={'pk': wheel.pk}), 'Edit')
+    return row
+
+def wheels_data(request):
+    """One page of a wheel table, see _base_wheel_table.html"""
+    datatables_request = DataTablesRequest(request.GET)
+    active = request.GET.get('active') == '1'
+    wheels = _get_wheels_queryset().filter(is_active=active)
+    can_edit = False
+    if request.GET.get('user'):
+        try:
+            user_pk = int(request.GET['user'])
+        except ValueError:
+            return HttpResponseBadRequest()
+        wheels = wheels.filter(user=user_pk)
+        can_edit = request.user.pk == user_pk
+    if request.GET.get('today'):
+        wheels = _filter_last_purchased_on(wheels, _get_last_trading_day())
+    wheels, records_total, records_filtered, cursor = get_queryset_page(
+        wheels,
+        datatables_request,
+        WHEEL_TABLE_ORDER_FIELDS,
+        default_column='expiration_date',
+        default_descending=not active,
+        search_filter=_search_wheels,
+    )
+    # only the wheels on this page need prices and purchase data
+    if active:
+        _prefetch_prices(wheels)
+    for wheel in wheels:
+        wheel.add_purchase_data(fetch_price=active)
+    next_url = request.GET.get('next', '')
+    data = [_wheel_table_row(wheel, can_edit, next_url) for wheel in wheels]
+    return datatables_response(datatables_request, data, records_total, records_filtered, cursor)
+
 
 class OptionWheelDetailView(PageTitleMixin, generic.DetailView):
     model = OptionWheel
@@ -285,7 +526,7 @@ class OptionWheelDetailView(PageTitleMixin, generic.DetailView):
 
     def get_context_data(self, **kwargs):
         context = super(OptionWheelDetailView, self).get_context_data(**kwargs)
-        option_wheel = OptionWheel.objects.get(pk=self.kwargs.get('pk'))
+        option_wheel = _get_wheels_queryset().get(pk=self.kwargs.get('pk'))
 
         option_wheel.add_purchase_data()
         context["wheel_data"] = option_wheel
@@ -296,6 +537,9 @@ class OptionWheelDetailView(PageTitleMixin, generic.DetailView):
         return self.object
 
 
+wheel_detail = prefetch_market_data(_get_wheel_stockticker_names)(OptionWheelDetailView.as_view())
+
+
 @login_required
 def complete_wheel(request, pk):
     option_wheel = OptionWheel.objects.get(pk=pk)
@@ -426,21 +670,33 @@ class OptionPurchaseCreate(PageTitleMixin, LoginRequiredMixin, generic.edit.Crea
         context['option_wheel'] = option_wheel
         context['cost_basis'] = option_wheel.get_cost_basis()
         _inject_earnings(context, option_wheel.stock_ticker.name)
-        first_purchase = option_wheel.get_first_option_purchase()
-        if first_purchase is not None:
-            last_purchase = option_wheel.get_last_option_purchase()
-            days_active_so_far = busday_count_inclusive(
-                first_purchase.purchase_date.date(),
-                last_purchase.expiration_date,
-            )
-            call_stats = get_call_stats_for_option_wheel(option_wheel.stock_ticker, days_active_so_far, option_wheel.get_revenue(), collateral=first_purchase.strike)
-            context['call_stats'] = call_stats['call_stats']
+        # the call table is filled in by wheel_call_stats_data
+        if option_wheel.get_first_option_purchase() is not None:
+            context['call_stats_data_url'] = reverse('wheel-call-stats', kwargs={'wheel_id': option_wheel.pk})
         return context
 
     def get_success_url(self):
         wheel_id = self.kwargs.get('wheel_id')
         return reverse('wheel-detail', args=[str(wheel_id)])
 
+purchase_create = prefetch_market_data(_get_my_wheel_stockticker_names, earnings=True)(OptionPurchaseCreate.as_view())
+
+@prefetch_market_data(_get_stale_my_wheel_stockticker_names, earnings=True, maximum_option_days=10)
+@login_required
+def wheel_call_stats_data(request, wheel_id):
+    """One page of the call table on the option create page"""
+    option_wheel = OptionWheel.objects.select_related('stock_ticker').get(pk=wheel_id)
+    if option_wheel.open_strike is None:
+        return _option_stats_response(request, CallCandidate.objects.none())
+    refresh_stale_candidates(option_wheel.stock_ticker)
+    call_candidates = get_call_candidates(
+        option_wheel.stock_ticker,
+        option_wheel.revenue,
+        option_wheel.open_strike,
+        avoid_negative_returns=request.GET.get('avoid_negative_returns') == '1',
+    )
+    return _option_stats_response(request, call_candidates)
+
 class OptionPurchaseUpdate(PageTitleMixin, LoginRequiredMixin, generic.edit.UpdateView):
     model = OptionPurchase
     form_class = OptionPurchaseForm
@@ -479,25 +735,59 @@ def total_profit(request, pk):
     return render(request, 'total_profit.html', context=context)
 
 
+def _get_collateral_on_the_line_per_day(wheels):
+    # Rather than adding every wheel's collateral to every business day it was open, mark where
+    # each wheel starts and stops on a business day index and take a running sum.
+    rows = [
+        (open_date, expiration_date, float(collateral * quantity))
+        for open_date, expiration_date, collateral, quantity in wheels.values_list('open_date', 'expiration_date', 'collatoral', 'quantity')
+        if open_date is not None and expiration_date is not None and collateral is not None and open_date <= expiration_date
+    ]
+    if not rows:
+        return []
+    open_dates = numpy.array([row[0] for row in rows], dtype='datetime64[D]')
+    expiration_dates = numpy.array([row[1] for row in rows], dtype='datetime64[D]')
+    collaterals = numpy.array([row[2] for row in rows])
+    days = numpy.arange(open_dates.min(), expiration_dates.max() + numpy.timedelta64(1, 'D'))
+    business_days = days[numpy.is_busday(days, busdaycal=BUSINESS_DAY_CALENDAR)]
+    starts = numpy.searchsorted(business_days, open_dates)
+    ends = numpy.searchsorted(business_days, expiration_dates, side='right')
+
+    collateral_changes = numpy.zeros(len(business_days) + 1)
+    numpy.add.at(collateral_changes, starts, collaterals)
+    numpy.add.at(collateral_changes, ends, -collaterals)
+    # also count open wheels, so days that only have 0 collateral wheels still show up
+    open_wheel_changes = numpy.zeros(len(business_days) + 1, dtype=int)
+    numpy.add.at(open_wheel_changes, starts, 1)
+    numpy.add.at(open_wheel_changes, ends, -1)
+
+    collateral_per_day = numpy.cumsum(collateral_changes[:-1]).round(2)
+    has_open_wheels = numpy.cumsum(open_wheel_changes[:-1]) > 0
+    return [
+        (str(day), float(collateral))
+        for day, collateral in zip(business_days[has_open_wheels], collateral_per_day[has_open_wheels])
+    ]
+
 def _setup_context_for_total_profit(wheels, context):
-    total_profit = 0
-    total_collateral = 0
-    sum_days_weighted_by_collateral = 0
-    wheel_count = 0
-    no_quantity_wheel_count = 0
-    collateral_on_the_line_per_day = defaultdict(int)
-    profit_per_day = defaultdict(int)
-    for wheel in wheels:
-        wheel_collateral = wheel.collateral * wheel.quantity
-        wheel_profit = wheel.total_profit * wheel.quantity
-        total_profit += wheel_profit
-        total_collateral += wheel_collateral
-        wheel_count += wheel.quantity
-        sum_days_weighted_by_collateral += wheel.total_days_active * wheel_collateral
-        no_quantity_wheel_count += 1
-        profit_per_day[wheel.get_expiration_date().strftime('%Y-%m-%d')] += float(wheel_profit)
-        for day in pandas.bdate_range(wheel.get_open_date(), wheel.get_expiration_date()):
-            collateral_on_the_line_per_day[day.strftime('%Y-%m-%d')] += float(wheel_collateral)
+    wheel_profit = F("total_profit") * F("quantity")
+    wheel_collateral = F("collatoral") * F("quantity")
+    totals = wheels.aggregate(
+        total_profit=Sum(wheel_profit, output_field=fields.DecimalField()),
+        total_collateral=Sum(wheel_collateral, output_field=fields.DecimalField()),
+        sum_days_weighted_by_collateral=Sum(F("total_days_active") * wheel_collateral, output_field=fields.DecimalField()),
+        wheel_count=Sum("quantity"),
+        no_quantity_wheel_count=Count("id"),
+    )
+    total_profit = totals["total_profit"] or 0
+    total_collateral = totals["total_collateral"] or 0
+    sum_days_weighted_by_collateral = totals["sum_days_weighted_by_collateral"] or 0
+    wheel_count = totals["wheel_count"] or 0
+    profit_per_day = wheels \
+        .filter(expiration_date__isnull=False) \
+        .values("expiration_date") \
+        .annotate(profit=Sum(wheel_profit, output_field=fields.DecimalField())) \
+        .order_by("expiration_date")
+    collateral_on_the_line_per_day = _get_collateral_on_the_line_per_day(wheels)
     context["total_profit"] = total_profit
     context["total_collateral"] = total_collateral
     context["total_profit_dollars"] = total_profit * 100
@@ -509,10 +799,12 @@ def _setup_context_for_total_profit(wheels, context):
     return_percentage = (float) (total_profit / total_collateral)
     context["return_percentage"] = return_percentage
     context["total_wheel_count"] = wheel_count
-    context["no_quantity_wheel_count"] = no_quantity_wheel_count
-    context["collateral_on_the_line_per_day"] = json.dumps(list(collateral_on_the_line_per_day.items()))
-    context["profit_per_day"] = json.dumps(list(profit_per_day.items()))
-    context["max_collateral"] = max(collateral_on_the_line_per_day.values() or [0])
+    context["no_quantity_wheel_count"] = totals["no_quantity_wheel_count"]
+    context["collateral_on_the_line_per_day"] = json.dumps(collateral_on_the_line_per_day)
+    context["profit_per_day"] = json.dumps([
+        (day["expiration_date"].strftime('%Y-%m-%d'), float(day["profit"])) for day in profit_per_day
+    ])
+    context["max_collateral"] = max([collateral for _, collateral in collateral_on_the_line_per_day] or [0])
     context["annualized_rate_of_return_decimal"] = compute_annualized_rate_of_return(return_percentage, 1, total_days_active_average)
     return context
 
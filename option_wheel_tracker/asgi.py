@@ -10,7 +10,22 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 import os
 
 from django.core.asgi import get_asgi_application
+from django.urls import reverse
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'option_wheel_tracker.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once django is set up, since it uses the models
+from catalog.price_stream import price_stream_application  # noqa: E402
+
+# The price stream holds its connection open and is fed by one poll shared between every
+# stream, so it's served here rather than by a view. See catalog/price_stream.py.
+PRICE_STREAM_PATH = reverse('price-stream')
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == PRICE_STREAM_PATH:
+        await price_stream_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'catalog.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -123,6 +124,15 @@ LOGIN_REDIRECT_URL = '/'
 MARKET_OPEN_HOUR = 6
 MARKET_CLOSE_HOUR = 13
 
+# 'yahoo', or 'replay' to serve data recorded with the record_market_data command, without the network.
+# See catalog/market_data_providers.py
+MARKET_DATA_PROVIDER = os.environ.get('MARKET_DATA_PROVIDER', 'yahoo')
+MARKET_DATA_REPLAY_DIRECTORY = os.environ.get('MARKET_DATA_REPLAY_DIRECTORY', os.path.join(BASE_DIR, 'market_data_recordings'))
+MARKET_DATA_REPLAY_LATENCY_SECONDS = float(os.environ.get('MARKET_DATA_REPLAY_LATENCY_SECONDS', 0))
+
+# Lets a Prometheus scraper read /metrics with an "Authorization: Bearer <token>" header, staff can always read it
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 if app_stage == 'prod':
     import django_heroku
     # Activate Django-Heroku.
@@ -12,6 +12,10 @@ import django
 django.setup()
 
 if __name__ == '__main__':
+    from catalog.schedule_async import schedule_market_data_prefetch
+    # starts the market data prefetch loop, unless another worker already did
+    schedule_market_data_prefetch()
     with Connection(conn):
         worker = Worker(map(Queue, listen))
-        worker.work()
\ No newline at end of file
+        # the scheduler runs jobs from enqueue_in, like the global put comparison refresh
+        worker.work(with_scheduler=True)
\ No newline at end of file